@@ -5,11 +5,20 @@ from flask_cors import CORS
 from dotenv import load_dotenv
 from flask_jwt_extended import JWTManager
 
+from .pooling import engine_options
+from .replicas import RoutingSession, replica_router
+
 # Загружаем переменные окружения из .env файла
 load_dotenv()
 
 # Инициализируем расширения (но пока не привязываем к приложению)
-db = SQLAlchemy()
+# Сессия сама выбирает реплику в читающих маршрутах (см. replicas.read_only)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Разрешаем запросы от нашего frontend-сервера разработки (Vite по умолчанию работает на порту 5173).
+# Курсор следующей страницы /api/events и ETag передаются в заголовках, их нужно открыть для браузера
+CORS_ORIGINS = ["http://localhost:5173"]
+CORS_EXPOSE_HEADERS = ["X-Next-Cursor", "ETag"]
 
 def create_app():
     """Фабрика для создания экземпляра приложения Flask."""
@@ -19,18 +28,86 @@ def create_app():
     app.config['SECRET_KEY'] = 'a_very_secret_key_for_sessions' # Замените на случайную строку
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Размер пула, overflow, pre-ping и recycle задаются через DB_POOL_* (см. pooling.engine_options)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+
+    # Каталог архива событий прошлых лет (Parquet, см. archive_presence.py)
+    app.config['PRESENCE_ARCHIVE_DIR'] = os.environ.get('PRESENCE_ARCHIVE_DIR',
+                                                        os.path.join(os.path.dirname(app.root_path), 'archive'))
+
+    # Реплики для чтения: DATABASE_REPLICA_URLS - адреса через запятую
+    replica_urls = [u.strip() for u in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if u.strip()]
+    app.config['SQLALCHEMY_BINDS'] = {f'replica_{i}': {'url': url, **engine_options(url)}
+                                      for i, url in enumerate(replica_urls)}
+    replica_router.configure(binds=list(app.config['SQLALCHEMY_BINDS']),
+                             sticky_seconds=float(os.environ.get('REPLICA_STICKY_SECONDS', 5)))
 
     app.config["JWT_SECRET_KEY"] = "your-super-secret-jwt-key"  # <-- CHANGE THIS and put it in .env
     jwt = JWTManager(app)
 
-    # Настройка CORS
-    # Разрешаем запросы от нашего frontend-сервера разработки (Vite по умолчанию работает на порту 5173)
-    # к любым маршрутам, начинающимся с /api/
-    CORS(app, resources={r"/api/*": {"origins": "http://localhost:5173"}})
+    # Настройка CORS для любых маршрутов, начинающихся с /api/
+    CORS(app, resources={r"/api/*": {"origins": CORS_ORIGINS}}, expose_headers=CORS_EXPOSE_HEADERS)
 
     # Инициализация расширений в контексте приложения
     db.init_app(app)
 
+    # Метрики запросов: задержка, SQL, сериализация, размер ответа (/api/admin/metrics)
+    from .metrics import metrics
+    metrics.init_app(app)
+
+    # Кэш выборок календаря: размер (число диапазонов) и время жизни записи в секундах
+    from .cache import calendar_cache
+    calendar_cache.configure(maxsize=int(os.environ.get('CALENDAR_CACHE_SIZE', 256)),
+                             ttl=int(os.environ.get('CALENDAR_CACHE_TTL', 60)))
+
+    # Составы команд, отделов и проектов для выборок календаря и доступности
+    from .cache import membership_cache
+    membership_cache.configure(maxsize=int(os.environ.get('MEMBERSHIP_CACHE_SIZE', 1024)),
+                               ttl=int(os.environ.get('MEMBERSHIP_CACHE_TTL', 300)))
+
+    # Развернутые повторяющиеся расписания (число окон дат, в каждом - все расписания)
+    from .cache import schedule_cache
+    schedule_cache.configure(maxsize=int(os.environ.get('SCHEDULE_CACHE_SIZE', 256)))
+
+    # Кэш учетных данных для логина и ограничение одновременных проверок пароля
+    from .cache import credential_cache
+    from .hashing import password_verifier
+    credential_cache.configure(ttl=int(os.environ.get('LOGIN_CACHE_TTL', 60)))
+    password_verifier.configure(max_concurrency=int(os.environ.get('LOGIN_MAX_CONCURRENCY', os.cpu_count() or 1)),
+                                queue_timeout=float(os.environ.get('LOGIN_QUEUE_TIMEOUT', 5)))
+
+    # Готовые тела .ics-подписок: число записей и максимальный размер кэшируемого тела
+    from .cache import feed_cache
+    feed_cache.configure(maxsize=int(os.environ.get('FEED_CACHE_SIZE', 512)),
+                         max_body_bytes=int(os.environ.get('FEED_CACHE_MAX_BYTES', 256 * 1024)))
+
+    # Рассылка уведомлений /api/events/stream: memory - в пределах процесса,
+    # postgres - между всеми воркерами через LISTEN/NOTIFY
+    from .pubsub import broker
+    broker.configure(backend=os.environ.get('PUBSUB_BACKEND', 'memory'),
+                     queue_size=int(os.environ.get('SSE_QUEUE_SIZE', 100)))
+    # По тем же уведомлениям процесс сбрасывает свои кэши после записей других процессов.
+    # Слушатель запускается на первом запросе: после fork потоки мастера не наследуются
+    from .presence import apply_notification
+    broker.add_handler(apply_notification)
+    app.before_request(lambda: broker.listen(db.engine))
+    # Без LISTEN/NOTIFY (memory) записи других процессов, в том числе worker.py,
+    # процесс замечает сверкой счетчиков версий не реже раза в CACHE_SYNC_SECONDS
+    from .presence import cache_sync
+    cache_sync.configure(interval=float(os.environ.get('CACHE_SYNC_SECONDS', 1)))
+
+    @app.before_request
+    def sync_process_caches():
+        if broker.backend != 'postgres':
+            cache_sync.check()
+
+    # Очередь фоновых задач (worker.py): отсрочка первого повтора, через сколько секунд
+    # задача в running считается брошенной и сколько дней хранятся завершенные задачи
+    from .jobs import job_queue
+    job_queue.configure(retry_base=float(os.environ.get('JOB_RETRY_BASE_SECONDS', 5)),
+                        stale_after=float(os.environ.get('JOB_STALE_SECONDS', 3600)),
+                        retention_days=int(os.environ.get('JOB_RETENTION_DAYS', 7)))
+
     # Регистрация маршрутов (Blueprints)
     from . import routes
     app.register_blueprint(routes.bp)
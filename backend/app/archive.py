@@ -0,0 +1,185 @@
+import os
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from flask import current_app
+
+from . import changelog, db, partitions
+from .models import Employee, EmployeePresence
+from .presence import invalidate_presence_views, notify_presence
+from .versions import bump_versions
+
+# Колонки архива в порядке PRESENCE_ROW_COLUMNS: строки читаются прямо в PresenceEncoder.
+# Имя сотрудника сохраняется на момент архивации - сотрудника потом могут удалить.
+# Время хранится так, как его видело приложение (без пояса), чтобы даты совпадали с to_dict().
+ARCHIVE_SCHEMA = pa.schema([
+    ('presence_id', pa.int64()),
+    ('employee_id', pa.int64()),
+    ('employee_name', pa.string()),
+    ('presence_type', pa.string()),
+    ('start_datetime', pa.timestamp('us')),
+    ('end_datetime', pa.timestamp('us')),
+    ('status', pa.string()),
+    ('comment', pa.string()),
+])
+ARCHIVE_BATCH_SIZE = 50000
+ARCHIVE_COMPRESSION = 'zstd'
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def archive_dir():
+    return current_app.config['PRESENCE_ARCHIVE_DIR']
+
+
+def archive_path(year):
+    return os.path.join(archive_dir(), f'presence_{year}.parquet')
+
+
+def archived_years():
+    """[{'year', 'rows', 'bytes'}] по файлам архива; число строк берется из метаданных Parquet."""
+    directory = archive_dir()
+    if not os.path.isdir(directory):
+        return []
+    years = []
+    for name in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(name)
+        if ext != '.parquet' or not stem.startswith('presence_') or not stem[9:].isdigit():
+            continue
+        path = os.path.join(directory, name)
+        years.append({'year': int(stem[9:]), 'rows': pq.ParquetFile(path).metadata.num_rows,
+                      'bytes': os.path.getsize(path)})
+    return years
+
+
+def oldest_year():
+    """Год самого раннего события в горячей таблице или None."""
+    oldest = db.session.query(db.func.min(EmployeePresence.start_datetime)).scalar()
+    return oldest.year if oldest else None
+
+
+def _year_rows(year):
+    lo, hi = partitions.year_bounds(year)
+    return db.session.query(EmployeePresence.presence_id, EmployeePresence.employee_id, Employee.full_name,
+                            EmployeePresence.presence_type, EmployeePresence.start_datetime,
+                            EmployeePresence.end_datetime, EmployeePresence.status, EmployeePresence.comment) \
+        .outerjoin(Employee, Employee.employee_id == EmployeePresence.employee_id) \
+        .filter(EmployeePresence.start_datetime >= lo, EmployeePresence.start_datetime < hi) \
+        .order_by(EmployeePresence.start_datetime, EmployeePresence.presence_id)
+
+
+def _write_parquet(rows, path):
+    """Пишет строки пачками по ARCHIVE_BATCH_SIZE, не держа год целиком в памяти. Возвращает их число."""
+    written = 0
+    with pq.ParquetWriter(path, ARCHIVE_SCHEMA, compression=ARCHIVE_COMPRESSION) as writer:
+        batch = []
+        for row in rows.yield_per(ARCHIVE_BATCH_SIZE):
+            batch.append(row)
+            if len(batch) >= ARCHIVE_BATCH_SIZE:
+                writer.write_batch(_record_batch(batch))
+                written += len(batch)
+                batch = []
+        if batch:
+            writer.write_batch(_record_batch(batch))
+            written += len(batch)
+    return written
+
+
+def _wall_clock(value):
+    return value.replace(tzinfo=None) if value is not None else None
+
+
+def _record_batch(rows):
+    columns = list(zip(*rows))
+    columns[4] = [_wall_clock(value) for value in columns[4]]
+    columns[5] = [_wall_clock(value) for value in columns[5]]
+    return pa.RecordBatch.from_arrays([pa.array(values, type=field.type)
+                                       for values, field in zip(columns, ARCHIVE_SCHEMA)], schema=ARCHIVE_SCHEMA)
+
+
+def archive_year(year, today=None):
+    """
+    Переносит события года (по start_datetime) в сжатый Parquet-файл и удаляет их из
+    employee_presence: на PostgreSQL с секциями - отключением секции года, иначе DELETE.
+    Архивируются только закрытые годы. Файл пишется под временным именем, число строк
+    сверяется с базой до удаления, так что прерванная архивация ничего не теряет.
+    Возвращает число перенесенных строк.
+
+    Для клиентов это удаление событий: в журнал пишутся DELETE-записи, корзины версий
+    от начала года до конца последнего события года увеличиваются, остальные процессы
+    получают уведомление 'archived'.
+
+    Агрегаты загрузки (daily_occupancy, daily_absences) не трогаются: история загрузки
+    остается верной, но полный occupancy.rebuild() после архивации посчитает только горячие годы.
+    """
+    if year >= (today or date.today()).year:
+        raise ArchiveError(f"Year {year} is not closed yet")
+    path = archive_path(year)
+    if os.path.exists(path):
+        raise ArchiveError(f"Year {year} is already archived: {path}")
+
+    os.makedirs(archive_dir(), exist_ok=True)
+    tmp_path = path + '.tmp'
+    lo, hi = partitions.year_bounds(year)
+    try:
+        # До commit события года нельзя менять, иначе изменения после выгрузки пропали бы
+        partitions.lock_year(year)
+        expected, last_end = db.session.query(db.func.count(EmployeePresence.presence_id),
+                                              db.func.max(EmployeePresence.end_datetime)) \
+            .filter(EmployeePresence.start_datetime >= lo, EmployeePresence.start_datetime < hi).one()
+        if not expected:
+            raise ArchiveError(f"No events in {year}")
+        written = _write_parquet(_year_rows(year), tmp_path)
+        if written != expected or pq.ParquetFile(tmp_path).metadata.num_rows != written:
+            raise ArchiveError(f"Archive of {year} has {written} rows, database has {expected}")
+
+        # События года могут заканчиваться в следующем году - его корзины тоже меняются
+        span = (lo, last_end)
+        changelog.log_started_between(lo, hi, changelog.DELETE)
+        bump_versions([span])
+        if not (partitions.is_partitioned() and partitions.drop_partition(year)):
+            EmployeePresence.query \
+                .filter(EmployeePresence.start_datetime >= lo, EmployeePresence.start_datetime < hi) \
+                .delete(synchronize_session=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # Строки уже удалены: если переименование не удастся, данные останутся в .tmp-файле
+    os.replace(tmp_path, path)
+    invalidate_presence_views([span])
+    notify_presence('archived', start_date=span[0].date().isoformat(), end_date=span[1].date().isoformat())
+    return written
+
+
+def read_archive(year, employee_id=None, start=None, end=None):
+    """
+    Генератор строк архива года - кортежи в порядке ARCHIVE_SCHEMA, потоком по пачкам.
+    Фильтры проталкиваются в чтение Parquet: группы строк, не проходящие по статистике
+    min/max, не читаются вовсе. start/end - границы пересечения по датам событий.
+    Отсутствие архива проверяется сразу, до начала чтения.
+    """
+    path = archive_path(year)
+    if not os.path.exists(path):
+        raise ArchiveError(f"Year {year} is not archived")
+
+    clauses = []
+    if employee_id is not None:
+        clauses.append(ds.field('employee_id') == employee_id)
+    if start is not None:
+        clauses.append(ds.field('end_datetime') >= pa.scalar(start, type=pa.timestamp('us')))
+    if end is not None:
+        clauses.append(ds.field('start_datetime') <= pa.scalar(end, type=pa.timestamp('us')))
+    condition = None
+    for clause in clauses:
+        condition = clause if condition is None else condition & clause
+
+    batches = ds.dataset(path, format='parquet').to_batches(filter=condition, batch_size=ARCHIVE_BATCH_SIZE)
+    return (row for batch in batches for row in zip(*(column.to_pylist() for column in batch.columns)))
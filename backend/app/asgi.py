@@ -0,0 +1,349 @@
+import asyncio
+import os
+from math import ceil
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from a2wsgi import WSGIMiddleware
+from flask_jwt_extended import create_access_token, decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import ExpiredSignatureError, InvalidTokenError
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import MIMEAccept, MultiDict
+from werkzeug.http import parse_accept_header, parse_etags
+
+from . import CORS_EXPOSE_HEADERS, CORS_ORIGINS, create_app, db
+from .availability import members_statement
+from .cache import calendar_cache, credential_cache, membership_cache
+from .hashing import VerifierBusy, password_verifier
+from .intervals import date_window, period_overlaps, range_overlaps
+from .models import ACTIVE_STATUSES, Employee, EmployeePresence, mask_presence
+from .presence import cache_sync
+from .pubsub import broker
+from .routes import MAX_PAGE_LIMIT, NDJSON_BATCH_SIZE, NDJSON_MIMETYPE, PRESENCE_LIST_OPTIONS, events_page, \
+    events_statement, parse_include_schedule, parse_scope, users_page_args
+from .schedule import merge_schedule, schedules_statement
+from .serializers import PresenceEncoder, fast_json_enabled
+from .versions import calendar_etag, events_etag, range_version, sync_statement, versions_statement
+
+# Async-драйвер для схемы из DATABASE_URL
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+
+def async_database_url(url):
+    """URL для async-движка: ASYNC_DATABASE_URL или DATABASE_URL с заменой драйвера."""
+    if os.environ.get('ASYNC_DATABASE_URL'):
+        return os.environ['ASYNC_DATABASE_URL']
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+def async_engine_options(url):
+    """Параметры пула async-движка из окружения (для SQLite пул не настраивается)."""
+    if make_url(url).get_backend_name() != 'postgresql':
+        return {}
+    return {
+        'pool_size': int(os.environ.get('ASYNC_POOL_SIZE', 20)),
+        'max_overflow': int(os.environ.get('ASYNC_MAX_OVERFLOW', 10)),
+        'pool_pre_ping': True,
+    }
+
+
+class AsyncApi:
+    """
+    Нативные async-обработчики самых нагруженных маршрутов api: логин, календарь,
+    список событий и профили сотрудников. Ответы, заявки JWT и ETag совпадают с Flask-версией: токены
+    создаются и проверяются самим flask_jwt_extended, JSON сериализуется
+    JSON-провайдером Flask-приложения.
+    """
+
+    def __init__(self, flask_app, engine):
+        self.flask_app = flask_app
+        self.engine = engine
+        self.session = async_sessionmaker(engine, expire_on_commit=False)
+
+    def json(self, data, status=200, headers=None):
+        with self.flask_app.app_context():
+            body = self.flask_app.json.response(data).get_data()
+        return Response(body, status_code=status, headers=headers, media_type='application/json')
+
+    def claims(self, request):
+        """(заявки JWT, None) или (None, ответ с ошибкой) - те же коды, что у flask_jwt_extended."""
+        header = request.headers.get('authorization')
+        if not header:
+            return None, self.json({"msg": "Missing Authorization Header"}, 401)
+        parts = header.split()
+        if len(parts) != 2 or parts[0] != 'Bearer':
+            return None, self.json({"msg": "Bad Authorization header. Expected 'Authorization: Bearer <JWT>'"}, 422)
+        try:
+            with self.flask_app.app_context():
+                claims = decode_token(parts[1])
+        except ExpiredSignatureError:
+            return None, self.json({"msg": "Token has expired"}, 401)
+        except (InvalidTokenError, JWTExtendedException) as e:
+            return None, self.json({"msg": str(e)}, 422)
+        if claims.get('type') != 'access':
+            return None, self.json({"msg": "Only non-refresh tokens are allowed"}, 422)
+        return claims, None
+
+    async def login(self, request):
+        try:
+            data = await request.json()
+        except ValueError:
+            return self.json({"msg": "Email and password are required"}, 400)
+        email = data.get('email')
+        password = data.get('password')
+        if not email or not password:
+            return self.json({"msg": "Email and password are required"}, 400)
+
+        # Кэш сбрасывается уведомлениями о любых изменениях сотрудника, как во Flask-версии
+        await self._sync_caches()
+        credentials = credential_cache.get(email)
+        if credentials is None:
+            generation = credential_cache.generation
+            async with self.session() as session:
+                row = (await session.execute(
+                    select(Employee.employee_id, Employee.password_hash, Employee.role).filter_by(email=email)
+                )).first()
+            if row:
+                credentials = (row.employee_id, row.password_hash, row.role.value)
+                credential_cache.set(email, credentials, generation)
+        if not credentials:
+            return self.json({"msg": "Bad email or password"}, 401)
+
+        # Ожидание слота и сама проверка идут в потоке, цикл событий не блокируется
+        loop = asyncio.get_running_loop()
+        try:
+            password_ok = await loop.run_in_executor(None, password_verifier.verify, credentials[1], password)
+        except VerifierBusy:
+            return self.json({"msg": "Too many login attempts in progress, try again later"}, 503)
+        if not password_ok:
+            return self.json({"msg": "Bad email or password"}, 401)
+
+        with self.flask_app.app_context():
+            access_token = create_access_token(identity=str(credentials[0]),
+                                               additional_claims={"role": credentials[2]})
+        return self.json({"access_token": access_token})
+
+    async def calendar_events(self, request):
+        claims, error = self.claims(request)
+        if error:
+            return error
+        is_admin = claims.get("role") == "admin"
+        viewer_id = claims['sub']
+
+        start_date = end_date = None
+        if request.query_params.get('start_date') and request.query_params.get('end_date'):
+            try:
+                start_date = datetime.strptime(request.query_params['start_date'], '%Y-%m-%d').date()
+                end_date = datetime.strptime(request.query_params['end_date'], '%Y-%m-%d').date()
+            except ValueError:
+                return self.json({"msg": "Invalid date format. Use YYYY-MM-DD."}, 400)
+
+        scope = parse_scope(request.query_params)
+        if scope is None:
+            return self.json({"msg": "team_id, department_id and project_id must be integers"}, 400)
+        include_schedule, error = parse_include_schedule(request.query_params, start_date, end_date)
+        if error:
+            return self.json({"msg": error}, 400)
+
+        async with self.session() as session:
+            members = await self._scope_members(session, scope) if scope else None
+            versions = await self._versions(session, start_date, end_date)
+            etag = calendar_etag(start_date, end_date, 'admin' if is_admin else viewer_id, versions=versions,
+                                 members=members, schedule=include_schedule)
+            headers = {'ETag': f'W/"{etag}"'}
+            if parse_etags(request.headers.get('if-none-match')).contains_weak(etag):
+                return Response(status_code=304, headers=headers)
+
+            version = range_version(start_date, end_date, versions)
+            events = calendar_cache.get(start_date, end_date, version, scope=members) if start_date else None
+            if events is None and members == ():
+                events = []
+            if events is None:
+                generation = calendar_cache.generation
+                stmt = select(EmployeePresence).options(*PRESENCE_LIST_OPTIONS) \
+                    .where(EmployeePresence.status.in_(ACTIVE_STATUSES)) \
+                    .order_by(EmployeePresence.start_datetime.asc())
+                if members is not None:
+                    stmt = stmt.where(EmployeePresence.employee_id.in_(members))
+                if start_date:
+                    lo, hi = date_window(start_date, end_date)
+                    if self.engine.dialect.name == 'postgresql' and members is None:
+                        stmt = stmt.where(period_overlaps(lo, hi))
+                    else:
+                        stmt = stmt.where(range_overlaps(lo, hi))
+                events = [event.to_dict(is_viewer_admin=True) for event in (await session.execute(stmt)).scalars()]
+                if start_date:
+                    calendar_cache.set(start_date, end_date, events, generation, version, scope=members)
+            if include_schedule:
+                rows = (await session.execute(schedules_statement(start_date, end_date, members))).all()
+                events = merge_schedule(events, rows, start_date, end_date, complete=members is None)
+
+        result = [mask_presence(event, is_viewer_admin=is_admin, viewer_id=viewer_id) for event in events]
+        return self.json(result, headers=headers)
+
+    async def events(self, request):
+        claims, error = self.claims(request)
+        if error:
+            return error
+        # Эти данные должны быть доступны всем - как во Flask-версии
+        is_admin = True
+        viewer_id = claims['sub']
+        args = MultiDict(request.query_params.multi_items())
+
+        async with self.session() as session:
+            versions = await self._versions(session, None, None)
+        etag = events_etag('admin' if is_admin else viewer_id, args, versions=versions)
+        headers = {'ETag': f'W/"{etag}"'}
+        if parse_etags(request.headers.get('if-none-match')).contains_weak(etag):
+            return Response(status_code=304, headers=headers)
+
+        stmt, error = events_statement(args, is_admin, viewer_id)
+        if error:
+            return self.json({"msg": error}, 400)
+        encoder = PresenceEncoder(is_viewer_admin=is_admin, viewer_id=viewer_id)
+        with self.flask_app.app_context():
+            fast = fast_json_enabled()
+
+        # Потоковая выгрузка: строки читаются пачками через серверный курсор по мере отправки
+        accept = parse_accept_header(request.headers.get('accept'), MIMEAccept)
+        if args.get('format') == 'ndjson' or accept.best == NDJSON_MIMETYPE:
+            if fast:
+                encode = encoder.encode
+            else:
+                encode = lambda row: self.flask_app.json.dumps(encoder.as_dict(row), separators=(',', ':'))
+
+            async def generate():
+                async with self.session() as session:
+                    rows = await session.stream(stmt.execution_options(yield_per=NDJSON_BATCH_SIZE))
+                    async for row in rows:
+                        yield encode(row) + '\n'
+
+            return StreamingResponse(generate(), headers=headers, media_type=NDJSON_MIMETYPE)
+
+        limit = args.get('limit', type=int)
+        async with self.session() as session:
+            if limit is None:
+                events = (await session.execute(stmt)).all()
+                next_cursor = None
+            else:
+                limit = max(1, min(limit, MAX_PAGE_LIMIT))
+                events, next_cursor = events_page((await session.execute(stmt.limit(limit + 1))).all(), limit)
+        if next_cursor:
+            headers['X-Next-Cursor'] = next_cursor
+        if fast:
+            return Response(encoder.encode_list(events), headers=headers, media_type='application/json')
+        return self.json([encoder.as_dict(row) for row in events], headers=headers)
+
+    async def users(self, request):
+        claims, error = self.claims(request)
+        if error:
+            return error
+        if claims.get("role") != "admin":
+            return self.json({"msg": "Admins only!"}, 403)
+        page, per_page = users_page_args(MultiDict(request.query_params.multi_items()))
+
+        async with self.session() as session:
+            total = (await session.execute(select(func.count()).select_from(Employee))).scalar_one()
+            stmt = select(Employee).options(*Employee.profile_options()) \
+                .order_by(Employee.employee_id.asc()).limit(per_page).offset((page - 1) * per_page)
+            employees = (await session.execute(stmt)).scalars().all()
+        # Поля ответа те же, что у Flask-SQLAlchemy paginate()
+        return self.json({
+            'items': [employee.to_dict() for employee in employees],
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'pages': ceil(total / per_page) if total else 0,
+        })
+
+    async def _sync_caches(self, session=None):
+        """Сверка кэшей процесса без LISTEN/NOTIFY - как before_request Flask (presence.CacheSync)."""
+        if broker.backend == 'postgres' or not cache_sync.due():
+            return
+        if session is None:
+            async with self.session() as session:
+                employees = (await session.execute(sync_statement())).scalar_one()
+        else:
+            employees = (await session.execute(sync_statement())).scalar_one()
+        cache_sync.apply(employees)
+
+    async def _versions(self, session, start_date, end_date):
+        """Счетчики корзин {bucket: version} - для ETag и кэша календаря, как calendar_versions()."""
+        return dict((await session.execute(versions_statement(start_date, end_date))).all())
+
+    async def _scope_members(self, session, scope):
+        """Состав команды/отдела/проекта тем же запросом, что и во Flask-версии, и через тот же кэш."""
+        await self._sync_caches(session)
+        key = (scope.get('team_id'), scope.get('department_id'), scope.get('project_id'))
+        members = membership_cache.get(key)
+        if members is None:
+            generation = membership_cache.generation
+            members = tuple((await session.execute(members_statement(*key))).scalars())
+            membership_cache.set(key, members, generation)
+        return members
+
+    async def _profile(self, employee_id):
+        async with self.session() as session:
+            stmt = select(Employee).options(*Employee.profile_options(many=False)) \
+                .where(Employee.employee_id == employee_id)
+            employee = (await session.execute(stmt)).unique().scalar_one_or_none()
+        if not employee:
+            return self.json({"msg": "User not found"}, 404)
+        return self.json(employee.to_dict())
+
+    async def profile(self, request):
+        claims, error = self.claims(request)
+        if error:
+            return error
+        return await self._profile(int(claims['sub']))
+
+    async def user_by_id(self, request):
+        claims, error = self.claims(request)
+        if error:
+            return error
+        if claims.get("role") != "admin":
+            return self.json({"msg": "Admins only!"}, 403)
+        return await self._profile(request.path_params['user_id'])
+
+
+def create_asgi_app():
+    """
+    ASGI-приложение: горячие маршруты обслуживаются AsyncApi через async-драйвер
+    и пул соединений, все остальные маршруты api - тем же Flask-приложением через
+    WSGI-адаптер (в пуле потоков внутри того же процесса, кэши общие).
+    """
+    flask_app = create_app()
+    url = flask_app.config['SQLALCHEMY_DATABASE_URI']
+    engine = create_async_engine(async_database_url(url), **async_engine_options(url))
+    api = AsyncApi(flask_app, engine)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # Нативные маршруты минуют before_request Flask, а кэшам процесса (в том числе
+        # учетных данных для логина) нужны уведомления о чужих записях с самого начала
+        with flask_app.app_context():
+            broker.listen(db.engine)
+        yield
+        await engine.dispose()
+
+    routes = [
+        Route('/api/login', api.login, methods=['POST']),
+        Route('/api/calendar/events', api.calendar_events, methods=['GET']),
+        Route('/api/events', api.events, methods=['GET']),
+        Route('/api/users', api.users, methods=['GET']),
+        Route('/api/profile', api.profile, methods=['GET']),
+        Route('/api/users/{user_id:int}', api.user_by_id, methods=['GET']),
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ]
+    middleware = [Middleware(CORSMiddleware, allow_origins=CORS_ORIGINS, allow_methods=['*'], allow_headers=['*'],
+                             expose_headers=CORS_EXPOSE_HEADERS)]
+    return Starlette(routes=routes, middleware=middleware, lifespan=lifespan)
@@ -0,0 +1,121 @@
+from datetime import timedelta
+
+import numpy as np
+from sqlalchemy import and_, or_, select
+
+from . import db
+from .cache import membership_cache
+from .intervals import date_window, range_overlaps
+from .models import ABSENCE_TYPES, ACTIVE_STATUSES, Employee, EmployeePresence, EmployeeProject, \
+    employee_departments_association, employee_teams_association
+
+
+def members_statement(team_id=None, department_id=None, project_id=None):
+    """
+    SELECT сотрудников, входящих во все заданные команду, отдел и проект, - один запрос
+    с join'ами: основная команда/отдел или дополнительные через employee_teams/
+    employee_departments, участие в проекте через employee_projects.
+    """
+    stmt = select(Employee.employee_id)
+    if team_id is not None:
+        teams = employee_teams_association
+        stmt = stmt.outerjoin(teams, and_(teams.c.employee_id == Employee.employee_id, teams.c.team_id == team_id)) \
+            .where(or_(Employee.main_team_id == team_id, teams.c.team_id.isnot(None)))
+    if department_id is not None:
+        departments = employee_departments_association
+        stmt = stmt.outerjoin(departments, and_(departments.c.employee_id == Employee.employee_id,
+                                                departments.c.department_id == department_id)) \
+            .where(or_(Employee.main_department_id == department_id, departments.c.department_id.isnot(None)))
+    if project_id is not None:
+        # Ключ employee_projects - (сотрудник, проект), поэтому join не размножает строки
+        stmt = stmt.join(EmployeeProject, and_(EmployeeProject.employee_id == Employee.employee_id,
+                                               EmployeeProject.project_id == project_id))
+    return stmt.order_by(Employee.employee_id)
+
+
+def scope_members(team_id=None, department_id=None, project_id=None):
+    """Отсортированный кортеж id сотрудников по members_statement; частые составы - из membership_cache."""
+    key = (team_id, department_id, project_id)
+    members = membership_cache.get(key)
+    if members is not None:
+        return members
+
+    generation = membership_cache.generation
+    members = tuple(db.session.execute(members_statement(team_id, department_id, project_id)).scalars())
+    membership_cache.set(key, members, generation)
+    return members
+
+
+def team_members(team_id):
+    """Сотрудники команды: основная команда или дополнительная через employee_teams."""
+    return list(scope_members(team_id=team_id))
+
+
+def department_members(department_id):
+    """Сотрудники отдела: основной отдел или дополнительный через employee_departments."""
+    return list(scope_members(department_id=department_id))
+
+
+def project_members(project_id):
+    """Участники проекта через EmployeeProject."""
+    return list(scope_members(project_id=project_id))
+
+
+def load_absences(employee_ids, start_date, end_date):
+    """Действующие отсутствия сотрудников, пересекающиеся с диапазоном: [(employee_id, start, end)]."""
+    if not employee_ids:
+        return []
+    lo, hi = date_window(start_date, end_date)
+    return db.session.query(EmployeePresence.employee_id, EmployeePresence.start_datetime,
+                            EmployeePresence.end_datetime) \
+        .filter(EmployeePresence.employee_id.in_(employee_ids),
+                EmployeePresence.status.in_(ACTIVE_STATUSES),
+                EmployeePresence.presence_type.in_(ABSENCE_TYPES),
+                range_overlaps(lo, hi)) \
+        .all()
+
+
+def busy_bitmap(employee_ids, absences, start_date, n_days):
+    """
+    Растеризует интервалы отсутствий в булеву матрицу сотрудники x дни (True - занят).
+    employee_ids должен быть отсортирован. Отрезки накладываются через разностный
+    массив и cumsum по строкам, без цикла по дням.
+    """
+    bitmap = np.zeros((len(employee_ids), n_days + 1), dtype=np.int32)
+    if absences:
+        ids = np.asarray(employee_ids)
+        rows = np.searchsorted(ids, np.fromiter((a[0] for a in absences), dtype=np.int64, count=len(absences)))
+        starts = np.fromiter(((a[1].date() - start_date).days for a in absences), dtype=np.int64,
+                             count=len(absences))
+        ends = np.fromiter(((a[2].date() - start_date).days for a in absences), dtype=np.int64,
+                           count=len(absences))
+        starts = np.clip(starts, 0, n_days)
+        ends = np.clip(ends + 1, 0, n_days)
+        np.add.at(bitmap, (rows, starts), 1)
+        np.add.at(bitmap, (rows, ends), -1)
+    return np.cumsum(bitmap, axis=1)[:, :n_days] > 0
+
+
+def free_days(busy, start_date, min_percent=100.0, best=None):
+    """
+    Дни, когда свободны не меньше min_percent сотрудников, либо best лучших дней
+    по числу свободных. Возвращает список словарей date/free/total/percent.
+    """
+    if best is not None and best < 1:
+        raise ValueError("best must be a positive integer")
+    total, n_days = busy.shape
+    free = total - busy.sum(axis=0)
+    percent = free * 100.0 / total if total else np.full(n_days, 100.0)
+
+    if best is not None:
+        # Стабильная сортировка: при равенстве выигрывает более ранний день
+        indices = np.argsort(-free, kind='stable')[:best]
+    else:
+        indices = np.flatnonzero(percent >= min_percent)
+
+    return [{
+        'date': (start_date + timedelta(days=int(i))).isoformat(),
+        'free': int(free[i]),
+        'total': int(total),
+        'percent': round(float(percent[i]), 2),
+    } for i in indices]
@@ -0,0 +1,316 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class CalendarCache:
+    """
+    LRU-кэш с TTL для выборок календаря, ключ - диапазон дат (start_date, end_date),
+    для выборок по команде/отделу/проекту - еще и состав сотрудников (scope).
+
+    Хранит немаскированные словари событий (to_dict(is_viewer_admin=True)),
+    маскирование под конкретного смотрящего применяется поверх кэша.
+    Кэш живет в памяти процесса, у каждого воркера он свой. Поэтому запись хранит
+    счетчики корзин диапазона, с которыми ее выбрали (общие для всех воркеров,
+    см. versions.py), и при других счетчиках считается промахом - иначе воркер,
+    не видевший изменения, отдал бы старую выборку под новым ETag.
+    """
+
+    def __init__(self, maxsize=256, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (start_date, end_date[, scope]) -> (expires_at, version, events)
+        self._lock = threading.Lock()
+        # Увеличивается при каждой инвалидации; не даёт сохранить выборку,
+        # начатую до изменения данных
+        self.generation = 0
+
+    def configure(self, maxsize=None, ttl=None):
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not None:
+                self.ttl = ttl
+            self._entries.clear()
+
+    @staticmethod
+    def _key(start_date, end_date, scope):
+        return (start_date, end_date) if scope is None else (start_date, end_date, scope)
+
+    def get(self, start_date, end_date, version, scope=None):
+        key = self._key(start_date, end_date, scope)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, entry_version, events = entry
+            if expires_at < time.monotonic() or entry_version != version:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return events
+
+    def set(self, start_date, end_date, events, generation, version, scope=None):
+        """
+        Сохраняет выборку, если с момента чтения generation не было инвалидаций.
+        version - счетчики корзин, прочитанные до выборки.
+        """
+        if self.maxsize <= 0:
+            return
+        key = self._key(start_date, end_date, scope)
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, version, events)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_range(self, start_date, end_date):
+        """Удаляет записи, чей диапазон пересекается с [start_date, end_date]."""
+        with self._lock:
+            self.generation += 1
+            stale = [key for key in self._entries if key[0] <= end_date and key[1] >= start_date]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+calendar_cache = CalendarCache()
+
+
+class MembershipCache:
+    """
+    Составы команд, отделов и проектов: ключ фильтра -> отсортированный кортеж id сотрудников.
+    Сбрасывается целиком при любом изменении сотрудников в этом процессе, другие
+    процессы - по уведомлению (presence.apply_notification) или сверке presence.CacheSync.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, members)
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def configure(self, maxsize=None, ttl=None):
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not None:
+                self.ttl = ttl
+            self._entries.clear()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, members = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return members
+
+    def set(self, key, members, generation):
+        """Сохраняет состав, если с момента чтения generation сотрудники не менялись."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, members)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+membership_cache = MembershipCache()
+
+
+class ScheduleCache:
+    """
+    Развернутые повторяющиеся расписания по окнам: (начало, конец) -> {текст расписания:
+    кортеж вхождений}. Запись LRU - целое окно, поэтому запрос по всей компании не
+    вытесняет сам себя, сколько бы расписаний в нем ни было, а одинаковые расписания
+    разных сотрудников разворачиваются один раз. Текст входит в ключ, так что устаревших
+    вхождений не бывает; окно, собранное по всем сотрудникам, заменяет прежнее целиком
+    и заодно отбрасывает тексты измененных расписаний.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize=None):
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            self._entries.clear()
+
+    def get(self, start_date, end_date):
+        """Вхождения окна {текст: кортеж} или пустой словарь; возвращенный словарь не менять."""
+        key = (start_date, end_date)
+        with self._lock:
+            texts = self._entries.get(key)
+            if texts is None:
+                return {}
+            self._entries.move_to_end(key)
+            return texts
+
+    def set(self, start_date, end_date, texts, complete=False):
+        """
+        Сохраняет вхождения окна. complete - texts собраны по всем сотрудникам и заменяют
+        окно; иначе (выборка по команде, отделу, проекту) добавляются к уже известным.
+        """
+        if self.maxsize <= 0:
+            return
+        key = (start_date, end_date)
+        with self._lock:
+            if not complete:
+                texts = {**self._entries.get(key, {}), **texts}
+            self._entries[key] = texts
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+schedule_cache = ScheduleCache()
+
+
+class CredentialCache:
+    """
+    Кэш данных для логина: email -> (employee_id, password_hash, role).
+    Сбрасывается при изменении или удалении сотрудника (по его id): в своем процессе
+    сразу, в остальных - по уведомлению employee_updated / employee_deleted
+    (presence.apply_notification), а без LISTEN/NOTIFY - целиком сверкой presence.CacheSync.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # email -> (expires_at, credentials)
+        self._emails = {}  # employee_id -> email, для сброса по id
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def configure(self, maxsize=None, ttl=None):
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not None:
+                self.ttl = ttl
+            self._entries.clear()
+            self._emails.clear()
+
+    def get(self, email):
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                return None
+            expires_at, credentials = entry
+            if expires_at < time.monotonic():
+                self._drop(email)
+                return None
+            self._entries.move_to_end(email)
+            return credentials
+
+    def set(self, email, credentials, generation):
+        """Сохраняет данные, если с момента чтения generation сотрудники не менялись."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[email] = (time.monotonic() + self.ttl, credentials)
+            self._entries.move_to_end(email)
+            self._emails[credentials[0]] = email
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+
+    def invalidate_employee(self, employee_id):
+        with self._lock:
+            self.generation += 1
+            email = self._emails.get(employee_id)
+            if email is not None:
+                self._drop(email)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._emails.clear()
+
+    def _drop(self, email):
+        _, credentials = self._entries.pop(email)
+        if self._emails.get(credentials[0]) == email:
+            del self._emails[credentials[0]]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+credential_cache = CredentialCache()
+
+
+class FeedCache:
+    """
+    Готовые тела небольших .ics-подписок: ключ -> (etag, body).
+    Запись актуальна, пока совпадает ETag, поэтому отдельная инвалидация не нужна:
+    после изменения данных ETag другой и запись просто перезаписывается.
+    """
+
+    def __init__(self, maxsize=512, max_body_bytes=256 * 1024):
+        self.maxsize = maxsize
+        self.max_body_bytes = max_body_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize=None, max_body_bytes=None):
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if max_body_bytes is not None:
+                self.max_body_bytes = max_body_bytes
+            self._entries.clear()
+
+    def get(self, key, etag):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != etag:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, etag, body):
+        if self.maxsize <= 0 or len(body) > self.max_body_bytes:
+            return
+        with self._lock:
+            self._entries[key] = (etag, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+feed_cache = FeedCache()
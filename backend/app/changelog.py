@@ -0,0 +1,106 @@
+from sqlalchemy import BigInteger, Text, and_, cast, func, literal, or_, select
+
+from . import db
+from .models import EmployeePresence, PresenceChange
+
+UPSERT = 'upsert'
+DELETE = 'delete'
+
+
+def _ordered_by_transaction():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def _xid(expression):
+    # xid8 не приводится к bigint напрямую, только через текст
+    return cast(cast(expression, Text), BigInteger)
+
+
+def log_change(event, op=UPSERT):
+    """Записывает изменение одного события; у нового события id должен быть уже получен (flush)."""
+    change = PresenceChange(presence_id=event.presence_id, employee_id=event.employee_id, op=op)
+    if _ordered_by_transaction():
+        change.xact_id = _xid(func.pg_current_xact_id())
+    db.session.add(change)
+
+
+def _log_select(where, op):
+    table = PresenceChange.__table__
+    columns = [EmployeePresence.presence_id, EmployeePresence.employee_id, literal(op)]
+    names = ['presence_id', 'employee_id', 'op']
+    if _ordered_by_transaction():
+        columns.append(_xid(func.pg_current_xact_id()))
+        names.append('xact_id')
+    db.session.execute(table.insert().from_select(names, select(*columns).where(where)))
+
+
+def log_employee_events(employee_id, op):
+    """Записывает изменение всех событий сотрудника одним INSERT ... SELECT."""
+    _log_select(EmployeePresence.employee_id == employee_id, op)
+
+
+def log_started_between(lo, hi, op):
+    """Записывает изменение всех событий с началом в [lo, hi) одним INSERT ... SELECT."""
+    _log_select(and_(EmployeePresence.start_datetime >= lo, EmployeePresence.start_datetime < hi), op)
+
+
+def max_presence_id():
+    """Текущий максимальный presence_id - отметка перед массовой вставкой."""
+    return db.session.query(func.max(EmployeePresence.presence_id)).scalar() or 0
+
+
+def log_inserted_after(presence_id):
+    """
+    Записывает создание всех событий с id больше отметки. Массовый импорт (COPY)
+    не возвращает id, поэтому строки находятся по отметке, снятой до вставки.
+    """
+    _log_select(EmployeePresence.presence_id > presence_id, UPSERT)
+
+
+def _finished():
+    """
+    Записи транзакций, которые уже не могут появиться в журнале задним числом: номер
+    меньше самой старой еще идущей транзакции (pg_snapshot_xmin того же снимка).
+    """
+    return PresenceChange.xact_id < _xid(func.pg_snapshot_xmin(func.pg_current_snapshot()))
+
+
+def current_cursor():
+    if not _ordered_by_transaction():
+        return db.session.query(func.max(PresenceChange.change_id)).scalar() or 0
+    return db.session.query(PresenceChange.change_id).filter(_finished()) \
+        .order_by(PresenceChange.xact_id.desc(), PresenceChange.change_id.desc()).limit(1).scalar() or 0
+
+
+def read_changes(since, limit):
+    """
+    Изменения после курсора: (id затронутых событий, новый курсор, есть ли ещё).
+    Несколько изменений одного события сворачиваются в одно - клиенту
+    нужно только текущее состояние события.
+
+    Курсор - change_id последней отданной записи. SQLite пишет по одной транзакции,
+    и там порядок change_id совпадает с порядком фиксации. На PostgreSQL транзакции
+    фиксируются не в порядке полученных id: запись с меньшим id может стать видна
+    позже, чем клиент ушел за нее курсором. Поэтому журнал читается в порядке
+    (xact_id, change_id) и только по завершенным транзакциям (_finished) - такой
+    порядок уже не меняется. Записи идущих транзакций ждут их завершения.
+    """
+    query = db.session.query(PresenceChange.change_id, PresenceChange.presence_id)
+    if not _ordered_by_transaction():
+        query = query.filter(PresenceChange.change_id > since).order_by(PresenceChange.change_id.asc())
+    else:
+        query = query.filter(_finished())
+        if since:
+            # Позиция курсора в порядке транзакций; неизвестный курсор - чтение с начала
+            position = func.coalesce(select(PresenceChange.xact_id)
+                                     .where(PresenceChange.change_id == since).scalar_subquery(), 0)
+            query = query.filter(or_(PresenceChange.xact_id > position,
+                                     and_(PresenceChange.xact_id == position, PresenceChange.change_id > since)))
+        query = query.order_by(PresenceChange.xact_id.asc(), PresenceChange.change_id.asc())
+
+    changes = query.limit(limit + 1).all()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    if not changes:
+        return set(), since, False
+    return {presence_id for _, presence_id in changes}, changes[-1][0], has_more
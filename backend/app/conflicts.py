@@ -0,0 +1,119 @@
+from bisect import bisect_left
+
+from . import db
+from .intervals import IntervalTree, range_overlaps, wall_clock
+from .models import ABSENCE_TYPES, BLOCKING_STATUSES, Employee, EmployeePresence
+
+_CONFLICT_COLUMNS = (EmployeePresence.presence_id, EmployeePresence.presence_type, EmployeePresence.start_datetime,
+                     EmployeePresence.end_datetime, EmployeePresence.status)
+
+
+def _blocking(employee_id):
+    """
+    Отсутствия сотрудника, занимающие даты. Условия совпадают с предикатом частичного
+    индекса ix_employee_presence_blocking, поэтому проба идет по нему.
+    """
+    return db.session.query(*_CONFLICT_COLUMNS) \
+        .filter(EmployeePresence.employee_id == employee_id,
+                EmployeePresence.status.in_(BLOCKING_STATUSES),
+                EmployeePresence.presence_type.in_(sorted(ABSENCE_TYPES)))
+
+
+def _conflict_dict(row):
+    presence_id, presence_type, start, end, status = row
+    return {
+        'id': presence_id,
+        'presence_type': presence_type,
+        'start_date': start.date().isoformat(),
+        'end_date': end.date().isoformat(),
+        'status': status,
+    }
+
+
+def find_conflicts(employee_id, start, end, exclude_id=None):
+    """
+    Отсутствия сотрудника, пересекающиеся с [start, end], по частичному индексу
+    ix_employee_presence_blocking. range_overlaps ограничивает начало и снизу
+    (событие не длиннее MAX_EVENT_DAYS), иначе проба читает всю историю отсутствий.
+    Сравнивает сама база, поэтому часовой пояс значений не важен. Старые данные
+    могут содержать пересечения, так что короткое событие может заслонять длинное,
+    начавшееся раньше, - проверка "только предыдущего события" здесь не годится.
+    """
+    blocking = _blocking(employee_id) \
+        .filter(range_overlaps(start, end))
+    if exclude_id is not None:
+        blocking = blocking.filter(EmployeePresence.presence_id != exclude_id)
+    rows = blocking.order_by(EmployeePresence.start_datetime.asc(), EmployeePresence.presence_id.asc())
+    return [_conflict_dict(row) for row in rows]
+
+
+def lock_employee(employee_id):
+    """
+    Блокирует строку сотрудника до конца транзакции, чтобы две параллельные
+    записи не прошли проверку пересечений одновременно (SQLite и так пишет по очереди).
+    """
+    db.session.query(Employee.employee_id).filter(Employee.employee_id == employee_id).with_for_update().first()
+
+
+def event_conflicts(fields, exclude_id=None):
+    """Пересечения для полей события; встречи ни с чем не конфликтуют."""
+    if fields['presence_type'] not in ABSENCE_TYPES:
+        return []
+    return find_conflicts(fields['employee_id'], fields['start_datetime'], fields['end_datetime'], exclude_id)
+
+
+def batch_conflicts(items):
+    """
+    Пересечения для списка полей событий - с базой и с предыдущими принятыми строками
+    списка, то есть ровно то, что получится при импорте в этом порядке.
+    items - [(номер строки, поля)]; возвращает списки конфликтов в том же порядке,
+    пересечение внутри списка выглядит как {'row': N}.
+
+    Вместо запроса на строку - один запрос занятых отсутствий всех сотрудников списка
+    в охватывающем окне (снизу оно ограничено MAX_EVENT_DAYS, как и в find_conflicts).
+    Строки базы могут пересекаться между собой, поэтому по ним ищем деревом интервалов.
+    Принятые строки списка не пересекаются ни с чем (иначе их бы не приняли), и для них
+    хватает бинарного поиска по отсортированным концам.
+    Время сравнивается без часового пояса: PostgreSQL возвращает его с поясом, SQLite
+    и даты из запроса - без.
+    """
+    absences = [fields for _, fields in items if fields['presence_type'] in ABSENCE_TYPES]
+    if not absences:
+        return [[] for _ in items]
+
+    lo = min(wall_clock(fields['start_datetime']) for fields in absences)
+    hi = max(wall_clock(fields['end_datetime']) for fields in absences)
+    stored = {}  # employee_id -> [(начало, конец, (начало, id, конфликт))]
+    rows = db.session.query(EmployeePresence.employee_id, *_CONFLICT_COLUMNS) \
+        .filter(EmployeePresence.employee_id.in_({fields['employee_id'] for fields in absences}),
+                EmployeePresence.status.in_(BLOCKING_STATUSES),
+                EmployeePresence.presence_type.in_(sorted(ABSENCE_TYPES)),
+                range_overlaps(lo, hi))
+    for employee_id, *row in rows:
+        start, end = wall_clock(row[2]), wall_clock(row[3])
+        stored.setdefault(employee_id, []).append((start, end, (start, row[0], _conflict_dict(row))))
+    trees = {employee_id: IntervalTree(spans) for employee_id, spans in stored.items()}
+    accepted = {}  # employee_id -> ([концы], [(начало, {'row': N})]) по возрастанию
+
+    results = []
+    for row_number, fields in items:
+        if fields['presence_type'] not in ABSENCE_TYPES:
+            results.append([])
+            continue
+        start, end = wall_clock(fields['start_datetime']), wall_clock(fields['end_datetime'])
+        tree = trees.get(fields['employee_id'])
+        conflicts = [conflict for _, _, conflict in sorted(tree.overlap(start, end))] if tree else []
+
+        ends, spans = accepted.setdefault(fields['employee_id'], ([], []))
+        # Принятые строки не пересекаются, поэтому концы упорядочены так же, как начала:
+        # первая с концом не раньше start и дальше, пока начало не позже end
+        position = bisect_left(ends, start)
+        for span_start, conflict in spans[position:]:
+            if span_start > end:
+                break
+            conflicts.append(conflict)
+        if not conflicts:
+            ends.insert(position, end)
+            spans.insert(position, (start, {'row': row_number}))
+        results.append(conflicts)
+    return results
@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Хэширование паролей намеренно медленное и упирается в CPU,
+# поэтому массовые операции выносят его в отдельные процессы
+_pool = None
+_workers = 0
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Общий пул процессов для хэширования, создается при первом обращении."""
+    global _pool, _workers
+    with _pool_lock:
+        if _pool is None:
+            _workers = int(os.environ.get('PASSWORD_HASH_WORKERS', 0)) or os.cpu_count() or 1
+            _pool = ProcessPoolExecutor(max_workers=_workers)
+        return _pool
+
+
+def hash_passwords(passwords):
+    """Хэширует список паролей параллельно; порядок результатов совпадает с порядком входа."""
+    passwords = list(passwords)
+    if len(passwords) < 2:
+        return [generate_password_hash(p) for p in passwords]
+    pool = get_pool()
+    chunksize = max(1, len(passwords) // (_workers * 4))
+    return list(pool.map(generate_password_hash, passwords, chunksize=chunksize))
+
+
+class VerifierBusy(Exception):
+    """Очередь на проверку пароля переполнена, ждать дольше queue_timeout не стали."""
+
+
+class PasswordVerifier:
+    """
+    Проверка паролей при логине в отдельном пуле процессов.
+
+    Одновременно выполняется не больше max_concurrency проверок, остальные
+    запросы ждут в очереди не дольше queue_timeout секунд. Пул отделен от
+    массового хэширования, чтобы импорт пользователей не задерживал логины.
+    """
+
+    # Накопительные поля stats(): в Prometheus они отдаются как counter
+    COUNTERS = ('completed', 'rejected', 'wait_seconds_total', 'verify_seconds_total')
+
+    def __init__(self, max_concurrency=4, queue_timeout=5.0):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._pool = None
+        self._lock = threading.Lock()
+        # Метрики
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.verify_seconds = 0.0
+
+    def configure(self, max_concurrency=None, queue_timeout=None):
+        with self._lock:
+            if max_concurrency is not None and max_concurrency != self.max_concurrency:
+                self.max_concurrency = max_concurrency
+                self._slots = threading.BoundedSemaphore(max_concurrency)
+                if self._pool is not None:
+                    self._pool.shutdown(wait=False)
+                    self._pool = None
+            if queue_timeout is not None:
+                self.queue_timeout = queue_timeout
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_concurrency)
+            return self._pool
+
+    def verify(self, password_hash, password):
+        """Сверяет пароль с хэшем; бросает VerifierBusy, если слот не освободился вовремя."""
+        slots = self._slots
+        queued_at = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+        acquired = slots.acquire(timeout=self.queue_timeout)
+        started = time.perf_counter()
+        with self._lock:
+            self.waiting -= 1
+            self.wait_seconds += started - queued_at
+            if not acquired:
+                self.rejected += 1
+            else:
+                self.in_flight += 1
+        if not acquired:
+            raise VerifierBusy()
+
+        try:
+            return self._get_pool().submit(check_password_hash, password_hash, password).result()
+        finally:
+            slots.release()
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+                self.verify_seconds += time.perf_counter() - started
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self.in_flight,
+                'queue_depth': self.waiting,
+                'max_queue_depth': self.max_waiting,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'wait_seconds_total': round(self.wait_seconds, 6),
+                'verify_seconds_total': round(self.verify_seconds, 6),
+            }
+
+
+password_verifier = PasswordVerifier()
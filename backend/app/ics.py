@@ -0,0 +1,165 @@
+from datetime import date, datetime, timedelta, timezone
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from . import db
+from .availability import department_members, team_members
+from .intervals import date_window, range_overlaps
+from .models import ABSENCE_TYPES, ACTIVE_STATUSES, Department, Employee, EmployeePresence, RoleEnum, Team, \
+    mask_presence
+
+# Окно подписки относительно сегодняшнего дня
+FEED_PAST_DAYS = 90
+FEED_FUTURE_DAYS = 365
+# Сколько VEVENT склеивается в один кусок потокового ответа
+FEED_CHUNK_EVENTS = 200
+
+FEED_SCOPES = ('user', 'team', 'department')
+
+PRESENCE_LABELS = {
+    'vacation': 'Отпуск',
+    'business_trip': 'Командировка',
+    'sick_leave': 'Больничный',
+    'day_off': 'Отгул',
+    'absence': 'Отсутствует',
+}
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='ics-feed')
+
+
+def feed_token(employee_id, version):
+    """
+    Бессрочный токен для URL подписки. Календарные клиенты не умеют передавать
+    заголовок Authorization и не обновляют короткоживущий JWT, поэтому токен
+    отзывается не сроком, а версией: rotate_feed_token() делает все прежние недействительными.
+    """
+    return _serializer().dumps([employee_id, version])
+
+
+def rotate_feed_token(employee):
+    """Отзывает выданные токены подписки сотрудника; возвращает новый. Commit - за вызывающим."""
+    # Увеличение в SQL: две одновременные ротации не получат одну и ту же версию
+    employee.feed_token_version = Employee.feed_token_version + 1
+    db.session.flush()
+    return feed_token(employee.employee_id, employee.feed_token_version)
+
+
+def load_feed_viewer(token):
+    """
+    (employee_id, is_admin) владельца токена или None. Роль и версия токена берутся из базы.
+    Принимается только полезная нагрузка feed_token() - [employee_id, version].
+    """
+    if not token:
+        return None
+    try:
+        payload = _serializer().loads(token)
+    except BadSignature:
+        return None
+    if not (isinstance(payload, list) and len(payload) == 2
+            and all(isinstance(v, int) and not isinstance(v, bool) for v in payload)):
+        return None
+    employee_id, version = payload
+    row = db.session.query(Employee.role, Employee.feed_token_version) \
+        .filter(Employee.employee_id == employee_id).first()
+    if row is None or row[1] != version:
+        return None
+    return employee_id, row[0] == RoleEnum.admin
+
+
+def feed_members(scope, object_id):
+    """(название календаря, отсортированные id сотрудников) или None, если объекта нет."""
+    if scope == 'user':
+        row = db.session.query(Employee.full_name).filter(Employee.employee_id == object_id).first()
+        return (row[0], [object_id]) if row else None
+    model, members = (Team, team_members) if scope == 'team' else (Department, department_members)
+    obj = db.session.get(model, object_id)
+    if obj is None:
+        return None
+    return obj.name, members(object_id)
+
+
+def feed_window(today=None):
+    today = today or date.today()
+    return today - timedelta(days=FEED_PAST_DAYS), today + timedelta(days=FEED_FUTURE_DAYS)
+
+
+def feed_rows(employee_ids, start_date, end_date):
+    """Действующие отсутствия сотрудников в окне - курсором, без загрузки всей выборки."""
+    lo, hi = date_window(start_date, end_date)
+    return db.session.query(EmployeePresence.presence_id, EmployeePresence.employee_id, Employee.full_name,
+                            EmployeePresence.presence_type, EmployeePresence.start_datetime,
+                            EmployeePresence.end_datetime, EmployeePresence.status, EmployeePresence.comment) \
+        .join(Employee, Employee.employee_id == EmployeePresence.employee_id) \
+        .filter(EmployeePresence.employee_id.in_(employee_ids),
+                EmployeePresence.status.in_(ACTIVE_STATUSES),
+                EmployeePresence.presence_type.in_(ABSENCE_TYPES),
+                range_overlaps(lo, hi)) \
+        .order_by(EmployeePresence.start_datetime.asc(), EmployeePresence.presence_id.asc()) \
+        .yield_per(1000)
+
+
+def _escape(text):
+    """Экранирование TEXT по RFC 5545."""
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\r\n', '\\n') \
+        .replace('\n', '\\n')
+
+
+def _fold(line):
+    """Переносит строку длиннее 75 октетов (RFC 5545, 3.1), не разрывая символы UTF-8."""
+    if len(line.encode('utf-8')) <= 75:
+        return line + '\r\n'
+    parts, current, size, limit = [], [], 0, 75
+    for char in line:
+        char_size = len(char.encode('utf-8'))
+        if size + char_size > limit:
+            parts.append(''.join(current))
+            current, size, limit = [], 0, 74  # продолжение начинается с пробела
+        current.append(char)
+        size += char_size
+    parts.append(''.join(current))
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _vevent(row, is_viewer_admin, viewer_id, stamp):
+    presence_id, employee_id, full_name, presence_type, start, end, status, comment = row
+    data = mask_presence({'employee_id': employee_id, 'presence_type': presence_type, 'comment': comment},
+                         is_viewer_admin=is_viewer_admin, viewer_id=viewer_id)
+    label = PRESENCE_LABELS.get(data['presence_type'], data['presence_type'])
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:presence-{presence_id}@calendar-task',
+        f'DTSTAMP:{stamp}',
+        # Событие на весь день: DTEND не включается в период
+        f'DTSTART;VALUE=DATE:{start.date():%Y%m%d}',
+        f'DTEND;VALUE=DATE:{end.date() + timedelta(days=1):%Y%m%d}',
+        f'SUMMARY:{_escape(f"{full_name}: {label}")}',
+        'TRANSP:TRANSPARENT',
+    ]
+    if data['comment']:
+        lines.append(f"DESCRIPTION:{_escape(data['comment'])}")
+    lines.append('END:VEVENT')
+    return ''.join(_fold(line) for line in lines)
+
+
+def render_feed(name, rows, is_viewer_admin, viewer_id):
+    """Генерирует .ics кусками по FEED_CHUNK_EVENTS событий; память не зависит от размера выборки."""
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    yield ''.join(_fold(line) for line in [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Calendar Task//Presence feed//RU',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{_escape(name)}',
+    ])
+    chunk = []
+    for row in rows:
+        chunk.append(_vevent(row, is_viewer_admin, viewer_id, stamp))
+        if len(chunk) >= FEED_CHUNK_EVENTS:
+            yield ''.join(chunk)
+            chunk = []
+    chunk.append('END:VCALENDAR\r\n')
+    yield ''.join(chunk)
@@ -0,0 +1,140 @@
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import and_, func
+
+from . import db
+from .models import MAX_EVENT_DAYS, EmployeePresence
+
+
+# ============================================================================
+# 1. Центрированное дерево интервалов
+# ============================================================================
+
+class _Node:
+    __slots__ = ('center', 'by_start', 'by_end', 'left', 'right')
+
+    def __init__(self, center, by_start, by_end, left, right):
+        self.center = center
+        self.by_start = by_start  # интервалы, содержащие center, по возрастанию начала
+        self.by_end = by_end  # те же интервалы по убыванию конца
+        self.left = left
+        self.right = right
+
+
+class IntervalTree:
+    """
+    Статическое дерево интервалов: поиск всех пересечений с отрезком
+    за O(log n + k). Интервалы замкнутые: (start, end, value).
+    """
+
+    def __init__(self, intervals=()):
+        intervals = list(intervals)
+        self._size = len(intervals)
+        self._root = self._build(intervals)
+
+    def __len__(self):
+        return self._size
+
+    @classmethod
+    def _build(cls, intervals):
+        if not intervals:
+            return None
+
+        points = sorted(i[0] for i in intervals)
+        center = points[len(points) // 2]
+
+        left, right, here = [], [], []
+        for interval in intervals:
+            if interval[1] < center:
+                left.append(interval)
+            elif interval[0] > center:
+                right.append(interval)
+            else:
+                here.append(interval)
+
+        by_start = sorted(here, key=lambda i: i[0])
+        by_end = sorted(here, key=lambda i: i[1], reverse=True)
+        return _Node(center, by_start, by_end, cls._build(left), cls._build(right))
+
+    def overlap(self, lo, hi):
+        """Возвращает значения всех интервалов, пересекающих [lo, hi]."""
+        result = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+
+            if hi < node.center:
+                # Все интервалы узла заканчиваются не раньше center > hi
+                for start, _, value in node.by_start:
+                    if start > hi:
+                        break
+                    result.append(value)
+                stack.append(node.left)
+            elif lo > node.center:
+                # Все интервалы узла начинаются не позже center < lo
+                for _, end, value in node.by_end:
+                    if end < lo:
+                        break
+                    result.append(value)
+                stack.append(node.right)
+            else:
+                result.extend(value for _, _, value in node.by_start)
+                stack.append(node.left)
+                stack.append(node.right)
+        return result
+
+
+def wall_clock(value):
+    """
+    Время без часового пояса - соглашение приложения для сравнений в Python.
+    PostgreSQL возвращает timestamptz с поясом сессии, SQLite и даты из запросов - без
+    пояса; отбросив пояс, получаем те же часы, что записало приложение.
+    """
+    return value.replace(tzinfo=None) if value.tzinfo else value
+
+
+def date_window(start_date, end_date):
+    """Переводит диапазон дат в замкнутый интервал [начало первого дня, конец последнего]."""
+    return datetime.combine(start_date, time.min), datetime.combine(end_date, time.max)
+
+
+def start_bounds(lo, hi):
+    """
+    Границы начала события, пересекающего [lo, hi], по ключу секционирования start_datetime.
+    Нижняя граница верна, пока события не длиннее MAX_EVENT_DAYS (проверяется при записи),
+    без нее запрос за один месяц читал бы всю историю и все секции прошлых лет.
+    """
+    return and_(EmployeePresence.start_datetime >= lo - timedelta(days=MAX_EVENT_DAYS),
+                EmployeePresence.start_datetime <= hi)
+
+
+def range_overlaps(lo, hi):
+    """Условие пересечения периода события с [lo, hi] на любой СУБД: start_bounds и конец не раньше lo."""
+    return and_(start_bounds(lo, hi), EmployeePresence.end_datetime >= lo)
+
+
+def period_overlaps(lo, hi):
+    """
+    Условие пересечения периода события с [lo, hi] через tstzrange (только PostgreSQL).
+    Избыточные start_bounds нужны секционированной таблице: по выражению над tstzrange
+    планировщик секции не отсекает, а по ключу секционирования - да.
+    """
+    period = func.tstzrange(EmployeePresence.start_datetime, EmployeePresence.end_datetime, '[]')
+    return and_(period.op('&&')(func.tstzrange(lo, hi, '[]')), start_bounds(lo, hi))
+
+
+def filter_overlapping(query, start_date, end_date):
+    """
+    Ограничивает запрос событиями, пересекающимися с диапазоном дат.
+
+    На PostgreSQL используется оператор && над tstzrange, который обслуживается
+    GiST-индексом ix_employee_presence_period. На остальных СУБД - ограниченным
+    по start_datetime сравнением границ (range_overlaps) по индексу ix_employee_presence_start.
+    """
+    lo, hi = date_window(start_date, end_date)
+
+    if db.engine.dialect.name == 'postgresql':
+        return query.filter(period_overlaps(lo, hi))
+    return query.filter(range_overlaps(lo, hi))
@@ -0,0 +1,224 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import update
+
+from . import db
+from .cache import membership_cache
+from .models import Job
+from .presence import import_events, notify_presence
+from .provisioning import provision_employees, remove_employee, unseal_passwords
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+JOB_STATUSES = (QUEUED, RUNNING, SUCCEEDED, FAILED)
+
+log = logging.getLogger(__name__)
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _running_before(moment):
+    return db.and_(Job.status == RUNNING, Job.started_at < moment)
+
+
+class JobError(Exception):
+    """Ошибка, которую повтор не исправит (например, объект уже удален): задача сразу failed."""
+
+
+class JobQueue:
+    """
+    Очередь фоновых задач в таблице jobs - на той же базе, что и приложение (PostgreSQL или SQLite).
+
+    Маршрут ставит задачу через enqueue() и сразу отвечает ее id, процессы worker.py
+    забирают задачи через claim(): на PostgreSQL - SELECT ... FOR UPDATE SKIP LOCKED,
+    на SQLite - условным UPDATE по статусу. Упавшая задача повторяется с экспоненциальной
+    отсрочкой от retry_base секунд; задача, застрявшая в running дольше stale_after
+    (воркер убит), возвращается в очередь. Завершенные задачи хранятся retention_days дней.
+    """
+
+    def __init__(self, retry_base=5.0, stale_after=3600.0, retention_days=7):
+        self.retry_base = retry_base
+        self.stale_after = stale_after
+        self.retention_days = retention_days
+        self._handlers = {}
+        self._lock = threading.Lock()
+
+    def configure(self, retry_base=None, stale_after=None, retention_days=None):
+        with self._lock:
+            if retry_base is not None:
+                self.retry_base = retry_base
+            if stale_after is not None:
+                self.stale_after = stale_after
+            if retention_days is not None:
+                self.retention_days = retention_days
+
+    def handler(self, kind, max_attempts=3):
+        """Регистрирует обработчик задач вида kind: handler(payload, created_by) -> результат (JSON)."""
+        def register(func):
+            self._handlers[kind] = (func, max_attempts)
+            return func
+        return register
+
+    @property
+    def kinds(self):
+        return sorted(self._handlers)
+
+    def enqueue(self, kind, payload, created_by=None):
+        """Ставит задачу в очередь и фиксирует транзакцию; возвращает Job."""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        now = _now()
+        job = Job(kind=kind, status=QUEUED, payload=json.dumps(payload, ensure_ascii=False),
+                  max_attempts=self._handlers[kind][1], attempts=0,
+                  created_by=int(created_by) if created_by is not None else None,
+                  created_at=now, run_after=now)
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    def claim(self, worker):
+        """Забирает самую раннюю готовую задачу и переводит ее в running; None, если очередь пуста."""
+        while True:
+            now = _now()
+            job_id = db.session.query(Job.job_id) \
+                .filter(Job.status == QUEUED, Job.run_after <= now) \
+                .order_by(Job.run_after, Job.job_id) \
+                .limit(1).with_for_update(skip_locked=True).scalar()
+            if job_id is None:
+                db.session.commit()
+                return None
+            # Без SKIP LOCKED (SQLite) ту же задачу мог успеть забрать другой воркер
+            claimed = db.session.execute(
+                update(Job).where(Job.job_id == job_id, Job.status == QUEUED)
+                .values(status=RUNNING, attempts=Job.attempts + 1, started_at=now, worker=worker),
+                execution_options={'synchronize_session': False}
+            ).rowcount
+            db.session.commit()
+            if claimed:
+                return db.session.get(Job, job_id)
+
+    def run(self, job):
+        """Выполняет забранную задачу и записывает результат; True, если она завершилась успешно."""
+        job_id, kind = job.job_id, job.kind
+        try:
+            if kind not in self._handlers:
+                raise JobError(f"Unknown job kind: {kind}")
+            result = self._handlers[kind][0](json.loads(job.payload), job.created_by)
+        except Exception as e:
+            db.session.rollback()
+            log.exception("job %s (%s) failed", job_id, kind)
+            self._fail(job_id, e, retry=not isinstance(e, JobError))
+            return False
+
+        job = db.session.get(Job, job_id)
+        job.status = SUCCEEDED
+        job.result = json.dumps(result, ensure_ascii=False)
+        job.error = None
+        job.finished_at = _now()
+        db.session.commit()
+        return True
+
+    def _fail(self, job_id, error, retry):
+        job = db.session.get(Job, job_id)
+        job.error = f"{error.__class__.__name__}: {error}"
+        if retry and job.attempts < job.max_attempts:
+            # 5, 10, 20... секунд при retry_base=5
+            job.status = QUEUED
+            job.run_after = _now() + timedelta(seconds=self.retry_base * 2 ** (job.attempts - 1))
+        else:
+            job.status = FAILED
+            job.finished_at = _now()
+        db.session.commit()
+
+    def sweep(self):
+        """
+        Возвращает в очередь задачи, брошенные упавшими воркерами (или помечает их failed,
+        если попытки исчерпаны), и удаляет завершенные задачи старше retention_days.
+        """
+        now = _now()
+        stale = _running_before(now - timedelta(seconds=self.stale_after))
+        # Объекты сессии не синхронизируем: SQLite возвращает время без пояса, и сравнение в Python упадет
+        unsynced = {'synchronize_session': False}
+        requeued = db.session.execute(
+            update(Job).where(stale, Job.attempts < Job.max_attempts)
+            .values(status=QUEUED, run_after=now, error="Worker lost"), execution_options=unsynced
+        ).rowcount
+        db.session.execute(
+            update(Job).where(stale, Job.attempts >= Job.max_attempts)
+            .values(status=FAILED, finished_at=now, error="Worker lost"), execution_options=unsynced
+        )
+        Job.query.filter(Job.status.in_((SUCCEEDED, FAILED)),
+                         Job.finished_at < now - timedelta(days=self.retention_days)) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+        return requeued
+
+    def work(self, worker=None, poll_interval=1.0, once=False, stop=None):
+        """
+        Цикл воркера: забирает и выполняет задачи по одной, при пустой очереди ждет
+        poll_interval секунд. once - выйти, когда очередь опустеет; stop - threading/multiprocessing.Event.
+        """
+        worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+        swept_at = None
+        while stop is None or not stop.is_set():
+            if swept_at is None or time.monotonic() - swept_at > self.stale_after / 10:
+                self.sweep()
+                swept_at = time.monotonic()
+            job = self.claim(worker)
+            if job is None:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+            self.run(job)
+            # Объекты предыдущей задачи не должны копиться в сессии долгоживущего процесса
+            db.session.remove()
+
+    def stats(self):
+        """Число задач по статусам."""
+        counts = dict(db.session.query(Job.status, db.func.count(Job.job_id)).group_by(Job.status).all())
+        return {status: counts.get(status, 0) for status in JOB_STATUSES}
+
+
+job_queue = JobQueue()
+
+
+# ============================================================================
+# Обработчики задач
+# ============================================================================
+
+@job_queue.handler('import_users')
+def _import_users(payload, created_by):
+    # Пароли в payload зашифрованы (seal_passwords) и хэшируются здесь, а не в запросе
+    created, errors = provision_employees(unseal_passwords(payload['items']))
+    if created:
+        membership_cache.clear()
+        # Составы команд закэшированы в веб-воркерах, а не в этом процессе
+        notify_presence('employees_created', count=len(created))
+    return {'created': created, 'errors': errors}
+
+
+# Импорт коммитит пачки по отдельности: повтор после частичной записи задублировал бы
+# события без проверки пересечений (встречи), поэтому задача выполняется один раз
+@job_queue.handler('import_events', max_attempts=1)
+def _import_events(payload, created_by):
+    inserted, errors = import_events(payload['items'], payload['is_admin'], str(created_by))
+    return {'inserted': inserted, 'errors': errors}
+
+
+@job_queue.handler('delete_user')
+def _delete_user(payload, created_by):
+    employee_id = payload['employee_id']
+    if not remove_employee(employee_id):
+        raise JobError(f"User with id {employee_id} not found")
+    return {'msg': f"User with id {employee_id} deleted successfully"}
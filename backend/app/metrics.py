@@ -0,0 +1,198 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PREFIX = 'calendar'
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    """Гистограмма в духе Prometheus: счетчики по верхним границам, сумма и число наблюдений."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя ячейка - +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+        lines.append(f'{name}_sum{_labels(labels)} {float(self.sum)!r}')
+        lines.append(f'{name}_count{_labels(labels)} {self.count}')
+        return lines
+
+
+def _labels(labels, **extra):
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in items)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + '}'
+
+
+class RouteStats:
+    __slots__ = ('latency', 'queries', 'sql_seconds', 'serialize_seconds', 'response_bytes', 'statuses')
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.sql_seconds = Histogram(LATENCY_BUCKETS)
+        self.serialize_seconds = Histogram(LATENCY_BUCKETS)
+        self.response_bytes = Histogram(BYTES_BUCKETS)
+        self.statuses = {}
+
+
+class Metrics:
+    """
+    Метрики запросов по маршрутам: задержка, число и время SQL-запросов,
+    время сериализации JSON и размер ответа. Счетчики текущего запроса лежат
+    в flask.g, в общий реестр они попадают одной операцией под блокировкой
+    в конце запроса. Метрики живут в памяти процесса, у каждого воркера свои.
+    """
+
+    def __init__(self):
+        self._routes = {}  # (method, route) -> RouteStats
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.json = TimedJSONProvider(app)
+        app.before_request(_start_request)
+        app.after_request(_finish_response)
+        app.teardown_request(self._record)
+
+    def _record(self, error=None):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        rule = request.url_rule.rule if request.url_rule else 'unmatched'
+        key = (request.method, rule)
+        status = g.get('metrics_status', 500)
+        response_bytes = g.get('metrics_bytes')
+
+        with self._lock:
+            stats = self._routes.get(key)
+            if stats is None:
+                stats = self._routes[key] = RouteStats()
+            stats.latency.observe(elapsed)
+            stats.queries.observe(g.get('metrics_queries', 0))
+            stats.sql_seconds.observe(g.get('metrics_sql_seconds', 0.0))
+            stats.serialize_seconds.observe(g.get('metrics_serialize_seconds', 0.0))
+            if response_bytes is not None:
+                stats.response_bytes.observe(response_bytes)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def render(self, gauges=(), counters=()):
+        """
+        Текст в формате Prometheus. gauges и counters - [(имя, {метки}, значение)] из других
+        подсистем: текущие значения и накопленные с запуска процесса. Имя счетчика получает
+        суффикс _total, если его еще нет.
+        """
+        with self._lock:
+            snapshot = [(key, stats) for key, stats in sorted(self._routes.items())]
+            lines = [f'# TYPE {PREFIX}_http_requests_total counter']
+            for (method, rule), stats in snapshot:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'{PREFIX}_http_requests_total'
+                                 f'{_labels({"method": method, "route": rule, "status": status})} {count}')
+            for metric, attr in (('http_request_duration_seconds', 'latency'),
+                                 ('http_sql_queries', 'queries'),
+                                 ('http_sql_duration_seconds', 'sql_seconds'),
+                                 ('http_serialize_duration_seconds', 'serialize_seconds'),
+                                 ('http_response_bytes', 'response_bytes')):
+                lines.append(f'# TYPE {PREFIX}_{metric} histogram')
+                for (method, rule), stats in snapshot:
+                    lines.extend(getattr(stats, attr).render(f'{PREFIX}_{metric}', {'method': method, 'route': rule}))
+
+        # Строки одной метрики должны идти подряд под своим # TYPE, а значения
+        # приходят вперемешку (например, все поля одного пула, затем следующего)
+        families = {}  # имя -> (тип, [строки])
+        for kind, samples in (('gauge', gauges), ('counter', counters)):
+            for name, labels, value in samples:
+                if value is None:
+                    continue
+                if kind == 'counter' and not name.endswith('_total'):
+                    name += '_total'
+                family = families.setdefault(name, (kind, []))
+                family[1].append(f'{PREFIX}_{name}{_labels(labels)} {float(value)!r}')
+        for name, (kind, samples) in families.items():
+            lines.append(f'# TYPE {PREFIX}_{name} {kind}')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_queries = 0
+    g.metrics_sql_seconds = 0.0
+    g.metrics_serialize_seconds = 0.0
+
+
+def _finish_response(response):
+    g.metrics_status = response.status_code
+    # У потоковых ответов размер заранее неизвестен
+    if not response.is_streamed:
+        g.metrics_bytes = response.calculate_content_length()
+    return response
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['metrics_query_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('metrics_query_started', None)
+    if started is None or not has_request_context() or 'metrics_started' not in g:
+        return
+    g.metrics_queries += 1
+    g.metrics_sql_seconds += time.perf_counter() - started
+
+
+@contextmanager
+def serialization_timer():
+    """Учитывает время сериализации, которая идет мимо jsonify() (быстрые сериализаторы)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if has_request_context() and 'metrics_started' in g:
+            g.metrics_serialize_seconds += time.perf_counter() - started
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON-провайдер Flask, который учитывает время сериализации ответов jsonify()."""
+
+    def dumps(self, obj, **kwargs):
+        if not has_request_context() or 'metrics_started' not in g:
+            return super().dumps(obj, **kwargs)
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            g.metrics_serialize_seconds += time.perf_counter() - started
@@ -1,7 +1,9 @@
 from . import db
 from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy import Enum as SQLAlchemyEnum, CheckConstraint, ForeignKey
+from sqlalchemy.orm import joinedload, selectinload
 import enum
+import json
 
 
 # Типы, которые требуют утверждения
@@ -16,6 +18,19 @@ PRIVATE_PRESENCE_TYPES = {'sick_leave', 'day_off'}
 # Все разрешенные для создания типы "особых случаев"
 ALLOWED_EVENT_TYPES = APPROVAL_REQUIRED_TYPES.union(FACTUAL_TYPES)
 
+# Типы, при которых сотрудник недоступен (в отличие от встречи)
+ABSENCE_TYPES = {'vacation', 'business_trip', 'sick_leave', 'day_off'}
+
+# Статусы событий, которые уже действуют и видны в календаре
+ACTIVE_STATUSES = ('approved', 'completed')
+
+# Статусы, при которых отсутствие занимает даты: пересекаться с другим отсутствием оно не может
+BLOCKING_STATUSES = ('planned', 'approved', 'completed')
+
+# Самое длинное событие в днях. Запросы по диапазону опираются на это ограничение:
+# событие, пересекающее [lo, hi], начинается не раньше lo - MAX_EVENT_DAYS
+MAX_EVENT_DAYS = 366
+
 # ============================================================================
 # 1. Python ENUMs для соответствия типам данных в PostgreSQL
 # ============================================================================
@@ -120,6 +135,8 @@ class Employee(db.Model):
     hire_date = db.Column(db.Date, nullable=False, default=db.func.current_date())
     termination_date = db.Column(db.Date)
     work_schedule = db.Column(db.Text)
+    # Входит в подписанный токен .ics-подписки; увеличение отзывает все выданные токены
+    feed_token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     # --- Поля с ENUM типами ---
     role = db.Column(SQLAlchemyEnum(RoleEnum, name='role_type'), nullable=False, default=RoleEnum.user)
@@ -150,6 +167,26 @@ class Employee(db.Model):
     presence_records = db.relationship('EmployeePresence', back_populates='employee', lazy='dynamic',
                                        cascade="all, delete-orphan")
 
+    # --- Стратегии загрузки ---
+    @classmethod
+    def profile_options(cls, many=True):
+        """
+        Опции запроса, загружающие весь граф to_dict() заранее.
+
+        Связи "один" всегда присоединяются к основному SELECT. Для списка (many=True)
+        коллекции догружаются пакетно, по одному запросу на коллекцию для любого
+        числа сотрудников; для одного сотрудника весь граф берется одним запросом.
+        """
+        collection_loader = selectinload if many else joinedload
+        return (
+            joinedload(cls.position),
+            joinedload(cls.main_department),
+            joinedload(cls.main_team),
+            collection_loader(cls.departments),
+            collection_loader(cls.teams),
+            collection_loader(cls.projects_association).joinedload(EmployeeProject.project),
+        )
+
     # --- Методы ---
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -221,34 +258,190 @@ class EmployeePresence(db.Model):
 
     employee = db.relationship('Employee', back_populates='presence_records')
 
+    # GiST-индекс по периоду события для запросов на пересечение диапазонов (только PostgreSQL).
+    # Для существующей базы:
+    #   CREATE INDEX ix_employee_presence_period ON employee_presence
+    #   USING gist (tstzrange(start_datetime, end_datetime, '[]'));
+    #
+    # Частичный индекс для проверки пересечений отсутствий одного сотрудника (app/conflicts.py):
+    #   CREATE INDEX ix_employee_presence_blocking ON employee_presence (employee_id, start_datetime)
+    #   WHERE status IN ('planned', 'approved', 'completed')
+    #     AND presence_type IN ('business_trip', 'day_off', 'sick_leave', 'vacation');
+    #
+    # Индекс для календаря команды/отдела/проекта (выборка по списку сотрудников):
+    #   CREATE INDEX ix_employee_presence_employee ON employee_presence (employee_id, start_datetime);
+    #
+    # Без range-типов (SQLite) пересечение с диапазоном ищется по start_datetime (intervals.range_overlaps).
+    __table_args__ = (
+        db.Index('ix_employee_presence_period',
+                 db.func.tstzrange(start_datetime, end_datetime, '[]'),
+                 postgresql_using='gist').ddl_if(dialect='postgresql'),
+        db.Index('ix_employee_presence_blocking', employee_id, start_datetime,
+                 postgresql_where=db.and_(status.in_(BLOCKING_STATUSES), presence_type.in_(sorted(ABSENCE_TYPES))),
+                 sqlite_where=db.and_(status.in_(BLOCKING_STATUSES), presence_type.in_(sorted(ABSENCE_TYPES)))),
+        db.Index('ix_employee_presence_employee', employee_id, start_datetime),
+        db.Index('ix_employee_presence_start', start_datetime).ddl_if(dialect='sqlite'),
+    )
+
 
 
     def to_dict(self, is_viewer_admin=False, viewer_id=None):
-        PRIVATE_PRESENCE_TYPES = {'sick_leave', 'day_off'}
         """
         Возвращает данные о присутствии в виде словаря.
         Скрывает чувствительную информацию от обычных пользователей.
         """
-        is_owner = self.employee_id == viewer_id
-
-        # Если тип приватный И просматривающий не админ И не владелец записи
-        if self.presence_type in PRIVATE_PRESENCE_TYPES and not is_viewer_admin and not is_owner:
-            # Для других сотрудников заменяем приватный статус на обобщенный 'absence'
-            public_presence_type = 'absence'
-            public_comment = 'Сотрудник отсутствует'  # Общий комментарий
-        else:
-            # Админ или владелец видят всё как есть
-            public_presence_type = self.presence_type
-            public_comment = self.comment
-        print("dwaddwadad")
-        return {
+        data = {
             'id': self.presence_id,
             'employee_id': self.employee_id,
             'employee_name': self.employee.full_name if self.employee else None,
-            'presence_type': public_presence_type,
+            'presence_type': self.presence_type,
             'start_date': self.start_datetime.date().isoformat() if self.start_datetime else None,
             'end_date': self.end_datetime.date().isoformat() if self.end_datetime else None,
             'status': self.status,
-            # Комментарий показываем только админам и владельцу
-            'comment': public_comment
-        }
\ No newline at end of file
+            'comment': self.comment
+        }
+        return mask_presence(data, is_viewer_admin=is_viewer_admin, viewer_id=viewer_id)
+
+
+def mask_presence(data, is_viewer_admin=False, viewer_id=None):
+    """
+    Применяет к полному словарю события (из to_dict) правила приватности смотрящего.
+    Исходный словарь не изменяется, поэтому его можно хранить в кэше.
+    """
+    # viewer_id приходит из JWT строкой, а employee_id в базе - число
+    is_owner = viewer_id is not None and str(data['employee_id']) == str(viewer_id)
+
+    # Если тип приватный И просматривающий не админ И не владелец записи
+    if data['presence_type'] in PRIVATE_PRESENCE_TYPES and not is_viewer_admin and not is_owner:
+        # Для других сотрудников заменяем приватный статус на обобщенный 'absence'
+        # и показываем общий комментарий (комментарий видят только админы и владелец)
+        return dict(data, presence_type='absence', comment='Сотрудник отсутствует')
+
+    # Админ или владелец видят всё как есть
+    return data
+
+
+# ============================================================================
+# 7. Служебные таблицы
+# ============================================================================
+
+class PresenceVersion(db.Model):
+    """
+    Счетчик изменений событий по "корзинам": месяц начала/конца события ('2025-03'),
+    'reset' - изменения, затрагивающие все диапазоны сразу. Из счетчиков строятся ETag
+    для условных GET; "любое изменение" - их сумма (versions.ANY_BUCKET).
+    """
+    __tablename__ = 'presence_versions'
+    bucket = db.Column(db.String(16), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+
+class DailyOccupancy(db.Model):
+    """
+    Агрегат для дашбордов загрузки офиса: число действующих (ACTIVE_STATUSES) событий
+    на день по основному отделу, режиму работы сотрудника и типу события.
+    Поддерживается инкрементально маршрутами событий, пересобирается rebuild_occupancy.py.
+    Численность и отсутствующих людей для той же сводки ведут DailyAbsence и HeadcountChange.
+    """
+    __tablename__ = 'daily_occupancy'
+    day = db.Column(db.Date, primary_key=True)
+    # 0 - сотрудники без основного отдела
+    department_id = db.Column(db.Integer, primary_key=True)
+    work_mode = db.Column(db.String(16), primary_key=True)
+    presence_type = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class DailyAbsence(db.Model):
+    """
+    Агрегат отсутствующих людей: число действующих отсутствий (ABSENCE_TYPES) сотрудника
+    на день в пределах срока его работы. Отсутствующих в отделе считают строки с count > 0:
+    у одного сотрудника в старых данных бывает несколько пересекающихся отсутствий.
+    Поддерживается и пересобирается вместе с daily_occupancy.
+    """
+    __tablename__ = 'daily_absences'
+    day = db.Column(db.Date, primary_key=True)
+    department_id = db.Column(db.Integer, primary_key=True)
+    work_mode = db.Column(db.String(16), primary_key=True)
+    employee_id = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class HeadcountChange(db.Model):
+    """
+    Численность сотрудников разностями по дням: +1 в день приема (hire_date), -1 на следующий
+    день после увольнения (termination_date) по основному отделу и режиму работы. Численность
+    на день - сумма изменений по этот день включительно. Поддерживается при создании,
+    изменении и удалении сотрудников, пересобирается вместе с daily_occupancy.
+    """
+    __tablename__ = 'headcount_changes'
+    day = db.Column(db.Date, primary_key=True)
+    department_id = db.Column(db.Integer, primary_key=True)
+    work_mode = db.Column(db.String(16), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class PresenceChange(db.Model):
+    """
+    Журнал изменений EmployeePresence (только добавление). change_id служит курсором
+    инкрементальной синхронизации: 'upsert' - событие создано или изменено,
+    'delete' - удалено. Внешнего ключа нет, чтобы записи переживали удаление события.
+    xact_id - номер транзакции записи (xid8, только PostgreSQL): там журнал читается
+    в порядке транзакций, см. changelog.read_changes.
+    """
+    __tablename__ = 'presence_changes'
+    change_id = db.Column(db.Integer, primary_key=True)
+    presence_id = db.Column(db.Integer, nullable=False)
+    employee_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(16), nullable=False)
+    changed_at = db.Column(db.DateTime(timezone=True), nullable=False, default=db.func.now())
+    xact_id = db.Column(db.BigInteger)
+
+    __table_args__ = (
+        db.Index('ix_presence_changes_xact', xact_id, change_id).ddl_if(dialect='postgresql'),
+    )
+
+
+class Job(db.Model):
+    """
+    Фоновая задача (app/jobs.py): очередь хранится в самой базе, выполняют ее процессы worker.py.
+    status: queued -> running -> succeeded | failed. После ошибки задача возвращается в queued
+    с отсрочкой run_after, пока attempts не достигнет max_attempts.
+    Внешнего ключа на автора нет: задача удаления сотрудника переживает его самого.
+    """
+    __tablename__ = 'jobs'
+    job_id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(16), nullable=False, default='queued')
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    created_by = db.Column(db.Integer)
+    worker = db.Column(db.String(128))
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    run_after = db.Column(db.DateTime(timezone=True), nullable=False)
+    started_at = db.Column(db.DateTime(timezone=True))
+    finished_at = db.Column(db.DateTime(timezone=True))
+
+    # Воркеры ищут готовые задачи: WHERE status = 'queued' AND run_after <= now()
+    __table_args__ = (
+        db.Index('ix_jobs_queue', status, run_after),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.job_id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'created_by': self.created_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+        }
@@ -0,0 +1,275 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from sqlalchemy import func
+
+from . import db
+from .models import ABSENCE_TYPES, ACTIVE_STATUSES, PRIVATE_PRESENCE_TYPES, DailyAbsence, DailyOccupancy, \
+    Employee, EmployeePresence, HeadcountChange, WorkModeEnum
+from .upsert import upsert_insert
+
+NO_DEPARTMENT = 0
+
+
+def _days(start, end):
+    day, last = start.date(), end.date()
+    while day <= last:
+        yield day
+        day += timedelta(days=1)
+
+
+def _employee_keys(employee_ids):
+    """employee_id -> (department_id, work_mode, hire_date, termination_date) одним запросом."""
+    if not employee_ids:
+        return {}
+    rows = db.session.query(Employee.employee_id, Employee.main_department_id, Employee.work_mode,
+                            Employee.hire_date, Employee.termination_date) \
+        .filter(Employee.employee_id.in_(employee_ids))
+    return {e: (d or NO_DEPARTMENT, m.value, hired, terminated) for e, d, m, hired, terminated in rows}
+
+
+def _employed(day, hire_date, termination_date):
+    return hire_date <= day and (termination_date is None or day <= termination_date)
+
+
+def _apply(model, counts):
+    """Прибавляет к агрегату model счетчики {ключ в порядке первичного ключа: delta}."""
+    counts = {key: delta for key, delta in counts.items() if delta}
+    if not counts:
+        return
+
+    table = model.__table__
+    names = [column.name for column in table.primary_key.columns]
+    rows = [dict(zip(names, key), count=delta) for key, delta in sorted(counts.items())]
+
+    insert = upsert_insert()
+    if insert is not None:
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(index_elements=list(table.primary_key.columns),
+                                          set_={'count': table.c.count + stmt.excluded['count']})
+        db.session.execute(stmt)
+        return
+
+    for row in rows:
+        key = {name: row[name] for name in names}
+        updated = db.session.query(model).filter_by(**key) \
+            .update({'count': model.count + row['count']}, synchronize_session=False)
+        if not updated:
+            db.session.add(model(**row))
+
+
+def _event_counts(events, delta, keys):
+    """Счетчики daily_occupancy и daily_absences для событий со знаком delta."""
+    counts, absences = Counter(), Counter()
+    for event in events:
+        employee_id = event['employee_id']
+        department_id, work_mode, hire_date, termination_date = keys[employee_id]
+        is_absence = event['presence_type'] in ABSENCE_TYPES
+        for day in _days(event['start_datetime'], event['end_datetime']):
+            counts[(day, department_id, work_mode, event['presence_type'])] += delta
+            if is_absence and _employed(day, hire_date, termination_date):
+                absences[(day, department_id, work_mode, employee_id)] += delta
+    return counts, absences
+
+
+def record_events(events, delta, keys=None):
+    """
+    Учитывает в агрегатах события (словари с employee_id, presence_type, start_datetime,
+    end_datetime, status) со знаком delta: +1 при появлении, -1 при исчезновении.
+    Вызывается до commit, в транзакции самого изменения.
+    """
+    events = [e for e in events if e['status'] in ACTIVE_STATUSES]
+    if not events:
+        return
+    if keys is None:
+        keys = _employee_keys({e['employee_id'] for e in events})
+
+    counts, absences = _event_counts(events, delta, keys)
+    _apply(DailyOccupancy, counts)
+    _apply(DailyAbsence, absences)
+
+
+def _headcount_counts(employees, delta):
+    """Изменения численности для [(department_id, work_mode, hire_date, termination_date)]."""
+    changes = Counter()
+    for department_id, work_mode, hire_date, termination_date in employees:
+        changes[(hire_date, department_id, work_mode)] += delta
+        if termination_date is not None:
+            changes[(termination_date + timedelta(days=1), department_id, work_mode)] -= delta
+    return changes
+
+
+def add_employees(employee_ids):
+    """Учитывает в численности новых сотрудников; вызывается после flush, до commit."""
+    _apply(HeadcountChange, _headcount_counts(_employee_keys(employee_ids).values(), +1))
+
+
+def event_snapshot(event):
+    """Поля EmployeePresence, от которых зависит агрегат."""
+    return {
+        'employee_id': event.employee_id,
+        'presence_type': event.presence_type,
+        'start_datetime': event.start_datetime,
+        'end_datetime': event.end_datetime,
+        'status': event.status,
+    }
+
+
+def record_change(before=None, after=None):
+    """Переносит в агрегат изменение одного события: снимок до и снимок после (None - нет события)."""
+    if before:
+        record_events([before], -1)
+    if after:
+        record_events([after], +1)
+
+
+def _employee_events(employee_id):
+    rows = db.session.query(EmployeePresence.presence_type, EmployeePresence.start_datetime,
+                            EmployeePresence.end_datetime, EmployeePresence.status) \
+        .filter(EmployeePresence.employee_id == employee_id,
+                EmployeePresence.status.in_(ACTIVE_STATUSES))
+    return [{'employee_id': employee_id, 'presence_type': t, 'start_datetime': s, 'end_datetime': e,
+             'status': st} for t, s, e, st in rows]
+
+
+def move_employee(employee_id, old_key, new_key):
+    """Переносит сотрудника и его события между (department_id, work_mode) при смене отдела или режима."""
+    old_key = (old_key[0] or NO_DEPARTMENT, old_key[1])
+    new_key = (new_key[0] or NO_DEPARTMENT, new_key[1])
+    if old_key == new_key:
+        return
+    _, _, hire_date, termination_date = _employee_keys([employee_id])[employee_id]
+    old_key += (hire_date, termination_date)
+    new_key += (hire_date, termination_date)
+    changes = _headcount_counts([old_key], -1)
+    changes.update(_headcount_counts([new_key], +1))
+    _apply(HeadcountChange, changes)
+    events = _employee_events(employee_id)
+    record_events(events, -1, keys={employee_id: old_key})
+    record_events(events, +1, keys={employee_id: new_key})
+
+
+def forget_employee(employee_id):
+    """Вычитает сотрудника и все его события перед его удалением."""
+    keys = _employee_keys([employee_id])
+    _apply(HeadcountChange, _headcount_counts(keys.values(), -1))
+    record_events(_employee_events(employee_id), -1, keys=keys)
+
+
+def rebuild():
+    """
+    Полностью пересчитывает агрегаты (daily_occupancy, daily_absences, headcount_changes)
+    по employee_presence и employees. Возвращает число строк daily_occupancy.
+    """
+    keys = {}
+    headcount = Counter()
+    rows = db.session.query(Employee.employee_id, Employee.main_department_id, Employee.work_mode,
+                            Employee.hire_date, Employee.termination_date).yield_per(10000)
+    for employee_id, department_id, work_mode, hire_date, termination_date in rows:
+        keys[employee_id] = (department_id or NO_DEPARTMENT, work_mode.value, hire_date, termination_date)
+        headcount.update(_headcount_counts([keys[employee_id]], +1))
+
+    counts, absences = Counter(), Counter()
+    rows = db.session.query(EmployeePresence.employee_id, EmployeePresence.presence_type,
+                            EmployeePresence.start_datetime, EmployeePresence.end_datetime) \
+        .filter(EmployeePresence.status.in_(ACTIVE_STATUSES)) \
+        .yield_per(10000)
+    for employee_id, presence_type, start, end in rows:
+        event = {'employee_id': employee_id, 'presence_type': presence_type,
+                 'start_datetime': start, 'end_datetime': end}
+        event_counts, event_absences = _event_counts([event], +1, keys)
+        counts.update(event_counts)
+        absences.update(event_absences)
+
+    for model, model_counts in ((DailyOccupancy, counts), (DailyAbsence, absences), (HeadcountChange, headcount)):
+        db.session.query(model).delete()
+        model_counts = {key: count for key, count in model_counts.items() if count}
+        if model_counts:
+            names = [column.name for column in model.__table__.primary_key.columns]
+            db.session.execute(model.__table__.insert(),
+                               [dict(zip(names, key), count=count) for key, count in model_counts.items()])
+    db.session.commit()
+    return len(counts)
+
+
+def _headcount(start_date, end_date, department_ids=None):
+    """
+    Численность на start_date и ее изменения внутри диапазона по агрегату headcount_changes:
+    (Counter{(department_id, work_mode): n}, {день: Counter{(department_id, work_mode): +-n}}).
+    """
+    base_query = db.session.query(HeadcountChange.department_id, HeadcountChange.work_mode,
+                                  func.sum(HeadcountChange.count)) \
+        .filter(HeadcountChange.day <= start_date) \
+        .group_by(HeadcountChange.department_id, HeadcountChange.work_mode)
+    changes_query = db.session.query(HeadcountChange.day, HeadcountChange.department_id, HeadcountChange.work_mode,
+                                     HeadcountChange.count) \
+        .filter(HeadcountChange.day > start_date, HeadcountChange.day <= end_date, HeadcountChange.count != 0)
+    if department_ids:
+        base_query = base_query.filter(HeadcountChange.department_id.in_(department_ids))
+        changes_query = changes_query.filter(HeadcountChange.department_id.in_(department_ids))
+
+    base = Counter({(department_id, work_mode): count for department_id, work_mode, count in base_query if count})
+    changes = defaultdict(Counter)
+    for day, department_id, work_mode, count in changes_query:
+        changes[day][(department_id, work_mode)] += count
+    return base, changes
+
+
+def _absentees(start_date, end_date, department_ids=None):
+    """Число разных отсутствующих людей по агрегату daily_absences: {(day, department_id): {work_mode: n}}."""
+    query = db.session.query(DailyAbsence.day, DailyAbsence.department_id, DailyAbsence.work_mode, func.count()) \
+        .filter(DailyAbsence.day.between(start_date, end_date), DailyAbsence.count > 0) \
+        .group_by(DailyAbsence.day, DailyAbsence.department_id, DailyAbsence.work_mode)
+    if department_ids:
+        query = query.filter(DailyAbsence.department_id.in_(department_ids))
+
+    absent = defaultdict(dict)
+    for day, department_id, work_mode, count in query:
+        absent[(day, department_id)][work_mode] = count
+    return absent
+
+
+def occupancy_report(start_date, end_date, department_ids=None, is_viewer_admin=False):
+    """
+    Сводка по дням и отделам: численность по режимам работы на каждый день,
+    число событий по типам и сколько людей каждого режима доступно, то есть
+    численность минус число разных отсутствующих сотрудников. Читает только
+    агрегаты, ни employees, ни employee_presence не трогает.
+    Не-админам приватные типы показываются общим 'absence'.
+    """
+    rollup_query = db.session.query(DailyOccupancy.day, DailyOccupancy.department_id,
+                                    DailyOccupancy.presence_type, DailyOccupancy.count) \
+        .filter(DailyOccupancy.day.between(start_date, end_date), DailyOccupancy.count != 0)
+    if department_ids:
+        rollup_query = rollup_query.filter(DailyOccupancy.department_id.in_(department_ids))
+
+    presence = defaultdict(Counter)  # (day, department_id) -> {presence_type: count}
+    departments_by_day = defaultdict(set)
+    for day, department_id, presence_type, count in rollup_query:
+        departments_by_day[day].add(department_id)
+        if presence_type in PRIVATE_PRESENCE_TYPES and not is_viewer_admin:
+            presence_type = 'absence'
+        presence[(day, department_id)][presence_type] += count
+
+    headcount, changes = _headcount(start_date, end_date, department_ids)  # (department_id, work_mode) -> n
+    departments = {department_id for department_id, _ in headcount}
+    departments.update(department_id for counts in changes.values() for department_id, _ in counts)
+    absent = _absentees(start_date, end_date, department_ids)
+
+    result = []
+    day = start_date
+    while day <= end_date:
+        headcount.update(changes.get(day, {}))
+        for department_id in sorted(departments | departments_by_day[day]):
+            key = (day, department_id)
+            modes = {mode.value: headcount[(department_id, mode.value)] for mode in WorkModeEnum}
+            away = absent.get(key, {})
+            result.append({
+                'date': day.isoformat(),
+                'department_id': department_id or None,
+                'headcount': modes,
+                'presence': dict(presence.get(key, {})),
+                'available': {mode: max(0, count - away.get(mode, 0)) for mode, count in modes.items()},
+            })
+        day += timedelta(days=1)
+    return result
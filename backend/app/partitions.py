@@ -0,0 +1,169 @@
+from datetime import date, datetime, timezone
+
+from sqlalchemy import text
+
+from . import db
+from .models import EmployeePresence
+
+# Секции employee_presence по годам start_datetime: employee_presence_y2025 и т.д.
+# Строки вне созданных секций попадают в секцию по умолчанию.
+PARTITION_PREFIX = 'employee_presence_y'
+DEFAULT_PARTITION = 'employee_presence_default'
+
+
+def year_bounds(year):
+    """[начало года, начало следующего) с часовым поясом - границы секции и архива."""
+    return datetime(year, 1, 1, tzinfo=timezone.utc), datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(year):
+    return f'{PARTITION_PREFIX}{year}'
+
+
+def is_partitioned():
+    """Секционирование есть только на PostgreSQL и только после convert_to_partitioned()."""
+    if db.engine.dialect.name != 'postgresql':
+        return False
+    return db.session.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = 'employee_presence' AND c.relnamespace = current_schema()::regnamespace)"
+    )).scalar()
+
+
+def list_partitions():
+    """[(имя секции, число строк по статистике)] по возрастанию имени."""
+    rows = db.session.execute(text(
+        "SELECT c.relname, c.reltuples::bigint FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'employee_presence' AND p.relnamespace = current_schema()::regnamespace "
+        "ORDER BY c.relname"
+    ))
+    return [(name, max(0, tuples)) for name, tuples in rows]
+
+
+def _create_partition(year, table='employee_presence'):
+    lo, hi = year_bounds(year)
+    db.session.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(year)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{lo.isoformat()}') TO ('{hi.isoformat()}')"
+    ))
+
+
+def ensure_partition(year):
+    """
+    Создает секцию года. Если строки этого года уже лежат в секции по умолчанию,
+    PostgreSQL не даст создать секцию поверх них - тогда строки переносятся
+    в новую таблицу, и она подключается как секция. Возвращает True, если секция создана.
+    """
+    name = partition_name(year)
+    if any(existing == name for existing, _ in list_partitions()):
+        return False
+
+    lo, hi = year_bounds(year)
+    window = {'lo': lo, 'hi': hi}
+    stray = db.session.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE start_datetime >= :lo AND start_datetime < :hi)"
+    ), window).scalar()
+    if not stray:
+        _create_partition(year)
+        return True
+
+    db.session.execute(text(f"CREATE TABLE {name} (LIKE employee_presence INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    db.session.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE start_datetime >= :lo AND start_datetime < :hi "
+        f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+    ), window)
+    db.session.execute(text(
+        f"ALTER TABLE employee_presence ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{lo.isoformat()}') TO ('{hi.isoformat()}')"
+    ))
+    return True
+
+
+def ensure_partitions(ahead=1, today=None):
+    """Секции на текущий год и ahead лет вперед; вызывать раз в год (CLI archive_presence.py ensure)."""
+    year = (today or date.today()).year
+    created = [y for y in range(year, year + ahead + 1) if ensure_partition(y)]
+    db.session.commit()
+    return created
+
+
+def convert_to_partitioned(ahead=1):
+    """
+    Переделывает существующую employee_presence в таблицу, секционированную по годам
+    start_datetime, одной транзакцией (таблица на это время заблокирована).
+
+    Первичный ключ секционированной таблицы обязан включать ключ секционирования,
+    поэтому в базе он становится (presence_id, start_datetime). ORM по-прежнему
+    считает ключом presence_id - значения уникальны, их выдает та же sequence.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        raise RuntimeError("Partitioning requires PostgreSQL")
+    if is_partitioned():
+        return []
+
+    bounds = db.session.execute(text(
+        "SELECT EXTRACT(YEAR FROM MIN(start_datetime))::int, EXTRACT(YEAR FROM MAX(start_datetime))::int "
+        "FROM employee_presence"
+    )).first()
+    sequence = db.session.execute(text("SELECT pg_get_serial_sequence('employee_presence', 'presence_id')")).scalar()
+    if sequence is None:
+        raise RuntimeError("employee_presence.presence_id must be a serial column")
+    this_year = date.today().year
+    first_year = bounds[0] or this_year
+    last_year = max(bounds[1] or this_year, this_year) + ahead
+
+    statements = [
+        "LOCK TABLE employee_presence IN ACCESS EXCLUSIVE MODE",
+        # Иначе sequence удалится вместе со старой таблицей
+        f"ALTER SEQUENCE {sequence} OWNED BY NONE",
+        "CREATE TABLE employee_presence_partitioned "
+        "(LIKE employee_presence INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (start_datetime)",
+        "ALTER TABLE employee_presence_partitioned ADD PRIMARY KEY (presence_id, start_datetime)",
+        f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF employee_presence_partitioned DEFAULT",
+    ]
+    for statement in statements:
+        db.session.execute(text(statement))
+    for year in range(first_year, last_year + 1):
+        _create_partition(year, table='employee_presence_partitioned')
+
+    for statement in [
+        "INSERT INTO employee_presence_partitioned SELECT * FROM employee_presence",
+        "DROP TABLE employee_presence",
+        "ALTER TABLE employee_presence_partitioned RENAME TO employee_presence",
+        "ALTER TABLE employee_presence RENAME CONSTRAINT employee_presence_partitioned_pkey TO employee_presence_pkey",
+        "ALTER TABLE employee_presence ADD FOREIGN KEY (employee_id) REFERENCES employees (employee_id)",
+        f"ALTER SEQUENCE {sequence} OWNED BY employee_presence.presence_id",
+    ]:
+        db.session.execute(text(statement))
+    # Индексы модели создаются на родительской таблице и наследуются всеми секциями
+    for index in EmployeePresence.__table__.indexes:
+        index.create(bind=db.session.connection())
+    db.session.commit()
+    return list(range(first_year, last_year + 1))
+
+
+def lock_year(year):
+    """
+    Запрещает запись в события года до конца транзакции, чтение не блокируется.
+    С секциями блокируется только секция года, без них - вся таблица.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return  # SQLite и так пропускает только одну пишущую транзакцию
+    name = partition_name(year)
+    if not any(existing == name for existing, _ in list_partitions()):
+        name = 'employee_presence'
+    db.session.execute(text(f"LOCK TABLE {name} IN SHARE MODE"))
+
+
+def drop_partition(year):
+    """
+    Отключает и удаляет секцию года; True, если она была. Строки года из секции
+    по умолчанию (если секцию так и не создали) удаляет вызывающий код.
+    """
+    name = partition_name(year)
+    if not any(existing == name for existing, _ in list_partitions()):
+        return False
+    db.session.execute(text(f"ALTER TABLE employee_presence DETACH PARTITION {name}"))
+    db.session.execute(text(f"DROP TABLE {name}"))
+    return True
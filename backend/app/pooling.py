@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool, который считает время ожидания свободного соединения.
+    Ожидание возникает, когда заняты все pool_size + max_overflow соединений.
+    """
+
+    # Накопительные поля stats(): в Prometheus они отдаются как counter
+    COUNTERS = ('checkouts', 'timeouts', 'wait_seconds_total')
+
+    def __init__(self, creator, pool_size=5, max_overflow=10, **kwargs):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kwargs)
+        self.overflow_limit = max_overflow
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def stats(self):
+        capacity = self.size() + max(0, self.overflow_limit)
+        with self._stats_lock:
+            return {
+                'pool_size': self.size(),
+                'max_overflow': self.overflow_limit,
+                'checked_out': self.checkedout(),
+                'idle': self.checkedin(),
+                'overflow': max(0, self.overflow()),
+                'utilization': round(self.checkedout() / capacity, 4) if capacity > 0 else None,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds_total': round(self.wait_seconds, 6),
+                'max_wait_seconds': round(self.max_wait_seconds, 6),
+            }
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, default).lower() in ('1', 'true', 'yes', 'on')
+
+
+def engine_options(url):
+    """
+    Параметры пула соединений из окружения: DB_POOL_SIZE, DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING. Для SQLite пул
+    оставляем на усмотрение Flask-SQLAlchemy.
+    """
+    if not url or make_url(url).get_backend_name() == 'sqlite':
+        return {}
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        # Соединения старше recycle секунд переоткрываются (защита от обрыва по таймауту сервера)
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': _env_flag('DB_POOL_PRE_PING', 'true'),
+    }
+
+
+def pool_stats(engines):
+    """Метрики пулов по привязкам: {'primary': {...}, 'replica_0': {...}}."""
+    result = {}
+    for bind_key, engine in engines.items():
+        pool = engine.pool
+        name = bind_key or 'primary'
+        if isinstance(pool, TimedQueuePool):
+            result[name] = pool.stats()
+        else:
+            result[name] = {'pool': pool.status()}
+    return result
@@ -0,0 +1,311 @@
+import csv
+import io
+import logging
+import threading
+import time
+from datetime import date, datetime
+
+from . import changelog, db, occupancy
+from .cache import calendar_cache, credential_cache, membership_cache
+from .conflicts import batch_conflicts
+from .intervals import wall_clock
+from .models import ALLOWED_EVENT_TYPES, APPROVAL_REQUIRED_TYPES, MAX_EVENT_DAYS, Employee, EmployeePresence
+from .pubsub import broker
+from .versions import bump_versions, sync_statement
+
+# Размер пачки для массового импорта: одна транзакция и один INSERT/COPY на пачку
+IMPORT_CHUNK_SIZE = 5000
+
+CSV_COLUMNS = ['employee_id', 'event_type', 'start_date', 'end_date', 'comment']
+_COPY_COLUMNS = ['employee_id', 'presence_type', 'start_datetime', 'end_datetime', 'status', 'comment']
+
+log = logging.getLogger(__name__)
+
+
+def parse_event_payload(data, is_admin, current_user_id):
+    """
+    Проверяет данные нового события по правилам create_event.
+    Возвращает (поля EmployeePresence, None) или (None, (сообщение, HTTP-код)).
+    """
+    target_employee_id = data.get('employee_id') or current_user_id
+    try:
+        target_employee_id = int(target_employee_id)
+    except (TypeError, ValueError):
+        return None, ("Invalid employee_id", 400)
+
+    # current_user_id приходит из JWT строкой
+    if not is_admin and target_employee_id != int(current_user_id):
+        return None, ("You can only create events for yourself", 403)
+
+    event_type = data.get('event_type')
+    if event_type not in ALLOWED_EVENT_TYPES:
+        return None, (f"Invalid event_type. Allowed types: {list(ALLOWED_EVENT_TYPES)}", 400)
+
+    start_date_str = data.get('start_date')
+    end_date_str = data.get('end_date')
+    if not start_date_str or not end_date_str:
+        return None, ("Dates required", 400)
+    try:
+        # Событие занимает календарные дни: смещение, если его прислали, отбрасываем,
+        # чтобы все время в приложении было одного вида (см. wall_clock)
+        start_datetime = wall_clock(datetime.fromisoformat(start_date_str))
+        end_datetime = wall_clock(datetime.fromisoformat(end_date_str)).replace(hour=23, minute=59, second=59)
+    except (TypeError, ValueError):
+        return None, ("Invalid date format. Use YYYY-MM-DD.", 400)
+    if end_datetime < start_datetime:
+        return None, ("end_date must not be earlier than start_date", 400)
+    if (end_datetime.date() - start_datetime.date()).days >= MAX_EVENT_DAYS:
+        return None, (f"Event must not be longer than {MAX_EVENT_DAYS} days", 400)
+
+    return {
+        'employee_id': target_employee_id,
+        'presence_type': event_type,
+        'start_datetime': start_datetime,
+        'end_datetime': end_datetime,
+        # определяем статус на основе типа события
+        'status': 'planned' if event_type in APPROVAL_REQUIRED_TYPES else 'completed',
+        'comment': data.get('comment') or None,
+    }, None
+
+
+def invalidate_presence_views(ranges=None):
+    """
+    Сбрасывает кэш календаря после записи в employee_presence. ranges - список
+    затронутых (start_datetime, end_datetime); None означает "все диапазоны".
+    """
+    if ranges is None:
+        calendar_cache.clear()
+        return
+    for start, end in ranges:
+        calendar_cache.invalidate_range(start.date(), end.date())
+
+
+def notify_presence(kind, event=None, **extra):
+    """
+    Рассылает подписчикам /api/events/stream уведомление об изменении после commit.
+    event - немаскированный словарь события, маскируется под каждого получателя.
+    Ошибка рассылки не должна ломать уже выполненную запись.
+    """
+    message = dict(extra, type=kind, event=event)
+    try:
+        broker.publish(message, engine=db.engine)
+    except Exception:
+        log.exception("failed to publish %s notification", kind)
+
+
+def apply_notification(message):
+    """
+    Сбрасывает кэши этого процесса по уведомлению о записи, сделанной любым процессом
+    (обработчик broker.add_handler). Пишущий процесс сбрасывает свои кэши сам, повторный
+    сброс безвреден; остальные веб-воркеры и записи фоновых задач видны только так.
+    """
+    kind = message.get('type')
+    if kind == 'employee_deleted':
+        credential_cache.invalidate_employee(message['employee_id'])
+        membership_cache.clear()
+        invalidate_presence_views()
+    elif kind == 'employee_updated':
+        # Email, пароль, роль или состав команд; имя входит в события календаря
+        credential_cache.invalidate_employee(message['employee_id'])
+        membership_cache.clear()
+        if message.get('name_changed'):
+            invalidate_presence_views()
+    elif kind == 'employees_created':
+        membership_cache.clear()
+    elif message.get('event') or kind in ('imported', 'archived'):
+        # У события, импорта и архивации даты диапазона лежат в одних и тех же полях
+        span = message.get('event') or message
+        calendar_cache.invalidate_range(date.fromisoformat(span['start_date']),
+                                        date.fromisoformat(span['end_date']))
+
+
+class CacheSync:
+    """
+    Сверка кэшей процесса с базой, когда уведомлений между процессами нет
+    (PUBSUB_BACKEND=memory, например SQLite с worker.py). Не чаще раза в interval
+    секунд процесс читает sync_statement(): изменился счетчик сотрудников - сбрасываются
+    кэши составов и учетных данных. Кэш календаря помечен счетчиками версий и в сверке
+    не нуждается.
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._seen = None
+
+    def configure(self, interval=None):
+        with self._lock:
+            if interval is not None:
+                self.interval = interval
+            self._checked_at = None
+            self._seen = None
+
+    def due(self):
+        """True, если пора сверяться; отмечает сверку, чтобы параллельные запросы ее не повторяли."""
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.interval:
+                return False
+            self._checked_at = now
+            return True
+
+    def apply(self, employees):
+        """Сбрасывает кэши по счетчику, прочитанному sync_statement()."""
+        with self._lock:
+            seen, self._seen = self._seen, employees
+        if seen is None:
+            return  # первая сверка процесса: кэши еще пусты
+        if employees != seen:
+            credential_cache.clear()
+            membership_cache.clear()
+
+    def check(self):
+        """Сверка в синхронном запросе (before_request)."""
+        if self.due():
+            self.apply(db.session.execute(sync_statement()).scalar_one())
+
+
+cache_sync = CacheSync()
+
+
+def read_bulk_payload(req):
+    """
+    Достает список событий из запроса: JSON-массив, CSV в теле (text/csv)
+    или CSV-файл в multipart-поле file. Возвращает (список словарей, ошибка).
+    """
+    if 'file' in req.files:
+        text = req.files['file'].read().decode('utf-8-sig')
+    elif req.mimetype == 'text/csv':
+        text = req.get_data(as_text=True)
+    else:
+        items = req.get_json(silent=True)
+        if not isinstance(items, list):
+            return None, "Expected a JSON array of events or a CSV upload"
+        return items, None
+
+    reader = csv.DictReader(io.StringIO(text))
+    missing = set(CSV_COLUMNS[:4]) - set(reader.fieldnames or [])
+    if missing:
+        return None, f"CSV is missing columns: {sorted(missing)}"
+    return list(reader), None
+
+
+def _copy_rows(rows):
+    """COPY ... FROM STDIN через psycopg2 в текущей транзакции сессии. False, если драйвер не умеет COPY."""
+    cursor = db.session.connection().connection.cursor()
+    if not hasattr(cursor, 'copy_expert'):
+        return False
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in _COPY_COLUMNS])
+    buffer.seek(0)
+
+    table = EmployeePresence.__tablename__
+    cursor.copy_expert(f"COPY {table} ({', '.join(_COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    return True
+
+
+def insert_presence_rows(rows):
+    """Вставляет пачку событий одной командой: COPY на PostgreSQL, иначе многострочный INSERT."""
+    if db.session.get_bind().dialect.name == 'postgresql' and _copy_rows(rows):
+        return
+    db.session.execute(EmployeePresence.__table__.insert(), rows)
+
+
+def import_events(items, is_admin, current_user_id):
+    """
+    Массовый импорт событий пачками по IMPORT_CHUNK_SIZE, каждая пачка - отдельная транзакция.
+    Возвращает (число вставленных строк, список ошибок вида {'row': N, 'msg': ...}),
+    где N - номер строки во входных данных, начиная с 1.
+    """
+    inserted = 0
+    errors = []
+
+    for chunk_start in range(0, len(items), IMPORT_CHUNK_SIZE):
+        chunk = items[chunk_start:chunk_start + IMPORT_CHUNK_SIZE]
+
+        valid = []
+        for offset, item in enumerate(chunk):
+            row_number = chunk_start + offset + 1
+            if not isinstance(item, dict):
+                errors.append({'row': row_number, 'msg': "Event must be an object"})
+                continue
+            fields, error = parse_event_payload(item, is_admin, current_user_id)
+            if error:
+                errors.append({'row': row_number, 'msg': error[0]})
+                continue
+            valid.append((row_number, fields))
+
+        # Существование сотрудников проверяем одним запросом на пачку
+        employee_ids = {fields['employee_id'] for _, fields in valid}
+        existing = {e for (e,) in db.session.query(Employee.employee_id)
+                    .filter(Employee.employee_id.in_(employee_ids))} if employee_ids else set()
+        known = []
+        for row_number, fields in valid:
+            if fields['employee_id'] not in existing:
+                errors.append({'row': row_number, 'msg': f"Employee with id {fields['employee_id']} not found."})
+            else:
+                known.append((row_number, fields))
+
+        # Отсутствия не должны пересекаться ни с базой, ни между собой внутри импорта;
+        # прошлые пачки уже в базе, так что их видит запрос следующей пачки
+        row_numbers, rows = [], []
+        for (row_number, fields), conflicts in zip(known, batch_conflicts(known)):
+            if conflicts:
+                errors.append({'row': row_number, 'msg': "Overlaps existing absence", 'conflicts': conflicts})
+            else:
+                row_numbers.append(row_number)
+                rows.append(fields)
+
+        if not rows:
+            continue
+
+        try:
+            # COPY не возвращает id - новые строки журнал находит по отметке до вставки
+            last_presence_id = changelog.max_presence_id()
+            insert_presence_rows(rows)
+            changelog.log_inserted_after(last_presence_id)
+            occupancy.record_events(rows, +1)
+            bump_versions([(row['start_datetime'], row['end_datetime']) for row in rows])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            errors.extend({'row': row_number, 'msg': f"Chunk insert failed: {e.__class__.__name__}"}
+                          for row_number in row_numbers)
+            continue
+
+        # Кэш календаря сбрасываем по охватывающему диапазону пачки, а не по каждой строке
+        lo = min(row['start_datetime'] for row in rows)
+        hi = max(row['end_datetime'] for row in rows)
+        invalidate_presence_views([(lo, hi)])
+        inserted += len(rows)
+        notify_presence('imported', count=len(rows), start_date=lo.date().isoformat(), end_date=hi.date().isoformat())
+
+    errors.sort(key=lambda error: error['row'])
+    return inserted, errors
+
+
+def check_events(items, is_admin, current_user_id):
+    """
+    Проверка предложенных событий без записи, по тем же правилам, что и import_events.
+    Возвращает [{'row': N, 'ok': bool, 'conflicts': [...]}] или {'row': N, 'msg': ...}
+    для строк, не прошедших проверку полей.
+    """
+    report, valid = [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            report.append({'row': index + 1, 'msg': "Event must be an object"})
+            continue
+        fields, error = parse_event_payload(item, is_admin, current_user_id)
+        if error:
+            report.append({'row': index + 1, 'msg': error[0]})
+        else:
+            valid.append((index + 1, fields))
+
+    for (row_number, _), conflicts in zip(valid, batch_conflicts(valid)):
+        report.append({'row': row_number, 'ok': not conflicts, 'conflicts': conflicts})
+    report.sort(key=lambda entry: entry['row'])
+    return report
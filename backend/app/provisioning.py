@@ -0,0 +1,312 @@
+import base64
+import hashlib
+
+from cryptography.fernet import Fernet, InvalidToken
+from flask import current_app
+
+from . import changelog, db, occupancy
+from .cache import credential_cache, membership_cache
+from .hashing import hash_passwords
+from .presence import invalidate_presence_views, notify_presence
+from .schedule import dump_schedule, is_structured, schedule_error
+from .versions import bump_employees, bump_versions
+from .models import Employee, Position, Department, Team, Project, EmployeeProject, RoleEnum, WorkModeEnum
+
+# Сколько сотрудников сохраняется в одной транзакции
+PROVISION_CHUNK_SIZE = 500
+
+# Одиночные ссылки payload'а: (поле, таблица в resolve_references(), имя в тексте ошибки)
+_SINGLE_REFERENCES = (
+    ('position_id', 'positions', 'Position'),
+    ('main_department_id', 'departments', 'Department'),
+    ('main_team_id', 'teams', 'Team'),
+)
+
+
+def _load_by_ids(model, pk_column, ids):
+    """Загружает объекты одним IN-запросом, возвращает словарь id -> объект."""
+    if not ids:
+        return {}
+    return {getattr(obj, pk_column.key): obj for obj in model.query.filter(pk_column.in_(ids))}
+
+
+def _is_id(value):
+    """id в payload'е - целое число (bool в Python тоже int, но id не бывает)."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _id_list(value):
+    """Элементы списка id; значения неверного типа пропускаются - о них сообщит reference_errors()."""
+    return [item for item in value if _is_id(item)] if isinstance(value, list) else []
+
+
+def _project_list(value):
+    """Элементы списка projects, похожие на участие в проекте; остальное - как в _id_list()."""
+    return [item for item in value if isinstance(item, dict)] if isinstance(value, list) else []
+
+
+def resolve_references(items):
+    """
+    Собирает все id должностей, отделов, команд и проектов из списка
+    payload'ов и загружает каждую таблицу одним запросом.
+    """
+    position_ids, department_ids, team_ids, project_ids = set(), set(), set(), set()
+    for data in items:
+        if _is_id(data.get('position_id')):
+            position_ids.add(data['position_id'])
+        if _is_id(data.get('main_department_id')):
+            department_ids.add(data['main_department_id'])
+        if _is_id(data.get('main_team_id')):
+            team_ids.add(data['main_team_id'])
+        department_ids.update(_id_list(data.get('additional_department_ids')))
+        project_ids.update(p['project_id'] for p in _project_list(data.get('projects')) if _is_id(p.get('project_id')))
+
+    return {
+        'positions': _load_by_ids(Position, Position.position_id, position_ids),
+        'departments': _load_by_ids(Department, Department.department_id, department_ids),
+        'teams': _load_by_ids(Team, Team.team_id, team_ids),
+        'projects': _load_by_ids(Project, Project.project_id, project_ids),
+    }
+
+
+def reference_errors(data, refs):
+    """
+    Проверяет ссылки payload'а по результату resolve_references() без обращений к базе,
+    а заодно формат структурированного расписания. Возвращает список всех ошибок сразу
+    (пустой, если всё в порядке). Значения неверного типа - тоже ошибки, а не исключения.
+    """
+    missing = []
+    for key, table, name in _SINGLE_REFERENCES:
+        value = data.get(key)
+        if not value:
+            continue
+        if not _is_id(value):
+            missing.append(f"{key} must be an integer")
+        elif value not in refs[table]:
+            missing.append(f"{name} with id {value} not found.")
+
+    department_ids = data.get('additional_department_ids') or []
+    if department_ids != _id_list(department_ids):
+        missing.append("additional_department_ids must be a list of integers")
+    for dept_id in _id_list(department_ids):
+        if dept_id not in refs['departments']:
+            missing.append(f"Department with id {dept_id} not found.")
+
+    projects = data.get('projects') or []
+    if projects != _project_list(projects):
+        missing.append("projects must be a list of objects")
+    for proj_data in _project_list(projects):
+        if not _is_id(proj_data.get('project_id')):
+            missing.append("project_id must be an integer")
+        elif proj_data['project_id'] not in refs['projects']:
+            missing.append(f"Project with id {proj_data['project_id']} not found.")
+        percentage = proj_data.get('participation_percentage', 0)
+        if not isinstance(percentage, int) or not 0 < percentage <= 100 or percentage % 10:
+            missing.append("participation_percentage must be 10..100 in steps of 10")
+    error = schedule_error(data.get('work_schedule'))
+    if error:
+        missing.append(error)
+    return missing
+
+
+def apply_memberships(employee, data, refs):
+    """
+    Приводит дополнительные отделы и проекты сотрудника к наборам из payload'а.
+    Сравнивает с текущими связями: неизменные строки не трогает, лишние удаляет,
+    недостающие добавляет, у оставшихся проектов обновляет процент участия.
+    """
+    if 'additional_department_ids' in data:
+        wanted = set(data['additional_department_ids'] or [])
+        for department in list(employee.departments):
+            if department.department_id not in wanted:
+                employee.departments.remove(department)
+            else:
+                wanted.discard(department.department_id)
+        for dept_id in data['additional_department_ids'] or []:
+            if dept_id in wanted:
+                employee.departments.append(refs['departments'][dept_id])
+                wanted.discard(dept_id)
+
+    # Участие в проектах (ожидаем список объектов: [{"project_id": X, "participation_percentage": Y}])
+    if 'projects' in data:
+        wanted = {p['project_id']: p['participation_percentage'] for p in data['projects'] or []}
+        for association in list(employee.projects_association):
+            if association.project_id not in wanted:
+                employee.projects_association.remove(association)  # delete-orphan удалит строку
+                continue
+            percentage = wanted.pop(association.project_id)
+            if association.participation_percentage != percentage:
+                association.participation_percentage = percentage
+        for project_id, percentage in wanted.items():
+            employee.projects_association.append(EmployeeProject(
+                project=refs['projects'][project_id],
+                participation_percentage=percentage
+            ))
+
+
+def _validate(data, refs, taken_emails):
+    """Проверяет один payload массового создания; возвращает текст ошибки или None."""
+    if not all(data.get(k) for k in ['email', 'password', 'full_name']):
+        return "Missing required fields: email, password, full_name"
+    if not all(isinstance(data[k], str) for k in ['email', 'password', 'full_name']):
+        return "email, password and full_name must be strings"
+    if data['email'] in taken_emails:
+        return "User with this email already exists"
+    try:
+        RoleEnum(data.get('role', 'user'))
+        WorkModeEnum(data.get('work_mode', 'office'))
+    except ValueError:
+        return "Invalid role or work_mode"
+    return ' '.join(reference_errors(data, refs)) or None
+
+
+def build_employee(data, password_hash, refs):
+    """Создает нового сотрудника со всеми связями; ссылки уже проверены reference_errors()."""
+    employee = Employee(
+        email=data['email'],
+        full_name=data['full_name'],
+        password_hash=password_hash,
+        role=RoleEnum(data.get('role', 'user')),
+        work_mode=WorkModeEnum(data.get('work_mode', 'office')),
+        work_schedule=dump_schedule(data.get('work_schedule')),
+        position_id=data.get('position_id'),
+        main_department_id=data.get('main_department_id'),
+        main_team_id=data.get('main_team_id')
+    )
+    apply_memberships(employee, data, refs)
+    return employee
+
+
+def _job_fernet():
+    """Шифр паролей в очереди задач; ключ выводится из SECRET_KEY, общего для веба и worker.py."""
+    key = hashlib.sha256(b'job-passwords:' + current_app.config['SECRET_KEY'].encode()).digest()
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+def seal_passwords(items):
+    """
+    Заменяет в payload'ах пароль зашифрованным (password -> password_sealed), чтобы пакет
+    можно было сохранить в очереди задач без открытого текста; хэширует пароли уже задача.
+    Присланные клиентом password_sealed и password_hash отбрасываются.
+    """
+    fernet = _job_fernet()
+    sealed = []
+    for data in items:
+        if not isinstance(data, dict):
+            sealed.append(data)
+            continue
+        password = data.get('password')
+        sealed.append({k: v for k, v in data.items() if k not in ('password', 'password_sealed', 'password_hash')})
+        if isinstance(password, str) and password:
+            sealed[-1]['password_sealed'] = fernet.encrypt(password.encode()).decode()
+    return sealed
+
+
+def unseal_passwords(items):
+    """
+    Обратное seal_passwords: password_sealed -> password. Строка с поддельным шифром
+    остается без пароля и получит обычную ошибку проверки.
+    """
+    fernet = _job_fernet()
+    unsealed = []
+    for data in items:
+        if not isinstance(data, dict):
+            unsealed.append(data)
+            continue
+        data = dict(data)
+        sealed = data.pop('password_sealed', None)
+        data.pop('password', None)
+        try:
+            data['password'] = fernet.decrypt(sealed.encode()).decode() if isinstance(sealed, str) else None
+        except InvalidToken:
+            data['password'] = None
+        unsealed.append(data)
+    return unsealed
+
+
+def provision_employees(items):
+    """
+    Массовое создание сотрудников по payload'ам формата create_user.
+
+    Ссылки проверяются одним IN-запросом на таблицу, пароли хэшируются
+    параллельно в пуле процессов, сотрудники сохраняются пачками
+    по PROVISION_CHUNK_SIZE. Возвращает (созданные [{'row', 'id'}], ошибки [{'row', 'msg'}]).
+    """
+    created, errors = [], []
+
+    valid = []
+    for index, data in enumerate(items):
+        if not isinstance(data, dict):
+            errors.append({'row': index + 1, 'msg': "User must be an object"})
+        else:
+            valid.append((index + 1, data))
+
+    refs = resolve_references([data for _, data in valid])
+    emails = [data['email'] for _, data in valid if data.get('email') and isinstance(data['email'], str)]
+    taken_emails = {e for (e,) in db.session.query(Employee.email).filter(Employee.email.in_(emails))} \
+        if emails else set()
+
+    accepted = []
+    for row_number, data in valid:
+        error = _validate(data, refs, taken_emails)
+        if error:
+            errors.append({'row': row_number, 'msg': error})
+            continue
+        # Повторный email внутри того же пакета тоже конфликт
+        taken_emails.add(data['email'])
+        accepted.append((row_number, data))
+
+    password_hashes = hash_passwords(data['password'] for _, data in accepted)
+
+    for chunk_start in range(0, len(accepted), PROVISION_CHUNK_SIZE):
+        chunk = accepted[chunk_start:chunk_start + PROVISION_CHUNK_SIZE]
+        chunk_hashes = password_hashes[chunk_start:chunk_start + PROVISION_CHUNK_SIZE]
+        try:
+            with db.session.no_autoflush:
+                employees = [build_employee(data, password_hash, refs)
+                             for (_, data), password_hash in zip(chunk, chunk_hashes)]
+            db.session.add_all(employees)
+            if any(is_structured(employee.work_schedule) for employee in employees):
+                # Расписания новых сотрудников появятся в календаре
+                bump_versions()
+            db.session.flush()
+            # id читаем до commit: после него объекты истекают и каждый id стоил бы SELECT
+            employee_ids = [employee.employee_id for employee in employees]
+            occupancy.add_employees(employee_ids)
+            bump_employees()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            errors.extend({'row': row_number, 'msg': f"Chunk insert failed: {e.__class__.__name__}"}
+                          for row_number, _ in chunk)
+            # После rollback справочники отсоединены от состояния - загружаем заново
+            refs = resolve_references([data for _, data in accepted[chunk_start + PROVISION_CHUNK_SIZE:]])
+            continue
+        created.extend({'row': row_number, 'id': employee_id}
+                       for (row_number, _), employee_id in zip(chunk, employee_ids))
+
+    errors.sort(key=lambda error: error['row'])
+    return created, errors
+
+
+def remove_employee(employee_id):
+    """
+    Удаляет сотрудника вместе с его событиями и участием в проектах (каскад ORM)
+    и сбрасывает все производные данные. False, если сотрудника нет.
+    """
+    employee = db.session.get(Employee, employee_id)
+    if not employee:
+        return False
+
+    occupancy.forget_employee(employee_id)
+    changelog.log_employee_events(employee_id, changelog.DELETE)
+    db.session.delete(employee)
+    bump_versions()
+    bump_employees()
+    db.session.commit()
+    credential_cache.invalidate_employee(employee_id)
+    membership_cache.clear()
+    # Вместе с сотрудником каскадно удалены все его события
+    invalidate_presence_views()
+    notify_presence('employee_deleted', employee_id=employee_id)
+    return True
@@ -0,0 +1,151 @@
+import json
+import logging
+import queue
+import select
+import threading
+import time
+
+from sqlalchemy import text
+
+log = logging.getLogger(__name__)
+
+# Канал PostgreSQL LISTEN/NOTIFY для рассылки между воркерами
+NOTIFY_CHANNEL = 'presence_events'
+
+
+class Subscription:
+    """Очередь уведомлений одного подключенного клиента."""
+
+    def __init__(self, maxsize):
+        self._queue = queue.Queue(maxsize)
+        self.closed = False
+
+    def get(self, timeout):
+        """Следующее уведомление или None, если за timeout секунд ничего не пришло."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def put(self, message):
+        """False, если клиент не успевает читать и очередь переполнена."""
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except queue.Full:
+            return False
+
+
+class Broker:
+    """
+    Pub/sub уведомлений о событиях календаря внутри процесса.
+
+    Каждый клиент SSE получает свою очередь. Медленный клиент, у которого
+    переполнилась очередь, отключается: браузер переподключится сам и догонит
+    пропущенное через /api/calendar/changes.
+
+    С backend='postgres' публикация идет через pg_notify, а один поток-слушатель
+    на процесс раздает пришедшие уведомления локальным подписчикам - так их
+    получают клиенты всех воркеров, а не только того, что обработал запись.
+    Тот же поток вызывает обработчики add_handler() - ими процесс сбрасывает
+    свои кэши после записей других процессов (в том числе worker.py).
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.backend = 'memory'
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._engine = None
+        self._listener = None
+        self._handlers = []
+
+    def configure(self, backend=None, queue_size=None):
+        if backend is not None:
+            if backend not in ('memory', 'postgres'):
+                raise ValueError(f"Unknown pubsub backend: {backend}")
+            self.backend = backend
+        if queue_size is not None:
+            self.queue_size = queue_size
+
+    def add_handler(self, handler):
+        """handler(message) вызывается для каждого уведомления, пришедшего через LISTEN."""
+        if handler not in self._handlers:
+            self._handlers.append(handler)
+
+    def listen(self, engine):
+        """Запускает поток-слушатель процесса, если он еще не запущен (только backend='postgres')."""
+        if self.backend == 'postgres':
+            self._ensure_listener(engine)
+
+    def subscribe(self, engine=None):
+        if self.backend == 'postgres':
+            self._ensure_listener(engine)
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.closed = True
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, message, engine=None):
+        """Рассылает уведомление (словарь, сериализуемый в JSON). Вызывать после commit."""
+        if self.backend == 'postgres':
+            with engine.connect() as conn:
+                conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                             {'channel': NOTIFY_CHANNEL, 'payload': json.dumps(message)})
+                conn.commit()
+            return
+        self._dispatch(message)
+
+    def _dispatch(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if not subscription.put(message):
+                self.unsubscribe(subscription)
+
+    def _handle(self, message):
+        for handler in self._handlers:
+            try:
+                handler(message)
+            except Exception:
+                log.exception("pubsub handler failed for %s", message.get('type'))
+
+    def _ensure_listener(self, engine):
+        with self._lock:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            self._engine = engine
+            self._listener = threading.Thread(target=self._listen, name='pubsub-listener', daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        """LISTEN на отдельном соединении вне пула; при обрыве переподключается."""
+        while True:
+            try:
+                raw = self._engine.raw_connection()
+                conn = raw.driver_connection
+                raw.detach()  # соединение больше не вернется в пул
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+                while True:
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        message = json.loads(conn.notifies.pop(0).payload)
+                        self._handle(message)
+                        self._dispatch(message)
+            except Exception:
+                log.exception("pubsub listener failed, reconnecting")
+                time.sleep(1)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+
+broker = Broker()
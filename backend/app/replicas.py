@@ -0,0 +1,121 @@
+import random
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_request_context
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+
+class ReplicaRouter:
+    """
+    Выбор реплики для читающих маршрутов и "липкость" к основной базе.
+
+    После собственной записи пользователь sticky_seconds читает с основной базы,
+    чтобы не увидеть реплику, которая еще не догнала его изменение. Отметки
+    хранятся в памяти процесса: у каждого воркера свои, как и у остальных кэшей.
+    """
+
+    def __init__(self, sticky_seconds=5):
+        self.binds = []
+        self.sticky_seconds = sticky_seconds
+        self._until = {}  # employee_id -> monotonic-время окончания липкости
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+    def configure(self, binds=None, sticky_seconds=None):
+        with self._lock:
+            if binds is not None:
+                self.binds = list(binds)
+            if sticky_seconds is not None:
+                self.sticky_seconds = sticky_seconds
+            self._until.clear()
+
+    def stick(self, employee_id):
+        """Отправляет чтения пользователя на основную базу на sticky_seconds."""
+        now = time.monotonic()
+        with self._lock:
+            self._last_write = now
+            if employee_id is not None:
+                self._until[str(employee_id)] = now + self.sticky_seconds
+                # Чистим истекшие отметки, чтобы словарь не рос
+                if len(self._until) > 10000:
+                    self._until = {k: v for k, v in self._until.items() if v > now}
+
+    def is_sticky(self, employee_id):
+        with self._lock:
+            return self._until.get(str(employee_id), 0) > time.monotonic()
+
+    def recently_written(self):
+        """Была ли в этом процессе запись за последние sticky_seconds (реплика могла отстать)."""
+        with self._lock:
+            return time.monotonic() - self._last_write < self.sticky_seconds
+
+    def choose(self, employee_id):
+        """Ключ привязки реплики для чтения или None - читать с основной базы."""
+        if not self.binds or self.is_sticky(employee_id):
+            return None
+        return random.choice(self.binds)
+
+
+replica_router = ReplicaRouter()
+
+
+def read_only():
+    """
+    Маршрут только читает: запросы сессии идут на реплику, если она настроена.
+    Ставится под jwt_required/admin_required - нужен идентификатор пользователя.
+    """
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            g.replica_bind = replica_router.choose(get_jwt_identity())
+            return fn(*args, **kwargs)
+        return decorator
+    return wrapper
+
+
+def on_replica():
+    """Идут ли запросы текущего HTTP-запроса на реплику."""
+    return has_request_context() and g.get('replica_bind') is not None
+
+
+class RoutingSession(Session):
+    """Сессия Flask-SQLAlchemy, которая в маршрутах с read_only() читает с реплики."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and on_replica():
+            return self._db.engines[g.replica_bind]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _current_identity():
+    try:
+        return get_jwt_identity()
+    except RuntimeError:  # вне запроса или без проверенного JWT
+        return None
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _remember_flush(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _remember_bulk_write(orm_execute_state):
+    # INSERT/UPDATE/DELETE через session.execute() проходят мимо flush
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_after_write(session):
+    if session.info.pop('wrote', False):
+        replica_router.stick(_current_identity() if has_request_context() else None)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_write(session):
+    session.info.pop('wrote', None)
@@ -1,25 +1,233 @@
+import base64
+import json
 from datetime import datetime
-from .models import ALLOWED_EVENT_TYPES, APPROVAL_REQUIRED_TYPES
+from .models import ACTIVE_STATUSES, APPROVAL_REQUIRED_TYPES, BLOCKING_STATUSES
 from datetime import datetime
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context, url_for
 from . import db
-from .models import Employee, RoleEnum, Position, Department, Team, Project, EmployeeProject, EmployeePresence
+from .models import Employee, RoleEnum, WorkModeEnum, EmployeePresence, Job, mask_presence, Project, Team
 from .decorators import admin_required
+from .intervals import date_window, filter_overlapping, range_overlaps
+from .cache import calendar_cache, credential_cache, feed_cache, membership_cache
+from .hashing import PasswordVerifier, password_verifier, VerifierBusy
+from .versions import bump_employees, bump_versions, calendar_etag, calendar_versions, events_etag, feed_etag, \
+    range_version
+from . import archive, availability, changelog, conflicts, ics, occupancy, partitions, schedule
+from .jobs import job_queue
+from .provisioning import apply_memberships, build_employee, provision_employees, seal_passwords, \
+    reference_errors, remove_employee, resolve_references
+from .presence import check_events, import_events, invalidate_presence_views, notify_presence, \
+    parse_event_payload, read_bulk_payload
+from .pubsub import broker
+from .pooling import TimedQueuePool, pool_stats
+from .metrics import PROMETHEUS_MIMETYPE, metrics, serialization_timer
+from .serializers import PRESENCE_ROW_COLUMNS, PresenceEncoder, fast_json_enabled
+from .replicas import on_replica, read_only, replica_router
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
-from sqlalchemy import or_
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import joinedload
 
 bp = Blueprint('api', __name__, url_prefix='/api')
 
+MAX_PAGE_LIMIT = 1000
+# Размер страницы /users: по умолчанию и наибольший
+USERS_PER_PAGE = 50
+MAX_USERS_PER_PAGE = 200
+NDJSON_MIMETYPE = 'application/x-ndjson'
+NDJSON_BATCH_SIZE = 1000
+MAX_OCCUPANCY_DAYS = 366
+MAX_AVAILABILITY_DAYS = 366
+MAX_CHANGES_LIMIT = 5000
+MAX_CHECK_ITEMS = 1000
+# Фильтры календаря по составу: /calendar/events?team_id=3&project_id=7
+SCOPE_FILTERS = ('team_id', 'department_id', 'project_id')
+# Окно, в котором календарь разворачивает повторяющиеся расписания (include_schedule=1)
+MAX_SCHEDULE_DAYS = 366
+# Сколько задач отдает /admin/jobs за раз
+MAX_JOBS_LIMIT = 200
+# Комментарий-пинг в потоке SSE, чтобы прокси не закрывали простаивающее соединение
+SSE_HEARTBEAT_SECONDS = 15
+
+# Имя сотрудника подгружаем тем же запросом, что и события,
+# иначе to_dict() делает отдельный SELECT для каждой записи
+PRESENCE_LIST_OPTIONS = (joinedload(EmployeePresence.employee).load_only(Employee.full_name),)
+
+
+def encode_cursor(event):
+    """Непрозрачный курсор keyset-пагинации: позиция (start_datetime, presence_id) события."""
+    raw = f"{event.start_datetime.isoformat()}|{event.presence_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Разбирает курсор обратно в кортеж (start_datetime, presence_id); None, если курсор испорчен."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        start_str, presence_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(start_str), int(presence_id)
+    except (ValueError, UnicodeError):
+        return None
+
+
+def stream_ndjson(stmt, encode):
+    """
+    Отдает результат SELECT потоком NDJSON, читая строки пачками через серверный курсор.
+    encode превращает строку результата в JSON-текст без перевода строки.
+    """
+    def generate():
+        for row in db.session.execute(stmt.execution_options(yield_per=NDJSON_BATCH_SIZE)):
+            yield encode(row) + '\n'
+
+    return current_app.response_class(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
+def users_page_args(args):
+    """
+    (page, per_page) для /users?page=1&per_page=50. Неверные значения заменяются,
+    как в paginate(error_out=False) - одинаково во Flask- и ASGI-версии маршрута.
+    """
+    page = args.get('page', 1, type=int)
+    per_page = min(args.get('per_page', USERS_PER_PAGE, type=int), MAX_USERS_PER_PAGE)
+    return max(page, 1), per_page if per_page >= 1 else USERS_PER_PAGE
+
+
+def events_statement(args, is_admin, viewer_id):
+    """
+    SELECT строк PRESENCE_ROW_COLUMNS для /events по параметрам запроса, новые первыми:
+    (запрос, None) или (None, текст ошибки). Общий для Flask- и ASGI-версии маршрута.
+    """
+    stmt = select(*PRESENCE_ROW_COLUMNS) \
+        .outerjoin(Employee, Employee.employee_id == EmployeePresence.employee_id)
 
-def validate_ids(data):
-    """Проверяет, существуют ли ID, переданные в запросе, в базе данных."""
-    if 'position_id' in data and data['position_id'] and not Position.query.get(data['position_id']):
-        return f"Position with id {data['position_id']} not found."
-    if 'main_department_id' in data and data['main_department_id'] and not Department.query.get(data['main_department_id']):
-        return f"Department with id {data['main_department_id']} not found."
-    if 'main_team_id' in data and data['main_team_id'] and not Team.query.get(data['main_team_id']):
-        return f"Team with id {data['main_team_id']} not found."
-    return None
+    if is_admin:
+        if 'employee_id' in args:
+            try:
+                stmt = stmt.where(EmployeePresence.employee_id == int(args.get('employee_id')))
+            except ValueError:
+                return None, "Invalid employee_id"
+    else:
+        stmt = stmt.where(EmployeePresence.employee_id == int(viewer_id))
+
+    if 'event_type' in args:
+        stmt = stmt.where(EmployeePresence.presence_type == args.get('event_type'))
+    if 'status' in args:
+        stmt = stmt.where(EmployeePresence.status == args.get('status'))
+
+    # Keyset-пагинация: /events?limit=100&cursor=<X-Next-Cursor из предыдущего ответа>
+    if 'cursor' in args:
+        position = decode_cursor(args.get('cursor'))
+        if position is None:
+            return None, "Invalid cursor"
+        stmt = stmt.where(tuple_(EmployeePresence.start_datetime, EmployeePresence.presence_id) < position)
+
+    return stmt.order_by(EmployeePresence.start_datetime.desc(), EmployeePresence.presence_id.desc()), None
+
+
+def events_page(rows, limit):
+    """
+    Отрезает от выборки limit + 1 строк лишнюю: (строки страницы, курсор следующей или None).
+    Лишняя строка показывает, что следующая страница есть.
+    """
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor(rows[limit - 1])
+    return rows, None
+
+
+def parse_scope(args):
+    """Фильтры SCOPE_FILTERS из параметров запроса: {'team_id': 3, ...}; None - если id не число."""
+    scope = {}
+    for name in SCOPE_FILTERS:
+        if args.get(name):
+            try:
+                scope[name] = int(args[name])
+            except ValueError:
+                return None
+    return scope
+
+
+def parse_include_schedule(args, start_date, end_date):
+    """(нужны ли вхождения расписаний, текст ошибки или None) для /calendar/events."""
+    if args.get('include_schedule') not in ('1', 'true'):
+        return False, None
+    # Расписания бесконечны - разворачиваем только явно заданное окно
+    if start_date is None or not 0 <= (end_date - start_date).days <= MAX_SCHEDULE_DAYS:
+        return True, f"include_schedule requires start_date and end_date at most {MAX_SCHEDULE_DAYS} days apart"
+    return True, None
+
+
+def wants_job(args):
+    """Клиент просит выполнить тяжелую операцию в фоне: ?async=1."""
+    return args.get('async') in ('1', 'true')
+
+
+def start_job(kind, payload, created_by):
+    """
+    Ставит задачу и отвечает 202 с ее id; результат клиент забирает опросом GET /jobs/<id>.
+    Воркер - отдельный процесс: веб-воркеры узнают о его записях по LISTEN/NOTIFY
+    (presence.apply_notification) или, без него, сверкой presence.CacheSync.
+    """
+    job = job_queue.enqueue(kind, payload, created_by)
+    response = jsonify(job_id=job.job_id, status=job.status)
+    response.status_code = 202
+    response.headers['Location'] = url_for('api.get_job', job_id=job.job_id)
+    return response
+
+
+def load_calendar_events(start_date=None, end_date=None, members=None, versions=None):
+    """
+    Возвращает немаскированные словари утвержденных/завершенных событий,
+    пересекающихся с диапазоном дат. Выборка за диапазон одинакова
+    для всех смотрящих, поэтому берется из кэша календаря.
+    members - отсортированный кортеж id сотрудников для выборки по команде/отделу/проекту.
+    versions - счетчики корзин диапазона, прочитанные для ETag (calendar_versions).
+    """
+    if start_date:
+        if versions is None:
+            versions = calendar_versions(start_date, end_date)
+        version = range_version(start_date, end_date, versions)
+        events = calendar_cache.get(start_date, end_date, version, scope=members)
+        if events is not None:
+            return events
+
+    generation = calendar_cache.generation
+    query = EmployeePresence.query.options(*PRESENCE_LIST_OPTIONS)
+    if members is not None:
+        if not members:
+            return []
+        # Индекс (employee_id, start_datetime): стоимость зависит от числа сотрудников
+        # в выборке, а не от размера компании, как у общего индекса периодов
+        query = query.filter(EmployeePresence.employee_id.in_(members))
+        if start_date:
+            lo, hi = date_window(start_date, end_date)
+            query = query.filter(range_overlaps(lo, hi))
+    elif start_date:
+        # Находим события, которые пересекаются с заданным диапазоном
+        query = filter_overlapping(query, start_date, end_date)
+
+    # Фильтрация по статусу
+    query = query.filter(EmployeePresence.status.in_(ACTIVE_STATUSES))
+
+    events = [event.to_dict(is_viewer_admin=True) for event in query.order_by(EmployeePresence.start_datetime.asc())]
+    # Сразу после записи реплика могла еще не догнать основную базу - такую выборку не кэшируем
+    if start_date and not (on_replica() and replica_router.recently_written()):
+        calendar_cache.set(start_date, end_date, events, generation, version, scope=members)
+    return events
+
+
+def etag_response(response, etag):
+    """Проставляет слабый ETag в ответ."""
+    response.set_etag(etag, weak=True)
+    return response
+
+
+def not_modified(etag):
+    """Ответ 304 на условный GET без выборки и сериализации данных."""
+    return etag_response(current_app.response_class(status=304), etag)
+
+
+def load_profile(employee_id):
+    """Загружает сотрудника вместе со всеми связями, нужными для to_dict()."""
+    return Employee.query.options(*Employee.profile_options(many=False)).populate_existing().get(employee_id)
 
 
 @bp.route('/admin/dashboard', methods=['GET'])
@@ -33,6 +241,96 @@ def admin_dashboard():
     return jsonify(data="Welcome to the admin dashboard!"), 200
 
 
+@bp.route('/admin/login-stats', methods=['GET'])
+@admin_required()
+def login_stats():
+    """Состояние пула проверки паролей (очередь, занятые слоты) и кэша учетных данных."""
+    return jsonify(verifier=password_verifier.stats(), credential_cache_size=len(credential_cache))
+
+
+@bp.route('/admin/db-pool', methods=['GET'])
+@admin_required()
+def db_pool_stats():
+    """Заполненность пулов соединений основной базы и реплик, время ожидания соединения."""
+    return jsonify(pools=pool_stats(db.engines), replicas=replica_router.binds)
+
+
+@bp.route('/admin/archive', methods=['GET'])
+@admin_required()
+def archive_overview():
+    """Архивные годы (Parquet) и секции горячей таблицы employee_presence."""
+    return jsonify(archived=archive.archived_years(),
+                   partitions=[{'name': name, 'rows': rows} for name, rows in partitions.list_partitions()]
+                   if partitions.is_partitioned() else [])
+
+
+# Чтение архивного года потоком NDJSON: /admin/archive/2022/events?employee_id=5&start_date=...&end_date=...
+@bp.route('/admin/archive/<int:year>/events', methods=['GET'])
+@admin_required()
+def archived_events(year):
+    employee_id = request.args.get('employee_id', type=int)
+    start = end = None
+    if request.args.get('start_date') and request.args.get('end_date'):
+        try:
+            start, end = date_window(datetime.strptime(request.args['start_date'], '%Y-%m-%d').date(),
+                                     datetime.strptime(request.args['end_date'], '%Y-%m-%d').date())
+        except ValueError:
+            return jsonify({"msg": "Invalid date format. Use YYYY-MM-DD."}), 400
+    try:
+        rows = archive.read_archive(year, employee_id, start, end)
+    except archive.ArchiveError as e:
+        return jsonify({"msg": str(e)}), 404
+
+    encoder = PresenceEncoder(is_viewer_admin=True)
+    if fast_json_enabled():
+        encode = encoder.encode
+    else:
+        encode = lambda row: current_app.json.dumps(encoder.as_dict(row), separators=(',', ':'))
+
+    def generate():
+        for row in rows:
+            yield encode(row) + '\n'
+
+    return current_app.response_class(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
+@bp.route('/admin/jobs', methods=['GET'])
+@admin_required()
+def list_jobs():
+    """Последние фоновые задачи (?status=failed&kind=import_users) и их число по статусам."""
+    query = Job.query
+    if request.args.get('status'):
+        query = query.filter(Job.status == request.args['status'])
+    if request.args.get('kind'):
+        query = query.filter(Job.kind == request.args['kind'])
+    limit = min(request.args.get('limit', 50, type=int), MAX_JOBS_LIMIT)
+    jobs = query.order_by(Job.job_id.desc()).limit(limit).all()
+    return jsonify(items=[job.to_dict() for job in jobs], counts=job_queue.stats())
+
+
+@bp.route('/admin/metrics', methods=['GET'])
+@admin_required()
+def prometheus_metrics():
+    """Метрики запросов этого воркера и состояние пулов и кэшей в формате Prometheus."""
+    gauges, counters = [], []
+    for name, value in password_verifier.stats().items():
+        samples = counters if name in PasswordVerifier.COUNTERS else gauges
+        samples.append((f'login_verifier_{name}', {}, value))
+    for bind, stats in pool_stats(db.engines).items():
+        for name, value in stats.items():
+            if isinstance(value, (int, float)):
+                samples = counters if name in TimedQueuePool.COUNTERS else gauges
+                samples.append((f'db_pool_{name}', {'bind': bind}, value))
+    gauges.extend([
+        ('credential_cache_entries', {}, len(credential_cache)),
+        ('calendar_cache_entries', {}, len(calendar_cache)),
+        ('membership_cache_entries', {}, len(membership_cache)),
+        ('sse_subscribers', {}, len(broker)),
+    ])
+    gauges.extend(('jobs', {'status': status}, count) for status, count in job_queue.stats().items())
+    return current_app.response_class(metrics.render(gauges, counters), mimetype=PROMETHEUS_MIMETYPE)
+
+
 @bp.route('/login', methods=['POST'])
 def login():
     data = request.get_json()
@@ -42,14 +340,32 @@ def login():
     if not email or not password:
         return jsonify({"msg": "Email and password are required"}), 400
 
-    employee = Employee.query.filter_by(email=email).first()
+    # Для логина нужны только id, хэш и роль - берем их из кэша или одним узким запросом.
+    # Кэшу можно верить: изменения сотрудника любым процессом сбрасывают его записи
+    # уведомлением employee_updated / employee_deleted (presence.apply_notification)
+    credentials = credential_cache.get(email)
+    if credentials is None:
+        generation = credential_cache.generation
+        row = db.session.query(Employee.employee_id, Employee.password_hash, Employee.role) \
+            .filter_by(email=email).first()
+        if row:
+            credentials = (row.employee_id, row.password_hash, row.role.value)
+            credential_cache.set(email, credentials, generation)
+
+    if not credentials:
+        return jsonify({"msg": "Bad email or password"}), 401
 
-    if not employee or not employee.check_password(password):
+    # Проверка хэша - тяжелая CPU-операция, выполняется в ограниченном пуле процессов
+    try:
+        password_ok = password_verifier.verify(credentials[1], password)
+    except VerifierBusy:
+        return jsonify({"msg": "Too many login attempts in progress, try again later"}), 503
+    if not password_ok:
         return jsonify({"msg": "Bad email or password"}), 401
 
     # Создаем токен с дополнительными данными о роли
-    additional_claims = {"role": employee.role.value}
-    access_token = create_access_token(identity=str(employee.employee_id), additional_claims=additional_claims)
+    additional_claims = {"role": credentials[2]}
+    access_token = create_access_token(identity=str(credentials[0]), additional_claims=additional_claims)
 
     return jsonify(access_token=access_token)
 
@@ -65,54 +381,75 @@ def create_user():
     if Employee.query.filter_by(email=data['email']).first():
         return jsonify(msg="User with this email already exists"), 409
 
-    error = validate_ids(data)
-    if error:
-        return jsonify(msg=error), 400
-
-    # Создание основного объекта Employee
-    new_employee = Employee(
-        email=data['email'],
-        full_name=data['full_name'],
-        role=RoleEnum(data.get('role', 'user')),
-        work_mode=data.get('work_mode', 'office'),
-        work_schedule=data.get('work_schedule'),
-        position_id=data.get('position_id'),
-        main_department_id=data.get('main_department_id'),
-        main_team_id=data.get('main_team_id')
-    )
-    new_employee.set_password(data['password'])
+    # Все ссылки запроса проверяются одним IN-запросом на таблицу
+    refs = resolve_references([data])
+    errors = reference_errors(data, refs)
+    if errors:
+        return jsonify(msg=' '.join(errors)), 400
 
-    # Обработка связей Many-to-Many
-
-    if 'additional_department_ids' in data:
-        for dept_id in data['additional_department_ids']:
-            dept = Department.query.get(dept_id)
-            if dept:
-                new_employee.departments.append(dept)
-
-    # Участие в проектах (ожидаем список объектов: [{"project_id": X, "participation_percentage": Y}])
-    if 'projects' in data:
-        for proj_data in data['projects']:
-            project = Project.query.get(proj_data.get('project_id'))
-            if project:
-                association = EmployeeProject(
-                    project=project,
-                    participation_percentage=proj_data.get('participation_percentage', 0)
-                )
-                new_employee.projects_association.append(association)
+    # Создание основного объекта Employee вместе со связями Many-to-Many
+    with db.session.no_autoflush:
+        new_employee = build_employee(data, None, refs)
+    new_employee.set_password(data['password'])
 
     db.session.add(new_employee)
+    if schedule.is_structured(new_employee.work_schedule):
+        # Вхождения расписания появятся в календаре - ETag'и календаря должны смениться
+        bump_versions()
+    db.session.flush()
+    occupancy.add_employees([new_employee.employee_id])
+    bump_employees()
     db.session.commit()
+    membership_cache.clear()
+
+    return jsonify(load_profile(new_employee.employee_id).to_dict()), 201
+
 
-    return jsonify(new_employee.to_dict()), 201
+# CREATE: Массовое создание пользователей (только админ)
+@bp.route('/users/bulk', methods=['POST'])
+@admin_required()
+def bulk_create_users():
+    # Тело - JSON-массив объектов того же формата, что и для POST /users
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        return jsonify(msg="Expected a JSON array of users"), 400
+    if wants_job(request.args):
+        # Открытый текст паролей не должен попасть в jobs.payload, а хэширование - в запрос
+        return start_job('import_users', {'items': seal_passwords(items)}, get_jwt_identity())
+
+    created, errors = provision_employees(items)
+    if created:
+        membership_cache.clear()
+    return jsonify(created=created, errors=errors), 201 if created else 400
+
+
+# READ: Постраничный список сотрудников (только админ)
+@bp.route('/users', methods=['GET'])
+@admin_required()
+def get_users():
+    # /users?page=1&per_page=50
+    page, per_page = users_page_args(request.args)
+
+    pagination = Employee.query.options(*Employee.profile_options()) \
+        .order_by(Employee.employee_id.asc()) \
+        .paginate(page=page, per_page=per_page, error_out=False)
+
+    return jsonify({
+        'items': [employee.to_dict() for employee in pagination.items],
+        'page': pagination.page,
+        'per_page': pagination.per_page,
+        'total': pagination.total,
+        'pages': pagination.pages
+    })
 
 
 # READ: Получение своего профиля (любой залогиненный пользователь)
 @bp.route('/profile', methods=['GET'])
 @jwt_required()
+@read_only()
 def get_my_profile():
     current_user_id = get_jwt_identity()
-    employee = Employee.query.get(current_user_id)
+    employee = load_profile(current_user_id)
     if not employee:
         return jsonify(msg="User not found"), 404
     return jsonify(employee.to_dict())
@@ -121,8 +458,9 @@ def get_my_profile():
 # READ: Получение профиля по ID (только админ)
 @bp.route('/users/<int:user_id>', methods=['GET'])
 @admin_required()
+@read_only()
 def get_user_by_id(user_id):
-    employee = Employee.query.get(user_id)
+    employee = load_profile(user_id)
     if not employee:
         return jsonify(msg="User not found"), 404
 
@@ -133,21 +471,27 @@ def get_user_by_id(user_id):
 @bp.route('/users/<int:user_id>', methods=['PUT'])
 @admin_required()
 def update_user(user_id):
-    employee = Employee.query.get(user_id)
+    employee = load_profile(user_id)
     if not employee:
         return jsonify(msg="User not found"), 404
 
     data = request.get_json()
 
-    error = validate_ids(data)
-    if error:
-        return jsonify(msg=error), 400
+    refs = resolve_references([data])
+    errors = reference_errors(data, refs)
+    if errors:
+        return jsonify(msg=' '.join(errors)), 400
 
+    name_changed = data.get('full_name', employee.full_name) != employee.full_name
+    occupancy_key = (employee.main_department_id, employee.work_mode.value)
     employee.full_name = data.get('full_name', employee.full_name)
     employee.email = data.get('email', employee.email)
     employee.role = RoleEnum(data.get('role', employee.role.value))
-    employee.work_mode = RoleEnum(data.get('work_mode', employee.work_mode.value))
-    employee.work_schedule = data.get('work_schedule', employee.work_schedule)
+    employee.work_mode = WorkModeEnum(data.get('work_mode', employee.work_mode.value))
+    schedule_changed = 'work_schedule' in data and \
+        schedule.dump_schedule(data['work_schedule']) != employee.work_schedule
+    if schedule_changed:
+        employee.work_schedule = schedule.dump_schedule(data['work_schedule'])
     employee.position_id = data.get('position_id', employee.position_id)
     employee.main_department_id = data.get('main_department_id', employee.main_department_id)
     employee.main_team_id = data.get('main_team_id', employee.main_team_id)
@@ -155,40 +499,45 @@ def update_user(user_id):
     if 'password' in data and data['password']:
         employee.set_password(data['password'])
 
-    # Обновляем связи M2M
-    if 'additional_department_ids' in data:
-        employee.departments.clear()  # Очищаем старые связи
-        for dept_id in data['additional_department_ids']:
-            dept = Department.query.get(dept_id)
-            if dept:
-                employee.departments.append(dept)
-
-    if 'projects' in data:
-        employee.projects_association.clear()
-        for proj_data in data['projects']:
-            project = Project.query.get(proj_data.get('project_id'))
-            if project:
-                association = EmployeeProject(
-                    employee=employee,
-                    project=project,
-                    participation_percentage=proj_data.get('participation_percentage', 0)
-                )
-                db.session.add(association)  # Добавляем новую связь
+    # Обновляем связи M2M: меняются только строки, которых коснулось изменение
+    apply_memberships(employee, data, refs)
+
+    # События сотрудника учитываются в агрегате загрузки по основному отделу и режиму работы
+    occupancy.move_employee(user_id, occupancy_key, (employee.main_department_id, employee.work_mode.value))
 
+    if name_changed:
+        # Имя входит в каждое событие сотрудника - клиенты синхронизации получат их заново
+        changelog.log_employee_events(user_id, changelog.UPSERT)
+    if name_changed or schedule_changed:
+        # Вхождения расписания не хранятся в базе, счетчики событий сами не сдвинутся
+        bump_versions()
+    bump_employees()
     db.session.commit()
-    return jsonify(employee.to_dict())
+    # Email, пароль или роль могли измениться
+    credential_cache.invalidate_employee(user_id)
+    # Сотрудник мог перейти в другую команду, отдел или проект
+    membership_cache.clear()
+    # Сам сотрудник тоже должен сразу увидеть изменения профиля
+    replica_router.stick(user_id)
+    if name_changed:
+        # Имя сотрудника входит в закэшированные события календаря
+        invalidate_presence_views()
+    # Остальные процессы сбрасывают те же кэши по уведомлению
+    notify_presence('employee_updated', employee_id=user_id, name_changed=name_changed)
+    return jsonify(load_profile(user_id).to_dict())
 
 
 # DELETE: Удаление профиля по ID (только админ)
 @bp.route('/users/<int:user_id>', methods=['DELETE'])
 @admin_required()
 def delete_user(user_id):
-    employee = Employee.query.get(user_id)
-    if not employee:
-        return jsonify(msg="User not found"), 404
+    if wants_job(request.args):
+        if not db.session.get(Employee, user_id):
+            return jsonify(msg="User not found"), 404
+        return start_job('delete_user', {'employee_id': user_id}, get_jwt_identity())
 
-    db.session.delete(employee)
-    db.session.commit()
+    if not remove_employee(user_id):
+        return jsonify(msg="User not found"), 404
 
     return jsonify(msg=f"User with id {user_id} deleted successfully"), 200
 
@@ -197,6 +546,7 @@ def delete_user(user_id):
 
 @bp.route('/calendar/events', methods=['GET'])
 @jwt_required()
+@read_only()
 def get_calendar_events():
 
     # /calendar/events?start_date=YYYY-MM-DD&end_date=YYYY-MM-DD
@@ -208,36 +558,260 @@ def get_calendar_events():
     start_date_str = request.args.get('start_date')
     end_date_str = request.args.get('end_date')
 
-    query = EmployeePresence.query
-    print("Wdadawd")
+    start_date = end_date = None
     if start_date_str and end_date_str:
         try:
             # Используем strptime для явного указания формата
             start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
             end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-            # Находим события, которые пересекаются с заданным диапазоном
-            query = query.filter(
-                or_(
-                    EmployeePresence.start_datetime.between(start_date, end_date),
-                    EmployeePresence.end_datetime.between(start_date, end_date),
-                    (EmployeePresence.start_datetime <= start_date) & (EmployeePresence.end_datetime >= end_date)
-                )
-            )
         except ValueError:
             # Эта обработка ошибок остается на всякий случай, если формат будет совсем неверным
             return jsonify({"msg": "Invalid date format. Use YYYY-MM-DD."}), 400
 
-    # Фильтрация по статусу
+    # /calendar/events?...&team_id=3 - только сотрудники команды (отдела, проекта)
+    scope = parse_scope(request.args)
+    if scope is None:
+        return jsonify({"msg": "team_id, department_id and project_id must be integers"}), 400
+    members = availability.scope_members(**scope) if scope else None
 
+    # ...&include_schedule=1 - вместе с удаленными днями и встречами из расписаний сотрудников
+    include_schedule, error = parse_include_schedule(request.args, start_date, end_date)
+    if error:
+        return jsonify({"msg": error}), 400
 
-    query = query.filter(EmployeePresence.status.in_(['approved', 'completed']))
+    # Клиент уже видел эту версию диапазона - отвечаем 304 без выборки
+    versions = calendar_versions(start_date, end_date)
+    etag = calendar_etag(start_date, end_date, 'admin' if is_admin else viewer_id, versions=versions,
+                         members=members, schedule=include_schedule)
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
 
-    all_events = query.order_by(EmployeePresence.start_datetime.asc()).all()
+    events = load_calendar_events(start_date, end_date, members, versions)
+    if include_schedule:
+        rows = db.session.execute(schedule.schedules_statement(start_date, end_date, members)).all()
+        events = schedule.merge_schedule(events, rows, start_date, end_date, complete=members is None)
 
-    # Сериализуем данные, передавая флаг админа и ID смотрящего в to_dict()
-    result = [event.to_dict(is_viewer_admin=is_admin, viewer_id=viewer_id) for event in all_events]
+    # Маскируем приватные события с учетом флага админа и ID смотрящего
+    result = [mask_presence(event, is_viewer_admin=is_admin, viewer_id=viewer_id) for event in events]
 
-    return jsonify(result)
+    return etag_response(jsonify(result), etag)
+
+
+# Инкрементальная синхронизация: /calendar/changes?since=<cursor>&limit=1000
+@bp.route('/calendar/changes', methods=['GET'])
+@jwt_required()
+def get_calendar_changes():
+    claims = get_jwt()
+    is_admin = claims.get("role") == "admin"
+    viewer_id = get_jwt_identity()
+
+    # Без since отдаем только текущий курсор: клиент делает полную загрузку
+    # через /calendar/events и дальше запрашивает изменения после него
+    if 'since' not in request.args:
+        return jsonify({"upserts": [], "deleted": [], "cursor": changelog.current_cursor(), "has_more": False})
+
+    since = request.args.get('since', type=int)
+    if since is None or since < 0:
+        return jsonify({"msg": "Invalid cursor"}), 400
+    limit = max(1, min(request.args.get('limit', 1000, type=int), MAX_CHANGES_LIMIT))
+
+    presence_ids, cursor, has_more = changelog.read_changes(since, limit)
+    events = []
+    if presence_ids:
+        events = EmployeePresence.query.options(*PRESENCE_LIST_OPTIONS) \
+            .filter(EmployeePresence.presence_id.in_(presence_ids),
+                    EmployeePresence.status.in_(ACTIVE_STATUSES)) \
+            .order_by(EmployeePresence.start_datetime.asc()).all()
+
+    # Событие, которое больше не действует (удалено, отклонено), для календаря клиента - удаление
+    live_ids = {event.presence_id for event in events}
+    return jsonify({
+        "upserts": [e.to_dict(is_viewer_admin=is_admin, viewer_id=viewer_id) for e in events],
+        "deleted": sorted(presence_ids - live_ids),
+        "cursor": cursor,
+        "has_more": has_more,
+    })
+
+
+# Поток уведомлений о событиях (Server-Sent Events). EventSource в браузере не умеет
+# передавать заголовки, поэтому токен принимается и в query string: ?jwt=<token>
+@bp.route('/events/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_events():
+    claims = get_jwt()
+    is_admin = claims.get("role") == "admin"
+    viewer_id = get_jwt_identity()
+
+    subscription = broker.subscribe(engine=db.engine)
+
+    # Генератор работает уже после завершения запроса и не держит соединение с базой.
+    # Простаивающий клиент - это ожидание в очереди; без потока на клиента
+    # соединения держит gevent-воркер (см. README)
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            while not subscription.closed:
+                message = subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                if message is None:
+                    yield ': keepalive\n\n'
+                    continue
+                if message.get('event'):
+                    message = dict(message, event=mask_presence(message['event'], is_viewer_admin=is_admin,
+                                                                viewer_id=viewer_id))
+                yield f"event: {message['type']}\ndata: {json.dumps(message, separators=(',', ':'))}\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx не должен буферизовать поток
+    return response
+
+
+def feed_token_response(employee, token):
+    """Токен подписки и адреса личного календаря, команды и отдела сотрудника."""
+    def feed_url(scope, object_id):
+        if object_id is None:
+            return None
+        return url_for('api.get_calendar_feed', scope=scope, object_id=object_id, token=token, _external=True)
+
+    return jsonify({
+        "token": token,
+        "feeds": {
+            "user": feed_url('user', employee.employee_id),
+            "team": feed_url('team', employee.main_team_id),
+            "department": feed_url('department', employee.main_department_id),
+        },
+    })
+
+
+# Токен и адреса .ics-подписок текущего пользователя для Outlook / Google Calendar
+@bp.route('/calendar/feed-token', methods=['GET'])
+@jwt_required()
+def get_feed_token():
+    employee = Employee.query.get(int(get_jwt_identity()))
+    if not employee:
+        return jsonify(msg="User not found"), 404
+    return feed_token_response(employee, ics.feed_token(employee.employee_id, employee.feed_token_version))
+
+
+# Отзыв всех выданных адресов подписок (например, адрес утек) - в ответе новые адреса
+@bp.route('/calendar/feed-token/rotate', methods=['POST'])
+@jwt_required()
+def rotate_feed_token():
+    employee = Employee.query.get(int(get_jwt_identity()))
+    if not employee:
+        return jsonify(msg="User not found"), 404
+    token = ics.rotate_feed_token(employee)
+    db.session.commit()
+    return feed_token_response(employee, token)
+
+
+# Подписка .ics: /calendar/feeds/<user|team|department>/<id>.ics?token=<feed-token>
+@bp.route('/calendar/feeds/<scope>/<int:object_id>.ics', methods=['GET'])
+def get_calendar_feed(scope, object_id):
+    if scope not in ics.FEED_SCOPES:
+        return jsonify({"msg": "Unknown feed"}), 404
+    viewer = ics.load_feed_viewer(request.args.get('token'))
+    if viewer is None:
+        return jsonify({"msg": "Invalid feed token"}), 401
+    viewer_id, is_admin = viewer
+
+    feed = ics.feed_members(scope, object_id)
+    if feed is None:
+        return jsonify({"msg": "Feed not found"}), 404
+    name, members = feed
+    start_date, end_date = ics.feed_window()
+
+    # Маскирование зависит только от того, админ ли смотрящий и входит ли он в календарь,
+    # поэтому готовое тело общее для всех посторонних смотрящих
+    viewer_key = 'admin' if is_admin else (viewer_id if viewer_id in members else 'public')
+    etag, last_modified = feed_etag(scope, viewer_key, start_date, end_date, members)
+
+    if request.if_none_match.contains_weak(etag) or (
+            not request.if_none_match and request.if_modified_since
+            and last_modified.replace(microsecond=0) <= request.if_modified_since):
+        response = not_modified(etag)
+        response.last_modified = last_modified
+        return response
+
+    cache_key = (scope, object_id, viewer_key)
+    body = feed_cache.get(cache_key, etag)
+    if body is None:
+        rows = ics.feed_rows(members, start_date, end_date)
+
+        def generate():
+            # Копим тело для кэша, пока оно укладывается в лимит, затем просто отдаем поток
+            chunks, size = [], 0
+            for text in ics.render_feed(name, rows, is_admin, viewer_id):
+                chunk = text.encode('utf-8')
+                if chunks is not None:
+                    size += len(chunk)
+                    if size <= feed_cache.max_body_bytes:
+                        chunks.append(chunk)
+                    else:
+                        chunks = None
+                yield chunk
+            if chunks is not None:
+                feed_cache.set(cache_key, etag, b''.join(chunks))
+
+        body = stream_with_context(generate())
+
+    response = Response(body, mimetype='text/calendar')
+    response.headers['Content-Disposition'] = f'inline; filename="{scope}-{object_id}.ics"'
+    response.last_modified = last_modified
+    return etag_response(response, etag)
+
+
+@bp.route('/occupancy', methods=['GET'])
+@jwt_required()
+def get_occupancy():
+    # /occupancy?start_date=YYYY-MM-DD&end_date=YYYY-MM-DD[&department_id=1&department_id=2]
+    is_admin = get_jwt().get("role") == "admin"
+    try:
+        start_date = datetime.strptime(request.args.get('start_date', ''), '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.args.get('end_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({"msg": "start_date and end_date are required in YYYY-MM-DD format."}), 400
+    if (end_date - start_date).days > MAX_OCCUPANCY_DAYS:
+        return jsonify({"msg": f"Range must not exceed {MAX_OCCUPANCY_DAYS} days"}), 400
+
+    department_ids = request.args.getlist('department_id', type=int)
+    return jsonify(occupancy.occupancy_report(start_date, end_date, department_ids, is_viewer_admin=is_admin))
+
+
+@bp.route('/availability', methods=['GET'])
+@jwt_required()
+def get_availability():
+    # /availability?team_id=1|project_id=1&start_date=YYYY-MM-DD&end_date=YYYY-MM-DD
+    #   [&min_percent=80] - дни, когда свободно не меньше 80% (по умолчанию 100 - все)
+    #   [&best=5]         - 5 дней с наибольшим числом свободных
+    team_id = request.args.get('team_id', type=int)
+    project_id = request.args.get('project_id', type=int)
+    if bool(team_id) == bool(project_id):
+        return jsonify({"msg": "Exactly one of team_id or project_id is required"}), 400
+    try:
+        start_date = datetime.strptime(request.args.get('start_date', ''), '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.args.get('end_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({"msg": "start_date and end_date are required in YYYY-MM-DD format."}), 400
+    n_days = (end_date - start_date).days + 1
+    if not 0 < n_days <= MAX_AVAILABILITY_DAYS:
+        return jsonify({"msg": f"Range must be 1..{MAX_AVAILABILITY_DAYS} days"}), 400
+    best = request.args.get('best', type=int)
+    if 'best' in request.args and (best is None or best < 1):
+        return jsonify({"msg": "best must be a positive integer"}), 400
+
+    members = availability.team_members(team_id) if team_id else availability.project_members(project_id)
+    # Пустой состав - либо пустая группа, либо несуществующая: без проверки она выглядела бы свободной
+    if not members and db.session.get(Team if team_id else Project, team_id or project_id) is None:
+        return jsonify({"msg": "Team not found" if team_id else "Project not found"}), 404
+    absences = availability.load_absences(members, start_date, end_date)
+    busy = availability.busy_bitmap(members, absences, start_date, n_days)
+    days = availability.free_days(busy, start_date,
+                                  min_percent=request.args.get('min_percent', 100.0, type=float),
+                                  best=best)
+    return jsonify(members=len(members), days=days)
 
 
 @bp.route('/events', methods=['POST'])
@@ -248,64 +822,118 @@ def create_event():
     current_user_id = get_jwt_identity()
     is_admin = claims.get("role") == "admin"
 
-    target_employee_id = data.get('employee_id', current_user_id)
-    if not is_admin and int(target_employee_id) != current_user_id:
-        return jsonify({"msg": "You can only create events for yourself"}), 403
-
-    event_type = data.get('event_type')
-    if event_type not in ALLOWED_EVENT_TYPES:
-        return jsonify({"msg": f"Invalid event_type. Allowed types: {list(ALLOWED_EVENT_TYPES)}"}), 400
-
-    start_date_str = data.get('start_date')
-    end_date_str = data.get('end_date')
-    if not start_date_str or not end_date_str: return jsonify({"msg": "Dates required"}), 400
-    start_datetime = datetime.fromisoformat(start_date_str)
-    end_datetime = datetime.fromisoformat(end_date_str).replace(hour=23, minute=59, second=59)
+    # Права, тип события, даты и начальный статус проверяются так же, как при массовом импорте
+    fields, error = parse_event_payload(data, is_admin, current_user_id)
+    if error:
+        return jsonify({"msg": error[0]}), error[1]
 
-    # определяем статус на основе типа события
-    initial_status = 'planned' if event_type in APPROVAL_REQUIRED_TYPES else 'completed'
+    # Блокировка сотрудника держится до commit, чтобы параллельный запрос не вставил
+    # пересекающееся отсутствие между проверкой и вставкой
+    conflicts.lock_employee(fields['employee_id'])
+    overlapping = conflicts.event_conflicts(fields)
+    if overlapping:
+        db.session.rollback()
+        return jsonify({"msg": "Event overlaps existing absence", "conflicts": overlapping}), 409
 
-    new_event = EmployeePresence(
-        employee_id=target_employee_id,
-        presence_type=event_type,
-        start_datetime=start_datetime,
-        end_datetime=end_datetime,
-        status=initial_status,
-        comment=data.get('comment')
-    )
+    new_event = EmployeePresence(**fields)
+    event_range = (new_event.start_datetime, new_event.end_datetime)
 
     db.session.add(new_event)
+    db.session.flush()  # нужен presence_id для журнала изменений
+    changelog.log_change(new_event)
+    occupancy.record_change(after=fields)
+    bump_versions([event_range])
     db.session.commit()
+    invalidate_presence_views([event_range])
+    notify_presence('created', new_event.to_dict(is_viewer_admin=True))
 
     return jsonify(new_event.to_dict(is_viewer_admin=is_admin, viewer_id=current_user_id)), 201
 
 
+# CREATE: Массовый импорт событий (JSON-массив или CSV)
+@bp.route('/events/bulk', methods=['POST'])
+@jwt_required()
+def bulk_create_events():
+    # CSV: employee_id,event_type,start_date,end_date,comment
+    claims = get_jwt()
+    current_user_id = get_jwt_identity()
+    is_admin = claims.get("role") == "admin"
+
+    items, error = read_bulk_payload(request)
+    if error:
+        return jsonify({"msg": error}), 400
+    if wants_job(request.args):
+        return start_job('import_events', {'items': items, 'is_admin': is_admin}, current_user_id)
+
+    inserted, errors = import_events(items, is_admin, current_user_id)
+    return jsonify({"inserted": inserted, "errors": errors}), 201 if inserted else 400
+
+
+# Проверка пересечений для планирования: события не создаются
+@bp.route('/events/check', methods=['POST'])
+@jwt_required()
+def check_events_route():
+    claims = get_jwt()
+    items = request.get_json(silent=True)
+    if isinstance(items, dict):
+        items = items.get('events')
+    if not isinstance(items, list):
+        return jsonify({"msg": "Expected a JSON array of events"}), 400
+    if len(items) > MAX_CHECK_ITEMS:
+        return jsonify({"msg": f"At most {MAX_CHECK_ITEMS} events per check"}), 400
+
+    results = check_events(items, claims.get("role") == "admin", get_jwt_identity())
+    return jsonify(results=results, conflicts=sum(1 for result in results if result.get('conflicts')))
+
+
 # READ: Получение списка событий
 @bp.route('/events', methods=['GET'])
 @jwt_required()
+@read_only()
 def get_events():
     claims = get_jwt()
     # Эти данные должны быть доступны всем
     is_admin = True
     viewer_id = get_jwt_identity()
 
-    query = EmployeePresence.query
+    etag = events_etag('admin' if is_admin else viewer_id, request.args)
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
 
-    if is_admin:
-        if 'employee_id' in request.args:
-            query = query.filter_by(employee_id=request.args.get('employee_id'))
+    # Выгрузка может быть на десятки тысяч строк: берем кортежи колонок вместо объектов
+    # и сериализуем их PresenceEncoder'ом, минуя to_dict() и общий JSON-кодировщик
+    stmt, error = events_statement(request.args, is_admin, viewer_id)
+    if error:
+        return jsonify({"msg": error}), 400
+
+    encoder = PresenceEncoder(is_viewer_admin=is_admin, viewer_id=viewer_id)
+    fast = fast_json_enabled()
+
+    # Потоковая выгрузка построчно в NDJSON без накопления всего результата в памяти
+    if request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == NDJSON_MIMETYPE:
+        if fast:
+            encode = encoder.encode
+        else:
+            encode = lambda row: current_app.json.dumps(encoder.as_dict(row), separators=(',', ':'))
+        return etag_response(stream_ndjson(stmt, encode), etag)
+
+    limit = request.args.get('limit', type=int)
+    if limit is None:
+        events = db.session.execute(stmt).all()
+        next_cursor = None
     else:
-        query = query.filter_by(employee_id=viewer_id)
-
-    if 'event_type' in request.args:
-        query = query.filter(EmployeePresence.presence_type == request.args.get('event_type'))
-    if 'status' in request.args:
-        query = query.filter_by(status=request.args.get('status'))
-
-    events = query.order_by(EmployeePresence.start_datetime.desc()).all()
+        limit = max(1, min(limit, MAX_PAGE_LIMIT))
+        events, next_cursor = events_page(db.session.execute(stmt.limit(limit + 1)).all(), limit)
 
-    result = [e.to_dict(is_viewer_admin=is_admin, viewer_id=viewer_id) for e in events]
-    return jsonify(result)
+    if fast:
+        with serialization_timer():
+            body = encoder.encode_list(events)
+        response = current_app.response_class(body, mimetype=current_app.json.mimetype)
+    else:
+        response = jsonify([encoder.as_dict(row) for row in events])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return etag_response(response, etag)
 
 
 # UPDATE: Изменение статуса события (утверждение/отклонение)
@@ -326,8 +954,23 @@ def update_event_status(event_id):
     if new_status not in ['approved', 'rejected']:
         return jsonify({"msg": "Invalid status. Must be 'approved' or 'rejected'"}), 400
 
+    # Отклоненное отсутствие, которое утверждают заново, могло за это время пересечься с другими
+    if new_status == 'approved' and event.status not in BLOCKING_STATUSES:
+        conflicts.lock_employee(event.employee_id)
+        overlapping = conflicts.find_conflicts(event.employee_id, event.start_datetime, event.end_datetime,
+                                               exclude_id=event.presence_id)
+        if overlapping:
+            db.session.rollback()
+            return jsonify({"msg": "Event overlaps existing absence", "conflicts": overlapping}), 409
+
+    before = occupancy.event_snapshot(event)
     event.status = new_status
+    occupancy.record_change(before, occupancy.event_snapshot(event))
+    changelog.log_change(event)
+    bump_versions([(event.start_datetime, event.end_datetime)])
     db.session.commit()
+    invalidate_presence_views([(event.start_datetime, event.end_datetime)])
+    notify_presence(new_status, event.to_dict(is_viewer_admin=True))
 
     return jsonify(event.to_dict(is_viewer_admin=True, viewer_id=get_jwt_identity()))
 
@@ -350,6 +993,25 @@ def delete_event(event_id):
     if not is_admin and event.status != 'planned':
         return jsonify({"msg": f"Cannot delete a request with status '{event.status}'"}), 403
 
+    event_range = (event.start_datetime, event.end_datetime)
+    deleted = event.to_dict(is_viewer_admin=True)
+    occupancy.record_change(before=occupancy.event_snapshot(event))
+    changelog.log_change(event, changelog.DELETE)
     db.session.delete(event)
+    bump_versions([event_range])
     db.session.commit()
+    invalidate_presence_views([event_range])
+    notify_presence('deleted', deleted)
     return jsonify({"msg": f"Event {event_id} deleted successfully"})
+
+
+# READ: Состояние фоновой задачи (автор или админ)
+@bp.route('/jobs/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({"msg": "Job not found"}), 404
+    if get_jwt().get("role") != "admin" and str(job.created_by) != get_jwt_identity():
+        return jsonify({"msg": "Forbidden"}), 403
+    return jsonify(job.to_dict())
@@ -0,0 +1,238 @@
+import heapq
+import json
+from datetime import date, timedelta
+
+from sqlalchemy import or_, select
+
+from .cache import schedule_cache
+from .models import ABSENCE_TYPES, Employee
+
+# Структурированное расписание хранится в текстовой колонке Employee.work_schedule как JSON:
+#
+#   {
+#       "weekly": {"mon": "office", "tue": "remote", "wed": "office", "thu": "remote", "fri": "office"},
+#       "exceptions": {"2025-03-10": "office", "2025-05-01": "off"},
+#       "meetings": [
+#           {"title": "Планерка", "days": ["mon", "wed"], "every": 1,
+#            "from": "2025-01-06", "until": "2025-12-31", "skip": ["2025-03-12"]}
+#       ]
+#   }
+#
+# weekly - режим по дням недели (office, remote, off; не указанный день - выходной),
+# без weekly рабочими считаются будни в офисе. exceptions переопределяют режим на дату.
+# Встреча повторяется по своим дням каждые every недель, начиная с недели from,
+# и не проводится в нерабочие дни и в даты из skip. Старое расписание свободным
+# текстом остается как есть и не разворачивается. Вхождения строятся лениво и только
+# внутри запрошенного окна - в базу они не пишутся.
+
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+DAY_MODES = ('office', 'remote', 'off')
+DEFAULT_WEEK = {day: 'office' for day in WEEKDAYS[:5]}
+# Статус вхождений расписания в календаре: они не проходят утверждение
+SCHEDULE_STATUS = 'scheduled'
+
+_ONE_DAY = timedelta(days=1)
+
+
+def _parse_date(value, field):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"work_schedule: {field} must be a date YYYY-MM-DD")
+
+
+def _parse_days(days, field):
+    if not isinstance(days, list) or not days or any(day not in WEEKDAYS for day in days):
+        raise ValueError(f"work_schedule: {field} must be a non-empty list of {list(WEEKDAYS)}")
+    return frozenset(WEEKDAYS.index(day) for day in days)
+
+
+def _parse_meeting(meeting, index):
+    field = f"meetings[{index}]"
+    if not isinstance(meeting, dict) or not isinstance(meeting.get('title'), str) or not meeting['title']:
+        raise ValueError(f"work_schedule: {field} must be an object with a title")
+    every = meeting.get('every', 1)
+    if not isinstance(every, int) or isinstance(every, bool) or every < 1:
+        raise ValueError(f"work_schedule: {field}.every must be a positive integer")
+    first = _parse_date(meeting.get('from'), f"{field}.from")
+    until = _parse_date(meeting['until'], f"{field}.until") if meeting.get('until') else None
+    if until is not None and until < first:
+        raise ValueError(f"work_schedule: {field}.until must not be earlier than from")
+    return {
+        'title': meeting['title'],
+        'weekdays': _parse_days(meeting.get('days'), f"{field}.days"),
+        'every': every,
+        'from': first,
+        # Недели отсчитываются от понедельника недели from
+        'anchor': first - timedelta(days=first.weekday()),
+        'until': until,
+        'skip': frozenset(_parse_date(day, f"{field}.skip") for day in meeting.get('skip') or []),
+    }
+
+
+def parse_schedule(value):
+    """
+    Проверяет и нормализует структурированное расписание (dict или JSON-строка).
+    Возвращает словарь для expand(); ValueError с понятным текстом, если формат неверен.
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValueError("work_schedule: invalid JSON")
+    if not isinstance(value, dict):
+        raise ValueError("work_schedule must be an object")
+
+    weekly = value.get('weekly', DEFAULT_WEEK)
+    if not isinstance(weekly, dict) or any(day not in WEEKDAYS or mode not in DAY_MODES
+                                           for day, mode in weekly.items()):
+        raise ValueError(f"work_schedule: weekly maps {list(WEEKDAYS)} to one of {list(DAY_MODES)}")
+    exceptions = value.get('exceptions') or {}
+    if not isinstance(exceptions, dict) or any(mode not in DAY_MODES for mode in exceptions.values()):
+        raise ValueError(f"work_schedule: exceptions map dates to one of {list(DAY_MODES)}")
+    meetings = value.get('meetings') or []
+    if not isinstance(meetings, list):
+        raise ValueError("work_schedule: meetings must be a list")
+
+    return {
+        'weekly': tuple(weekly.get(day, 'off') for day in WEEKDAYS),
+        'exceptions': {_parse_date(day, 'exceptions'): mode for day, mode in exceptions.items()},
+        'meetings': [_parse_meeting(meeting, index) for index, meeting in enumerate(meetings)],
+    }
+
+
+def is_structured(text):
+    """Свободный текст старого формата не начинается с '{' - его не разбираем."""
+    return bool(text) and text.lstrip().startswith('{')
+
+
+def schedule_error(value):
+    """Текст ошибки для payload'а сотрудника или None; свободный текст допустим."""
+    if value is None or (isinstance(value, str) and not is_structured(value)):
+        return None
+    try:
+        parse_schedule(value)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def dump_schedule(value):
+    """Значение для колонки work_schedule: структурированное расписание - компактным JSON."""
+    if value is None or (isinstance(value, str) and not is_structured(value)):
+        return value
+    if isinstance(value, str):
+        value = json.loads(value)
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+
+def _meets(meeting, day):
+    return (day.weekday() in meeting['weekdays']
+            and meeting['from'] <= day
+            and (meeting['until'] is None or day <= meeting['until'])
+            and (day - meeting['anchor']).days // 7 % meeting['every'] == 0
+            and day not in meeting['skip'])
+
+
+def expand(schedule, start_date, end_date):
+    """
+    Генератор вхождений расписания в окне [start_date, end_date]: (дата, тип, название),
+    тип - 'remote' для удаленного дня или 'meeting' для встречи. За окно не выходит.
+    """
+    day = start_date
+    while day <= end_date:
+        mode = schedule['exceptions'].get(day, schedule['weekly'][day.weekday()])
+        if mode != 'off':
+            if mode == 'remote':
+                yield day, 'remote', None
+            for meeting in schedule['meetings']:
+                if _meets(meeting, day):
+                    yield day, 'meeting', meeting['title']
+        day += _ONE_DAY
+
+
+def expanded_windows(texts, start_date, end_date, complete=False):
+    """
+    {текст расписания: вхождения в окне} для набора текстов через schedule_cache.
+    complete - тексты всех сотрудников со структурированным расписанием (выборка без
+    состава), тогда окно в кэше заменяется целиком. Свободный текст и неразборчивый
+    JSON дают пустой кортеж.
+    """
+    cached = schedule_cache.get(start_date, end_date)
+    windows = {}
+    for text in texts:
+        occurrences = cached.get(text)
+        if occurrences is None:
+            try:
+                occurrences = tuple(expand(parse_schedule(text), start_date, end_date))
+            except ValueError:
+                occurrences = ()
+        windows[text] = occurrences
+    if complete or any(text not in cached for text in windows):
+        schedule_cache.set(start_date, end_date, windows, complete=complete)
+    return windows
+
+
+def schedules_statement(start_date, end_date, members=None):
+    """
+    SELECT (employee_id, full_name, work_schedule, hire_date, termination_date) сотрудников
+    со структурированным расписанием, работавших хотя бы день окна.
+    """
+    stmt = select(Employee.employee_id, Employee.full_name, Employee.work_schedule,
+                  Employee.hire_date, Employee.termination_date) \
+        .where(Employee.work_schedule.like('{%'), Employee.hire_date <= end_date,
+               or_(Employee.termination_date.is_(None), Employee.termination_date >= start_date))
+    if members is not None:
+        stmt = stmt.where(Employee.employee_id.in_(members))
+    return stmt.order_by(Employee.employee_id)
+
+
+def _absent_days(events, start_date, end_date):
+    """(employee_id, дата) дней отсутствий из выборки календаря, обрезанных по окну."""
+    days = set()
+    for event in events:
+        if event['presence_type'] not in ABSENCE_TYPES:
+            continue
+        day = max(date.fromisoformat(event['start_date']), start_date)
+        last = min(date.fromisoformat(event['end_date']), end_date)
+        while day <= last:
+            days.add((event['employee_id'], day))
+            day += _ONE_DAY
+    return days
+
+
+def schedule_events(rows, start_date, end_date, absent=frozenset(), complete=False):
+    """
+    Словари вхождений в формате to_dict() событий календаря, по возрастанию даты.
+    rows - результат schedules_statement(); дни из absent и дни до приема и после
+    увольнения пропускаются. complete - rows получены без ограничения состава.
+    """
+    windows = expanded_windows({text for _, _, text, _, _ in rows}, start_date, end_date, complete)
+    events = []
+    for employee_id, full_name, text, hire_date, termination_date in rows:
+        first = max(start_date, hire_date)
+        last = min(end_date, termination_date or end_date)
+        for day, presence_type, title in windows[text]:
+            if not first <= day <= last or (employee_id, day) in absent:
+                continue
+            iso_day = day.isoformat()
+            events.append({
+                # Вхождения не хранятся в базе, id составной и не пересекается с presence_id
+                'id': f"schedule:{employee_id}:{presence_type}:{iso_day}:{title or ''}",
+                'employee_id': employee_id,
+                'employee_name': full_name,
+                'presence_type': presence_type,
+                'start_date': iso_day,
+                'end_date': iso_day,
+                'status': SCHEDULE_STATUS,
+                'comment': title,
+            })
+    events.sort(key=lambda event: event['start_date'])
+    return events
+
+
+def merge_schedule(events, rows, start_date, end_date, complete=False):
+    """События календаря вместе с вхождениями расписаний, по возрастанию даты начала."""
+    absent = _absent_days(events, start_date, end_date)
+    occurrences = schedule_events(rows, start_date, end_date, absent, complete)
+    return list(heapq.merge(events, occurrences, key=lambda event: event['start_date']))
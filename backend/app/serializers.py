@@ -0,0 +1,89 @@
+from json.encoder import encode_basestring_ascii  # C-реализация из _json, если модуль собран
+
+from flask import current_app
+
+from .models import Employee, EmployeePresence, PRIVATE_PRESENCE_TYPES, mask_presence
+
+# Колонки строки события в порядке, который ожидает PresenceEncoder
+PRESENCE_ROW_COLUMNS = (
+    EmployeePresence.presence_id,
+    EmployeePresence.employee_id,
+    Employee.full_name,
+    EmployeePresence.presence_type,
+    EmployeePresence.start_datetime,
+    EmployeePresence.end_datetime,
+    EmployeePresence.status,
+    EmployeePresence.comment,
+)
+
+# Маскированные поля берем из mask_presence, чтобы текст не разошелся с to_dict()
+_MASKED = mask_presence({'employee_id': None, 'presence_type': next(iter(PRIVATE_PRESENCE_TYPES)), 'comment': None},
+                        is_viewer_admin=False, viewer_id=None)
+
+
+def _string(value):
+    return 'null' if value is None else encode_basestring_ascii(value)
+
+
+def _date(value):
+    return 'null' if value is None else f'"{value.date().isoformat()}"'
+
+
+class PresenceEncoder:
+    """
+    Сериализация строк PRESENCE_ROW_COLUMNS сразу в JSON, байт в байт как
+    jsonify(event.to_dict(...)): ключи по алфавиту, ensure_ascii, без пробелов.
+    Решение о маскировании и закодированные замены считаются один раз на смотрящего.
+    """
+
+    def __init__(self, is_viewer_admin=False, viewer_id=None):
+        self.is_viewer_admin = is_viewer_admin
+        self.viewer_id = str(viewer_id) if viewer_id is not None else None
+        self.masked_type = _string(_MASKED['presence_type'])
+        self.masked_comment = _string(_MASKED['comment'])
+        self._names = {}  # full_name -> закодированная строка; имен гораздо меньше, чем событий
+
+    def _name(self, full_name):
+        encoded = self._names.get(full_name)
+        if encoded is None:
+            encoded = self._names[full_name] = _string(full_name)
+        return encoded
+
+    def encode(self, row):
+        presence_id, employee_id, full_name, presence_type, start, end, status, comment = row
+        if (presence_type in PRIVATE_PRESENCE_TYPES and not self.is_viewer_admin
+                and str(employee_id) != self.viewer_id):
+            encoded_type, encoded_comment = self.masked_type, self.masked_comment
+        else:
+            encoded_type, encoded_comment = _string(presence_type), _string(comment)
+        return (f'{{"comment":{encoded_comment},"employee_id":{employee_id},'
+                f'"employee_name":{self._name(full_name)},"end_date":{_date(end)},"id":{presence_id},'
+                f'"presence_type":{encoded_type},"start_date":{_date(start)},"status":{_string(status)}}}')
+
+    def as_dict(self, row):
+        """Та же строка словарем, как to_dict() - для медленного пути через jsonify."""
+        presence_id, employee_id, full_name, presence_type, start, end, status, comment = row
+        return mask_presence({
+            'id': presence_id,
+            'employee_id': employee_id,
+            'employee_name': full_name,
+            'presence_type': presence_type,
+            'start_date': start.date().isoformat() if start else None,
+            'end_date': end.date().isoformat() if end else None,
+            'status': status,
+            'comment': comment,
+        }, is_viewer_admin=self.is_viewer_admin, viewer_id=self.viewer_id)
+
+    def encode_list(self, rows):
+        """Тело ответа как у jsonify(list): массив и перевод строки в конце."""
+        return '[' + ','.join(map(self.encode, rows)) + ']\n'
+
+
+def fast_json_enabled():
+    """
+    Быстрый путь совпадает с jsonify только при настройках JSON-провайдера по умолчанию:
+    сортировка ключей, ensure_ascii и компактный вывод (в debug jsonify делает отступы).
+    """
+    provider = current_app.json
+    pretty = provider.compact is False or (provider.compact is None and current_app.debug)
+    return provider.sort_keys and provider.ensure_ascii and not pretty
@@ -0,0 +1,16 @@
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import db
+
+_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def upsert_insert():
+    """
+    Конструктор INSERT с поддержкой ON CONFLICT для текущей СУБД
+    или None, если диалект его не поддерживает.
+    """
+    return _INSERTS.get(db.session.get_bind().dialect.name)
@@ -0,0 +1,156 @@
+import hashlib
+from datetime import datetime, time, timezone
+
+from sqlalchemy import func, literal, select
+
+from . import db
+from .models import PresenceVersion
+from .upsert import upsert_insert
+
+# Псевдокорзина "любое изменение": строки в таблице нет, ее счетчик - сумма счетчиков всех
+# корзин. Каждая запись увеличивает хотя бы одну корзину, значит, растет и сумма, а общей
+# строки, на блокировке которой выстраивались бы в очередь все пишущие транзакции, нет
+ANY_BUCKET = '*'
+RESET_BUCKET = 'reset'
+# Изменения сотрудников (создание, профиль, удаление): по этой корзине процессы без
+# LISTEN/NOTIFY узнают, что их кэши составов и учетных данных устарели (presence.CacheSync)
+EMPLOYEES_BUCKET = 'employees'
+
+
+def month_buckets(start_date, end_date):
+    """Месяцы ('YYYY-MM'), которые покрывает диапазон дат."""
+    buckets = []
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        buckets.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return buckets
+
+
+def bump_versions(ranges=None):
+    """
+    Увеличивает счетчики корзин, затронутых записью событий. Вызывается до commit,
+    в той же транзакции, что и само изменение, поэтому видна всем воркерам сразу.
+    ranges - список (start_datetime, end_datetime); None - изменились все диапазоны.
+    """
+    buckets = set()
+    if ranges is None:
+        buckets.add(RESET_BUCKET)
+    else:
+        for start, end in ranges:
+            buckets.update(month_buckets(start.date(), end.date()))
+    _bump(buckets)
+
+
+def bump_employees():
+    """Увеличивает счетчик EMPLOYEES_BUCKET; вызывается до commit изменения сотрудников."""
+    _bump({EMPLOYEES_BUCKET})
+
+
+def _bump(buckets):
+    # Единый порядок блокировок строк, чтобы параллельные транзакции не ждали друг друга по кругу
+    buckets = sorted(buckets)
+    now = datetime.now(timezone.utc)
+    table = PresenceVersion.__table__
+
+    insert = upsert_insert()
+    if insert is None:
+        existing = {b for (b,) in db.session.query(PresenceVersion.bucket)
+                    .filter(PresenceVersion.bucket.in_(buckets)).with_for_update()}
+        if existing:
+            db.session.execute(table.update().where(table.c.bucket.in_(existing))
+                               .values(version=table.c.version + 1, updated_at=now))
+        missing = [b for b in buckets if b not in existing]
+        if missing:
+            db.session.execute(table.insert(), [{'bucket': b, 'version': 1, 'updated_at': now} for b in missing])
+        return
+
+    stmt = insert(table).values([{'bucket': b, 'version': 1, 'updated_at': now} for b in buckets])
+    stmt = stmt.on_conflict_do_update(index_elements=[table.c.bucket],
+                                      set_={'version': table.c.version + 1, 'updated_at': stmt.excluded.updated_at})
+    db.session.execute(stmt)
+
+
+def sync_statement():
+    """SELECT счетчика EMPLOYEES_BUCKET - изменились ли сотрудники с прошлой сверки."""
+    return select(func.coalesce(func.max(PresenceVersion.version), 0)) \
+        .where(PresenceVersion.bucket == EMPLOYEES_BUCKET)
+
+
+def _make_etag(*parts):
+    return hashlib.sha1('|'.join(str(p) for p in parts).encode()).hexdigest()
+
+
+def calendar_buckets(start_date, end_date):
+    """Корзины, от которых зависит выборка календаря за диапазон (None - без диапазона)."""
+    if start_date is None:
+        return [ANY_BUCKET]
+    return [RESET_BUCKET] + month_buckets(start_date, end_date)
+
+
+def versions_statement(start_date, end_date):
+    """
+    SELECT (bucket, version) счетчиков calendar_buckets(start_date, end_date).
+    Без диапазона - одна строка ANY_BUCKET с суммой всех счетчиков.
+    """
+    if start_date is None:
+        return select(literal(ANY_BUCKET), func.coalesce(func.sum(PresenceVersion.version), 0))
+    return select(PresenceVersion.bucket, PresenceVersion.version) \
+        .where(PresenceVersion.bucket.in_(calendar_buckets(start_date, end_date)))
+
+
+def calendar_versions(start_date, end_date):
+    """Счетчики корзин диапазона календаря: {bucket: version}."""
+    return dict(db.session.execute(versions_statement(start_date, end_date)).all())
+
+
+def range_version(start_date, end_date, versions):
+    """Кортеж счетчиков диапазона - метка записи кэша календаря, одинаковая во всех воркерах."""
+    return tuple(versions.get(b, 0) for b in calendar_buckets(start_date, end_date))
+
+
+def calendar_etag(start_date, end_date, viewer, versions=None, members=None, schedule=False):
+    """
+    ETag выборки календаря: счетчики месяцев диапазона + смотрящий (маскирование зависит от него).
+    versions - уже прочитанные счетчики {bucket: version}, если их выбирал вызывающий код.
+    members - состав сотрудников для выборки по команде/отделу/проекту: переход
+    в другую команду не меняет счетчики событий.
+    schedule - в ответ входят вхождения расписаний (их изменение сдвигает счетчик reset).
+    """
+    if versions is None:
+        versions = calendar_versions(start_date, end_date)
+    scope = () if members is None else ('members', _make_etag(*members))
+    if schedule:
+        scope += ('schedule',)
+    return _make_etag('calendar', viewer, start_date, end_date, *scope, *range_version(start_date, end_date, versions))
+
+
+def events_etag(viewer, args, versions=None):
+    """
+    ETag списка /events: любые изменения событий + смотрящий + параметры запроса.
+    versions - уже прочитанные счетчики calendar_versions(None, None).
+    """
+    if versions is None:
+        versions = calendar_versions(None, None)
+    return _make_etag('events', viewer, sorted(args.items(multi=True)), versions.get(ANY_BUCKET, 0))
+
+
+def feed_etag(scope, viewer, start_date, end_date, members):
+    """
+    ETag и Last-Modified .ics-подписки: счетчики месяцев окна, смотрящий и состав
+    сотрудников (переход в другую команду не меняет счетчики событий).
+    Окно подписки сдвигается каждый день, поэтому Last-Modified не раньше его начала.
+    """
+    buckets = [RESET_BUCKET] + month_buckets(start_date, end_date)
+    rows = db.session.query(PresenceVersion.bucket, PresenceVersion.version, PresenceVersion.updated_at) \
+        .filter(PresenceVersion.bucket.in_(buckets)).all()
+    versions = {bucket: version for bucket, version, _ in rows}
+
+    window_start = datetime.combine(start_date, time.min, tzinfo=timezone.utc)
+    # SQLite возвращает время без часового пояса
+    updated = [u if u.tzinfo else u.replace(tzinfo=timezone.utc) for _, _, u in rows if u]
+    last_modified = max(updated + [window_start])
+
+    etag = _make_etag('ics', scope, viewer, start_date, end_date, _make_etag(*members),
+                      *(versions.get(b, 0) for b in buckets))
+    return etag, last_modified
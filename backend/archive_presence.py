@@ -0,0 +1,67 @@
+import argparse
+from datetime import date
+
+from app import archive, create_app, partitions
+
+
+def convert(args):
+    created = partitions.convert_to_partitioned(ahead=args.ahead)
+    if created:
+        print(f"✅ employee_presence секционирована по годам: {created[0]}..{created[-1]}")
+    else:
+        print("Таблица уже секционирована.")
+
+
+def ensure(args):
+    created = partitions.ensure_partitions(ahead=args.ahead)
+    print(f"✅ Созданы секции: {created}" if created else "Все секции уже есть.")
+
+
+def archive_years(args):
+    if args.year:
+        years = [args.year]
+    else:
+        oldest = archive.oldest_year()
+        years = list(range(oldest, args.before)) if oldest else []
+    for year in years:
+        try:
+            rows = archive.archive_year(year)
+        except archive.ArchiveError as e:
+            print(f"❌ {e}")
+            continue
+        print(f"✅ {year}: {rows} строк -> {archive.archive_path(year)}")
+
+
+def show(args):
+    for entry in archive.archived_years():
+        print(f"архив {entry['year']}: {entry['rows']} строк, {entry['bytes'] / 1024 / 1024:.1f} МБ")
+    if partitions.is_partitioned():
+        for name, rows in partitions.list_partitions():
+            print(f"секция {name}: ~{rows} строк")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Секционирование employee_presence и архивирование прошлых лет.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('convert', help="секционировать таблицу по годам (PostgreSQL, один раз)")
+    p.add_argument('--ahead', type=int, default=1, help="сколько будущих лет создать сразу")
+    p.set_defaults(handler=convert)
+
+    p = commands.add_parser('ensure', help="создать секции текущего и следующих лет (раз в год)")
+    p.add_argument('--ahead', type=int, default=1)
+    p.set_defaults(handler=ensure)
+
+    p = commands.add_parser('archive', help="перенести закрытые годы в Parquet")
+    group = p.add_mutually_exclusive_group(required=True)
+    group.add_argument('--year', type=int, help="один год")
+    group.add_argument('--before', type=int, help=f"все годы раньше указанного, например {date.today().year - 2}")
+    p.set_defaults(handler=archive_years)
+
+    p = commands.add_parser('list', help="архивные годы и секции")
+    p.set_defaults(handler=show)
+
+    args = parser.parse_args()
+    app = create_app()
+    with app.app_context():
+        args.handler(args)
@@ -0,0 +1,57 @@
+"""
+Бенчмарк поиска свободных дней: растеризация отсутствий в матрицу сотрудники x дни
+и векторные выборки по ней. Данные синтетические, база не нужна.
+
+Запуск из папки backend:
+    python -m bench.availability --employees 5000 --days 365
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import date, datetime, timedelta
+
+from app.availability import busy_bitmap, free_days
+
+
+def synthetic_absences(employee_ids, start_date, n_days, per_employee, rng):
+    absences = []
+    for employee_id in employee_ids:
+        for _ in range(per_employee):
+            start = datetime.combine(start_date + timedelta(days=rng.randrange(n_days)), datetime.min.time())
+            absences.append((employee_id, start, start + timedelta(days=rng.randrange(10))))
+    return absences
+
+
+def timed(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--employees', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--absences-per-employee', type=int, default=6)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    start_date = date(2025, 1, 1)
+    employee_ids = list(range(1, args.employees + 1))
+    absences = synthetic_absences(employee_ids, start_date, args.days, args.absences_per_employee, rng)
+    busy = busy_bitmap(employee_ids, absences, start_date, args.days)
+
+    print(f"{args.employees} employees x {args.days} days, {len(absences)} absences")
+    print(f"rasterize:      {timed(lambda: busy_bitmap(employee_ids, absences, start_date, args.days), args.repeats):8.2f} ms")
+    print(f"all free:       {timed(lambda: free_days(busy, start_date), args.repeats):8.2f} ms")
+    print(f">= 90% free:    {timed(lambda: free_days(busy, start_date, min_percent=90), args.repeats):8.2f} ms")
+    print(f"best 10 days:   {timed(lambda: free_days(busy, start_date, best=10), args.repeats):8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
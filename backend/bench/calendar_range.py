@@ -0,0 +1,96 @@
+"""
+Бенчмарк выборки месяца из /api/calendar/events при росте employee_presence.
+
+Запуск из папки backend (база берется из DATABASE_URL):
+    python -m bench.calendar_range --sizes 10000 100000 1000000 10000000
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import date, datetime, timedelta
+
+from app import create_app, db
+from app.intervals import filter_overlapping
+from app.models import Employee, EmployeePresence, RoleEnum
+
+HISTORY_DAYS = 365 * 10
+BATCH_SIZE = 10000
+PRESENCE_TYPES = ['vacation', 'business_trip', 'sick_leave', 'day_off', 'meeting']
+
+
+def ensure_employees(count):
+    existing = [e for (e,) in db.session.query(Employee.employee_id).limit(count).all()]
+    for i in range(len(existing), count):
+        employee = Employee(full_name=f'Bench {i}', email=f'bench{i}@bench.local', role=RoleEnum.user,
+                            password_hash='-')
+        db.session.add(employee)
+    db.session.commit()
+    return [e for (e,) in db.session.query(Employee.employee_id).limit(count).all()]
+
+
+def grow_presence(target, employee_ids, first_day, rng):
+    """Догружает таблицу событий до target строк пакетными INSERT."""
+    current = db.session.query(EmployeePresence).count()
+    table = EmployeePresence.__table__
+    while current < target:
+        batch = []
+        for _ in range(min(BATCH_SIZE, target - current)):
+            start = datetime.combine(first_day + timedelta(days=rng.randrange(HISTORY_DAYS)), datetime.min.time())
+            batch.append({
+                'employee_id': rng.choice(employee_ids),
+                'presence_type': rng.choice(PRESENCE_TYPES),
+                'start_datetime': start,
+                'end_datetime': start + timedelta(days=rng.randrange(14), hours=23, minutes=59, seconds=59),
+                'status': rng.choice(['approved', 'completed', 'planned']),
+            })
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+        current += len(batch)
+
+
+def month_view(month_start):
+    month_end = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    query = filter_overlapping(EmployeePresence.query, month_start, month_end)
+    query = query.filter(EmployeePresence.status.in_(['approved', 'completed']))
+    return query.order_by(EmployeePresence.start_datetime.asc()).all()
+
+
+def measure(first_day, repeats, rng):
+    month_view(first_day)  # прогрев
+    timings = []
+    for _ in range(repeats):
+        offset = rng.randrange(HISTORY_DAYS - 31)
+        month_start = (first_day + timedelta(days=offset)).replace(day=1)
+        started = time.perf_counter()
+        rows = month_view(month_start)
+        timings.append(time.perf_counter() - started)
+        db.session.expunge_all()
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1], len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000, 10000000])
+    parser.add_argument('--employees', type=int, default=2000)
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        employee_ids = ensure_employees(args.employees)
+        first_day = date.today() - timedelta(days=HISTORY_DAYS)
+
+        print(f"{'rows':>12} {'p50, ms':>10} {'p99, ms':>10} {'events/month':>13}")
+        for size in sorted(args.sizes):
+            grow_presence(size, employee_ids, first_day, rng)
+            p50, p99, found = measure(first_day, args.repeats, rng)
+            print(f"{size:>12} {p50 * 1000:>10.2f} {p99 * 1000:>10.2f} {found:>13}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+Бенчмарк основных сценариев API через тестовый клиент Flask: логин, месяц
+календаря, создание события и его утверждение. По каждому эндпоинту выводятся
+пропускная способность, p50/p99 и среднее число SQL-запросов на запрос.
+
+Запуск из папки backend на SQLite или локальном PostgreSQL (DATABASE_URL):
+    python -m bench.synth --employees 1000 --reset
+    python -m bench.harness --requests 500 --threads 4
+С --generate N база заполняется перед прогоном (таблицы пересоздаются).
+--cold отключает кэш календаря, чтобы каждая выборка шла в базу.
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import create_app, db
+from app.cache import calendar_cache
+from app.models import Employee, RoleEnum
+from bench.synth import ADMIN_EMAIL, SYNTH_PASSWORD, generate
+
+SCENARIOS = ['login', 'calendar_month', 'create_event', 'approve']
+
+_queries = threading.local()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    _queries.count = getattr(_queries, 'count', 0) + 1
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies, self.queries, self.statuses = [], [], {}
+        self._lock = threading.Lock()
+
+    def call(self, fn):
+        _queries.count = 0
+        started = time.perf_counter()
+        response = fn()
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies.append(elapsed)
+            self.queries.append(_queries.count)
+            self.statuses[response.status_code] = self.statuses.get(response.status_code, 0) + 1
+        return response
+
+
+def login(client, email):
+    response = client.post('/api/login', json={'email': email, 'password': SYNTH_PASSWORD})
+    return {'Authorization': f"Bearer {response.json['access_token']}"}
+
+
+def make_requests(scenario, client, ctx, rng):
+    """Функция одного запроса сценария (без аргументов), ctx - общие данные прогона."""
+    if scenario == 'login':
+        email = rng.choice(ctx['emails'])
+        return lambda: client.post('/api/login', json={'email': email, 'password': SYNTH_PASSWORD})
+    if scenario == 'calendar_month':
+        month = (date.today() - timedelta(days=rng.randrange(365 * 2))).replace(day=1)
+        month_end = (month.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        headers = rng.choice(ctx['user_headers'] + [ctx['admin_headers']])
+        return lambda: client.get(f'/api/calendar/events?start_date={month}&end_date={month_end}', headers=headers)
+    if scenario == 'create_event':
+        start = date.today() + timedelta(days=rng.randrange(30, 365))
+        payload = {'event_type': 'vacation', 'start_date': start.isoformat(),
+                   'end_date': (start + timedelta(days=rng.randrange(7))).isoformat()}
+        headers = rng.choice(ctx['user_headers'])
+
+        def create():
+            response = client.post('/api/events', json=payload, headers=headers)
+            if response.status_code == 201:
+                with ctx['lock']:
+                    ctx['planned'].append(response.json['id'])
+            return response
+        return create
+    if scenario == 'approve':
+        with ctx['lock']:
+            event_id = ctx['planned'].pop() if ctx['planned'] else None
+        if event_id is None:
+            return None
+        return lambda: client.put(f'/api/events/{event_id}/status', json={'status': 'approved'},
+                                  headers=ctx['admin_headers'])
+    raise ValueError(scenario)
+
+
+def run(app, scenario, ctx, requests, threads, seed):
+    recorder = Recorder()
+    per_thread = max(1, requests // threads)
+
+    def worker(index):
+        client = app.test_client()
+        rng = random.Random(seed * 1000 + index)
+        for _ in range(per_thread):
+            request = make_requests(scenario, client, ctx, rng)
+            if request is None:
+                break
+            recorder.call(request)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - started, recorder
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS)
+    parser.add_argument('--requests', type=int, default=500, help="запросов на сценарий")
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--users', type=int, default=50, help="сколько сотрудников делают запросы")
+    parser.add_argument('--generate', type=int, metavar='N', help="сгенерировать организацию из N сотрудников")
+    parser.add_argument('--cold', action='store_true', help="без кэша календаря")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.generate:
+            generate(args.generate, seed=args.seed, reset=True)
+        if args.cold:
+            calendar_cache.configure(maxsize=0)
+        emails = [e for (e,) in db.session.query(Employee.email).filter(Employee.role == RoleEnum.user)
+                  .order_by(Employee.employee_id).limit(args.users)]
+    if not emails:
+        raise SystemExit("No employees found; run python -m bench.synth first or pass --generate")
+
+    client = app.test_client()
+    ctx = {
+        'emails': emails,
+        'user_headers': [login(client, email) for email in emails],
+        'admin_headers': login(client, ADMIN_EMAIL),
+        'planned': [],
+        'lock': threading.Lock(),
+    }
+
+    scenarios = args.scenario or SCENARIOS
+    # Утверждать нечего, пока не созданы события
+    if 'approve' in scenarios and 'create_event' not in scenarios:
+        run(app, 'create_event', ctx, args.requests, args.threads, args.seed)
+
+    print(f"{'endpoint':<16} {'requests':>8} {'req/s':>9} {'p50, ms':>9} {'p99, ms':>9} {'queries':>8}  statuses")
+    for scenario in scenarios:
+        elapsed, recorder = run(app, scenario, ctx, args.requests, args.threads, args.seed)
+        latencies = sorted(recorder.latencies)
+        if not latencies:
+            print(f"{scenario:<16} {0:>8}")
+            continue
+        p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+        print(f"{scenario:<16} {len(latencies):>8} {len(latencies) / elapsed:>9.1f} "
+              f"{statistics.median(latencies) * 1000:>9.2f} {p99 * 1000:>9.2f} "
+              f"{statistics.mean(recorder.queries):>8.1f}  {recorder.statuses}")
+
+
+if __name__ == '__main__':
+    main()
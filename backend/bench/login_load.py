@@ -0,0 +1,79 @@
+"""
+Нагрузочный бенчмарк /api/login: параллельные логины через тестовый клиент Flask.
+
+Запуск из папки backend (база берется из DATABASE_URL):
+    python -m bench.login_load --users 200 --threads 32 --logins 2000
+Размер пула проверки паролей задается LOGIN_MAX_CONCURRENCY.
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from app import create_app, db
+from app.hashing import password_verifier
+from app.models import Employee
+from app.provisioning import provision_employees
+
+PASSWORD = 'bench-password'
+
+
+def ensure_users(count):
+    emails = [f'login{i}@bench.local' for i in range(count)]
+    existing = {e for (e,) in db.session.query(Employee.email).filter(Employee.email.in_(emails))}
+    missing = [{'email': email, 'full_name': email, 'password': PASSWORD} for email in emails if email not in existing]
+    if missing:
+        provision_employees(missing)
+    return emails
+
+
+def run(app, emails, threads, logins):
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    per_thread = logins // threads
+
+    def worker(offset):
+        client = app.test_client()
+        local = []
+        for i in range(per_thread):
+            email = emails[(offset * per_thread + i) % len(emails)]
+            started = time.perf_counter()
+            response = client.post('/api/login', json={'email': email, 'password': PASSWORD})
+            local.append(time.perf_counter() - started)
+            with lock:
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - started, sorted(latencies), statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--logins', type=int, default=2000)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        emails = ensure_users(args.users)
+
+    elapsed, latencies, statuses = run(app, emails, args.threads, args.logins)
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+    print(f"logins: {len(latencies)}, threads: {args.threads}, statuses: {statuses}")
+    print(f"throughput: {len(latencies) / elapsed:.1f} req/s")
+    print(f"p50: {statistics.median(latencies) * 1000:.1f} ms, p99: {p99 * 1000:.1f} ms")
+    print(f"verifier: {password_verifier.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Микробенчмарк сериализации событий: to_dict() + jsonify против PresenceEncoder
+на кортежах колонок. Перед замером проверяет, что результаты совпадают байт в байт
+для админа, владельца и постороннего смотрящего. База не нужна.
+
+Запуск из папки backend:
+    python -m bench.serialize --rows 50000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from app import create_app
+from app.models import Employee, EmployeePresence
+from app.serializers import PresenceEncoder
+
+TYPES = ['vacation', 'business_trip', 'sick_leave', 'day_off', 'meeting']
+
+
+def synthetic_rows(count, rng):
+    employees = [Employee(employee_id=i, full_name=f'Сотрудник {i}') for i in range(1, 201)]
+    objects, rows = [], []
+    for presence_id in range(1, count + 1):
+        employee = rng.choice(employees)
+        start = datetime(2025, 1, 1) + timedelta(days=rng.randrange(365))
+        end = start + timedelta(days=rng.randrange(10), hours=23, minutes=59, seconds=59)
+        presence_type = rng.choice(TYPES)
+        status = rng.choice(['approved', 'completed', 'planned'])
+        comment = rng.choice([None, 'Плановый отпуск', 'trip "Berlin"'])
+        objects.append(EmployeePresence(presence_id=presence_id, employee_id=employee.employee_id, employee=employee,
+                                        presence_type=presence_type, start_datetime=start, end_datetime=end,
+                                        status=status, comment=comment))
+        rows.append((presence_id, employee.employee_id, employee.full_name, presence_type, start, end, status,
+                     comment))
+    return objects, rows
+
+
+def best_of(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app()
+    objects, rows = synthetic_rows(args.rows, random.Random(42))
+
+    with app.test_request_context():
+        for is_admin, viewer_id in [(True, '1'), (False, '7'), (False, None)]:
+            before = app.json.response([o.to_dict(is_viewer_admin=is_admin, viewer_id=viewer_id)
+                                        for o in objects]).get_data()
+            after = PresenceEncoder(is_viewer_admin=is_admin, viewer_id=viewer_id).encode_list(rows).encode()
+            if before != after:
+                raise SystemExit(f"Output differs for admin={is_admin}, viewer={viewer_id}")
+
+        slow = best_of(lambda: app.json.response([o.to_dict(is_viewer_admin=False, viewer_id='7')
+                                                  for o in objects]), args.repeats)
+        fast = best_of(lambda: PresenceEncoder(is_viewer_admin=False, viewer_id='7').encode_list(rows),
+                       args.repeats)
+
+    print(f"rows: {args.rows}, output identical")
+    print(f"to_dict + jsonify: {args.rows / slow:>12,.0f} rows/s")
+    print(f"PresenceEncoder:   {args.rows / fast:>12,.0f} rows/s  ({slow / fast:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
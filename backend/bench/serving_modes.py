@@ -0,0 +1,102 @@
+"""
+Сравнение пропускной способности WSGI- и ASGI-режимов на одних и тех же запросах:
+логин, месяц календаря и профиль.
+
+Оба сервера поднимаются отдельно на одной базе, например из папки backend:
+    gunicorn -w 4 -b 127.0.0.1:8001 "app:create_app()"
+    uvicorn asgi:app --workers 4 --port 8002
+Затем:
+    python -m bench.serving_modes --email admin@example.com --password secret \\
+        --target wsgi=http://127.0.0.1:8001 --target asgi=http://127.0.0.1:8002 --concurrency 64
+"""
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+class Client:
+    """Keep-alive HTTP-клиент на одного рабочего потока."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+
+    def request(self, method, path, payload=None, token=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        body = json.dumps(payload) if payload is not None else None
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        return response.status, response.read()
+
+
+def scenarios(args, token):
+    month = f'start_date={args.month}-01&end_date={args.month}-28'
+    return {
+        'login': ('POST', '/api/login', {'email': args.email, 'password': args.password}, None),
+        'calendar': ('GET', f'/api/calendar/events?{month}', None, token),
+        'profile': ('GET', '/api/profile', None, token),
+    }
+
+
+def run(url, request, concurrency, duration):
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        client = Client(url)
+        local, local_statuses = [], {}
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            status, _ = client.request(*request)
+            local.append(time.perf_counter() - started)
+            local_statuses[status] = local_statuses.get(status, 0) + 1
+        with lock:
+            latencies.extend(local)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - started, sorted(latencies), statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', action='append', required=True, help="имя=URL, можно указать несколько раз")
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--month', default='2025-03', help="месяц календаря, YYYY-MM")
+    parser.add_argument('--scenario', action='append', choices=['login', 'calendar', 'profile'])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0, help="секунд на сценарий")
+    args = parser.parse_args()
+
+    for target in args.target:
+        name, url = target.split('=', 1)
+        status, body = Client(url).request('POST', '/api/login', {'email': args.email, 'password': args.password})
+        if status != 200:
+            raise SystemExit(f"{name}: login failed with {status}")
+        token = json.loads(body)['access_token']
+
+        for scenario, request in scenarios(args, token).items():
+            if args.scenario and scenario not in args.scenario:
+                continue
+            elapsed, latencies, statuses = run(url, request, args.concurrency, args.duration)
+            p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+            print(f"{name:>6} {scenario:<9} {len(latencies) / elapsed:8.1f} req/s  "
+                  f"p50 {statistics.median(latencies) * 1000:7.1f} ms  p99 {p99 * 1000:7.1f} ms  {statuses}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Нагрузочный тест /api/events/stream: много одновременных SSE-подключений
+и задержка доставки уведомлений от POST /api/events до каждого клиента.
+
+Нужен запущенный сервер с gevent-воркером, например из папки backend:
+    gunicorn -k gevent -w 1 --worker-connections 10000 -b 127.0.0.1:8000 "app:create_app()"
+Затем:
+    python -m bench.sse_load --url http://127.0.0.1:8000 --email admin@example.com --password secret \\
+        --clients 2000 --events 20
+Клиенты - сокеты asyncio в одном потоке, тест сам не создает поток на подключение.
+Учетная запись должна быть админской: события создаются от ее имени (тип meeting).
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+
+def api(url, path, payload=None, token=None):
+    request = urllib.request.Request(url + path, data=json.dumps(payload).encode() if payload is not None else None,
+                                     headers={'Content-Type': 'application/json'})
+    if token:
+        request.add_header('Authorization', f'Bearer {token}')
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+async def listen(host, port, token, expected, received, ready):
+    """Одно SSE-подключение: записывает время получения каждого уведомления 'created'."""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET /api/events/stream?jwt={token} HTTP/1.1\r\nHost: {host}\r\n"
+                 f"Accept: text/event-stream\r\n\r\n".encode())
+    await writer.drain()
+    ready.append(1)
+    event_type = None
+    seen = 0
+    try:
+        while seen < expected:
+            line = await reader.readline()
+            if not line:
+                break
+            line = line.strip()
+            if line.startswith(b'event:'):
+                event_type = line[6:].strip()
+            elif line.startswith(b'data:') and event_type == b'created':
+                message = json.loads(line[5:])
+                received.append((message['event']['id'], time.perf_counter()))
+                seen += 1
+    finally:
+        writer.close()
+
+
+async def run(args):
+    parts = urlsplit(args.url)
+    token = api(args.url, '/api/login', {'email': args.email, 'password': args.password})['access_token']
+    employee_id = api(args.url, '/api/profile', token=token)['id']
+
+    received, ready = [], []
+    listeners = [asyncio.create_task(listen(parts.hostname, parts.port or 80, token, args.events, received, ready))
+                 for _ in range(args.clients)]
+    while len(ready) < args.clients:
+        await asyncio.sleep(0.1)
+    # Дать серверу зарегистрировать подписки
+    await asyncio.sleep(args.warmup)
+
+    loop = asyncio.get_running_loop()
+    sent = {}
+    for i in range(args.events):
+        started = time.perf_counter()
+        event = await loop.run_in_executor(None, api, args.url, '/api/events', {
+            'employee_id': employee_id, 'event_type': 'meeting',
+            'start_date': '2030-01-01', 'end_date': '2030-01-01', 'comment': f'sse bench {i}',
+        }, token)
+        sent[event['id']] = started
+        await asyncio.sleep(args.interval)
+
+    await asyncio.wait(listeners, timeout=args.timeout)
+    for task in listeners:
+        task.cancel()
+
+    for event_id in sent:
+        await loop.run_in_executor(None, lambda: urllib.request.urlopen(urllib.request.Request(
+            f'{args.url}/api/events/{event_id}', method='DELETE', headers={'Authorization': f'Bearer {token}'})))
+    return sent, received
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--events', type=int, default=20)
+    parser.add_argument('--interval', type=float, default=0.2, help="пауза между событиями, с")
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    sent, received = asyncio.run(run(args))
+    latencies = sorted(at - sent[event_id] for event_id, at in received if event_id in sent)
+    expected = args.clients * args.events
+    print(f"clients: {args.clients}, events: {args.events}, delivered: {len(latencies)}/{expected}")
+    if latencies:
+        p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+        print(f"latency p50: {statistics.median(latencies) * 1000:.1f} ms, p99: {p99 * 1000:.1f} ms, "
+              f"max: {latencies[-1] * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Генератор синтетической организации: должности, отделы, команды, проекты,
+сотрудники со связями (дополнительные отделы и команды, проекты с процентом
+участия, кратным 10) и события присутствия за несколько лет.
+
+Запуск из папки backend (база берется из DATABASE_URL, таблицы пересоздаются с --reset):
+    python -m bench.synth --employees 1000 --years 3 --reset
+Все сотрудники получают пароль SYNTH_PASSWORD, админ - admin@synth.local.
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
+
+from app import create_app, db, occupancy
+from app.models import Department, Employee, EmployeePresence, EmployeeProject, Position, Project, Team, \
+    employee_departments_association, employee_teams_association
+from app.versions import bump_versions
+
+SYNTH_PASSWORD = 'synth-password'
+ADMIN_EMAIL = 'admin@synth.local'
+BATCH_SIZE = 10000
+
+# (тип, доля среди событий, длительность в днях от и до)
+EVENT_MIX = [
+    ('vacation', 0.2, 5, 14),
+    ('business_trip', 0.1, 2, 5),
+    ('sick_leave', 0.15, 1, 7),
+    ('day_off', 0.2, 1, 1),
+    ('meeting', 0.35, 1, 1),
+]
+WORK_MODES = ['office', 'remote', 'hybrid']
+
+
+def employee_email(index):
+    return f'synth{index}@synth.local'
+
+
+def _insert(table, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(table.insert(), rows[start:start + BATCH_SIZE])
+
+
+def _sync_sequences():
+    """Явные id не двигают sequence в PostgreSQL - выставляем их по максимуму."""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for table, column in [('positions', 'position_id'), ('departments', 'department_id'), ('teams', 'team_id'),
+                          ('projects', 'project_id'), ('employees', 'employee_id'),
+                          ('employee_presence', 'presence_id')]:
+        db.session.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                                f"COALESCE((SELECT MAX({column}) FROM {table}), 1))"))
+
+
+def generate_org(n_employees, rng):
+    """Справочники и сотрудники; возвращает id сотрудников (1..n, последний - админ)."""
+    n_departments = max(1, n_employees // 50)
+    n_teams = max(1, n_employees // 8)
+    n_projects = max(1, n_employees // 20)
+    today = date.today()
+
+    _insert(Position.__table__, [{'position_id': i, 'name': f'Position {i}'} for i in range(1, 21)])
+    _insert(Department.__table__, [{'department_id': i, 'name': f'Department {i}'}
+                                   for i in range(1, n_departments + 1)])
+    _insert(Team.__table__, [{'team_id': i, 'name': f'Team {i}'} for i in range(1, n_teams + 1)])
+    _insert(Project.__table__, [{'project_id': i, 'name': f'Project {i}',
+                                 'start_date': today - timedelta(days=rng.randrange(1000)), 'end_date': None}
+                                for i in range(1, n_projects + 1)])
+
+    # Хэш один на всех: честное хэширование 100k паролей заняло бы часы
+    password_hash = generate_password_hash(SYNTH_PASSWORD)
+    employees, departments, teams, projects = [], [], [], []
+    for i in range(1, n_employees + 1):
+        is_admin = i == n_employees
+        team_id = rng.randrange(1, n_teams + 1)
+        # Команды сгруппированы по отделам, чтобы структура была похожа на настоящую
+        department_id = min(n_departments, 1 + (team_id - 1) * n_departments // n_teams)
+        employees.append({
+            'employee_id': i,
+            'full_name': f'Synth Employee {i}',
+            'email': ADMIN_EMAIL if is_admin else employee_email(i),
+            'password_hash': password_hash,
+            'hire_date': today - timedelta(days=rng.randrange(365 * 8)),
+            'role': 'admin' if is_admin else 'user',
+            'work_mode': rng.choice(WORK_MODES),
+            'position_id': rng.randrange(1, 21),
+            'main_department_id': department_id,
+            'main_team_id': team_id,
+        })
+        for extra in rng.sample(range(1, n_departments + 1), min(n_departments, rng.choice([0, 0, 1, 2]))):
+            if extra != department_id:
+                departments.append({'employee_id': i, 'department_id': extra})
+        for extra in rng.sample(range(1, n_teams + 1), min(n_teams, rng.choice([0, 0, 1, 2]))):
+            teams.append({'employee_id': i, 'team_id': extra})
+        # Проценты участия кратны 10 и в сумме не больше 100 (chk_participation_percentage)
+        remaining = 10
+        for project_id in rng.sample(range(1, n_projects + 1), min(n_projects, rng.choice([1, 1, 2, 3]))):
+            if remaining == 0:
+                break
+            share = rng.randint(1, remaining)
+            projects.append({'employee_id': i, 'project_id': project_id, 'participation_percentage': share * 10})
+            remaining -= share
+
+    _insert(Employee.__table__, employees)
+    _insert(employee_departments_association, departments)
+    _insert(employee_teams_association, teams)
+    _insert(EmployeeProject.__table__, projects)
+    return [e['employee_id'] for e in employees]
+
+
+def _status(presence_type, start, today, rng):
+    if presence_type in ('sick_leave', 'day_off', 'meeting'):
+        return 'completed'
+    if start.date() > today:
+        return rng.choice(['planned', 'planned', 'approved'])
+    return rng.choice(['approved'] * 8 + ['rejected'])
+
+
+def generate_presence(employee_ids, years, events_per_year, rng):
+    """События за years лет назад и год вперед пакетами по BATCH_SIZE. Возвращает число строк."""
+    today = date.today()
+    first_day = today - timedelta(days=365 * years)
+    span_days = 365 * (years + 1)
+    per_employee = events_per_year * (years + 1)
+    types = [m[0] for m in EVENT_MIX]
+    weights = [m[1] for m in EVENT_MIX]
+    durations = {m[0]: (m[2], m[3]) for m in EVENT_MIX}
+
+    table = EmployeePresence.__table__
+    presence_id, batch, total = 0, [], 0
+    for employee_id in employee_ids:
+        for presence_type in rng.choices(types, weights, k=per_employee):
+            start = datetime.combine(first_day + timedelta(days=rng.randrange(span_days)), datetime.min.time())
+            low, high = durations[presence_type]
+            presence_id += 1
+            batch.append({
+                'presence_id': presence_id,
+                'employee_id': employee_id,
+                'presence_type': presence_type,
+                'start_datetime': start,
+                'end_datetime': start + timedelta(days=rng.randint(low, high) - 1, hours=23, minutes=59, seconds=59),
+                'status': _status(presence_type, start, today, rng),
+                'comment': None,
+            })
+            if len(batch) >= BATCH_SIZE:
+                db.session.execute(table.insert(), batch)
+                total += len(batch)
+                batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+        total += len(batch)
+    return total
+
+
+def generate(n_employees, years=2, events_per_year=12, seed=42, reset=False):
+    """Заполняет базу текущего приложения; вызывать в app_context(). Возвращает (сотрудники, события)."""
+    rng = random.Random(seed)
+    if reset:
+        db.drop_all()
+    db.create_all()
+    if db.session.query(Employee.employee_id).first() is not None:
+        raise SystemExit("Database already has employees; use --reset to recreate tables")
+
+    employee_ids = generate_org(n_employees, rng)
+    db.session.commit()
+    events = generate_presence(employee_ids, years, events_per_year, rng)
+    _sync_sequences()
+    bump_versions()
+    db.session.commit()
+    occupancy.rebuild()
+    return len(employee_ids), events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--employees', type=int, default=1000, help="от 100 до 100000")
+    parser.add_argument('--years', type=int, default=2, help="лет истории (плюс год вперед)")
+    parser.add_argument('--events-per-year', type=int, default=12)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reset', action='store_true', help="удалить и создать таблицы заново")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        started = time.perf_counter()
+        employees, events = generate(args.employees, args.years, args.events_per_year, args.seed, args.reset)
+        print(f"employees: {employees}, presence rows: {events}, {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
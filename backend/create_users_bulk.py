@@ -0,0 +1,32 @@
+import argparse
+import json
+
+from app import create_app
+from app.provisioning import provision_employees
+
+
+def create_users_bulk(path):
+    """Создает сотрудников из JSON-файла (массив объектов формата POST /api/users) напрямую в базе."""
+    with open(path, encoding='utf-8') as f:
+        items = json.load(f)
+
+    if not isinstance(items, list):
+        print("❌ ОШИБКА! Файл должен содержать JSON-массив пользователей.")
+        return
+
+    app = create_app()
+    with app.app_context():
+        print(f"Создание {len(items)} пользователей из {path}...")
+        created, errors = provision_employees(items)
+
+    print(f"\n✅ Создано пользователей: {len(created)}")
+    if errors:
+        print(f"❌ Ошибок: {len(errors)}")
+        for error in errors:
+            print(f"  строка {error['row']}: {error['msg']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Массовое создание пользователей из JSON-файла.")
+    parser.add_argument('path', help="JSON-файл с массивом пользователей (см. app/example_req.json)")
+    create_users_bulk(parser.parse_args().path)
@@ -0,0 +1,15 @@
+from app import create_app
+from app.occupancy import rebuild
+
+
+def rebuild_occupancy():
+    """Полностью пересчитывает агрегаты загрузки офиса по employee_presence и employees."""
+    app = create_app()
+    with app.app_context():
+        print("Пересчет агрегата загрузки офиса...")
+        rows = rebuild()
+    print(f"✅ Готово. Строк в агрегате: {rows}")
+
+
+if __name__ == "__main__":
+    rebuild_occupancy()
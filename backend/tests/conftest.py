@@ -0,0 +1,122 @@
+import os
+from contextlib import contextmanager
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+# По умолчанию тесты идут на SQLite в памяти. TEST_DATABASE_URL=postgresql://... - на настоящем
+# PostgreSQL (tstzrange, SKIP LOCKED, время с часовым поясом); база пересоздается в каждом тесте
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite://')
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from app.cache import calendar_cache, credential_cache, feed_cache, membership_cache, schedule_cache  # noqa: E402
+from app.presence import cache_sync  # noqa: E402
+from app.models import Department, Employee, Position, Project, RoleEnum, Team  # noqa: E402
+from app.replicas import replica_router  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+def is_postgres():
+    return db.engine.dialect.name == 'postgresql'
+
+
+@pytest.fixture(autouse=True)
+def database(app):
+    """Пустая схема и пустые кэши процесса на каждый тест; тест идет внутри app_context."""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        for cache in (calendar_cache, membership_cache):
+            cache.clear()
+        for cache in (credential_cache, schedule_cache, feed_cache):
+            cache.configure()
+        cache_sync.configure()
+        replica_router.configure()
+        yield db
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def auth_headers(employee_id, role):
+    return {'Authorization': 'Bearer ' + create_access_token(identity=str(employee_id),
+                                                             additional_claims={'role': role})}
+
+
+# Хэширование пароля медленное намеренно - считаем его один раз на все тесты
+PASSWORD = 'pw'
+PASSWORD_HASH = generate_password_hash(PASSWORD)
+
+
+def make_employee(full_name, email, role=RoleEnum.user, **fields):
+    employee = Employee(full_name=full_name, email=email, role=role, hire_date=date(2020, 1, 1),
+                        password_hash=PASSWORD_HASH, **fields)
+    db.session.add(employee)
+    db.session.flush()
+    return employee
+
+
+@pytest.fixture
+def org():
+    """Должность, два отдела, команда, проект, админ (отдел 1) и сотрудник (отдел 2) в одной команде."""
+    position = Position(name='Dev')
+    departments = [Department(name='D1'), Department(name='D2')]
+    team = Team(name='T1')
+    project = Project(name='P1')
+    db.session.add_all([position, *departments, team, project])
+    db.session.flush()
+    admin = make_employee('Admin', 'admin@example.com', RoleEnum.admin, position_id=position.position_id,
+                          main_department_id=departments[0].department_id, main_team_id=team.team_id)
+    user = make_employee('User', 'user@example.com', main_department_id=departments[1].department_id,
+                         main_team_id=team.team_id)
+    db.session.commit()
+    return SimpleNamespace(
+        admin_id=admin.employee_id, user_id=user.employee_id, team_id=team.team_id,
+        department_ids=[d.department_id for d in departments], project_id=project.project_id,
+        position_id=position.position_id,
+        admin=auth_headers(admin.employee_id, 'admin'), user=auth_headers(user.employee_id, 'user'),
+    )
+
+
+@pytest.fixture
+def count_queries():
+    """
+    Счетчик SQL-запросов: with count_queries() as statements: ... - statements получает
+    текст каждого запроса, выполненного движком внутри блока.
+    """
+    @contextmanager
+    def counter():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    return counter
+
+
+def post_events(client, headers, events):
+    """Создает события через массовый импорт; возвращает ответ импорта."""
+    response = client.post('/api/events/bulk', json=events, headers=headers)
+    assert response.status_code == 201, response.json
+    return response.json
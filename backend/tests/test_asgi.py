@@ -0,0 +1,93 @@
+import pytest
+from flask_jwt_extended import decode_token
+from starlette.testclient import TestClient
+from werkzeug.security import generate_password_hash
+
+from conftest import PASSWORD, is_postgres, make_employee, post_events
+from app import db
+from app.asgi import create_asgi_app
+from app.cache import credential_cache
+from app.models import Employee, RoleEnum
+from app.presence import apply_notification
+
+
+@pytest.fixture
+def asgi():
+    """
+    ASGI-приложение с async-движком. Его пул - отдельные соединения, поэтому он видит
+    только закоммиченные данные общей базы; SQLite в памяти у каждого соединения своя.
+    """
+    if not is_postgres():
+        pytest.skip("the async engine needs a shared database (TEST_DATABASE_URL=postgresql://...)")
+    with TestClient(create_asgi_app()) as client:
+        yield client
+
+
+def assert_same(flask_response, asgi_response):
+    assert asgi_response.status_code == flask_response.status_code
+    assert asgi_response.content == flask_response.get_data()
+    for header in ('ETag', 'X-Next-Cursor'):
+        assert asgi_response.headers.get(header) == flask_response.headers.get(header), header
+
+
+@pytest.mark.parametrize('url', [
+    '/api/events',
+    '/api/events?limit=2',
+    '/api/events?event_type=meeting&status=completed',
+    '/api/events?format=ndjson',
+    '/api/events?employee_id=abc',
+    '/api/events?cursor=broken',
+    '/api/users',
+    '/api/users?page=2&per_page=1',
+    '/api/users?page=0&per_page=500',
+])
+def test_async_routes_answer_like_flask(client, org, asgi, url):
+    post_events(client, org.admin, [
+        {'employee_id': org.user_id, 'event_type': 'meeting', 'start_date': f'2025-03-0{day}',
+         'end_date': f'2025-03-0{day}', 'comment': f'm{day}'} for day in range(1, 5)])
+    make_employee('Third', 'third@example.com')
+    db.session.commit()
+    assert_same(client.get(url, headers=org.admin), asgi.get(url, headers=org.admin))
+
+
+def test_async_events_pages_and_revalidates(client, org, asgi):
+    post_events(client, org.admin, [
+        {'employee_id': org.user_id, 'event_type': 'day_off', 'start_date': f'2025-03-0{day}',
+         'end_date': f'2025-03-0{day}'} for day in range(1, 4)])
+    first = asgi.get('/api/events?limit=2', headers=org.user)
+    rest = asgi.get(f"/api/events?limit=2&cursor={first.headers['X-Next-Cursor']}", headers=org.user)
+    assert [e['start_date'] for e in first.json() + rest.json()] == ['2025-03-03', '2025-03-02', '2025-03-01']
+    assert 'X-Next-Cursor' not in rest.headers
+
+    etag = first.headers['ETag']
+    assert asgi.get('/api/events?limit=2', headers=dict(org.user, **{'If-None-Match': etag})).status_code == 304
+    post_events(client, org.admin, [{'employee_id': org.user_id, 'event_type': 'day_off',
+                                     'start_date': '2025-04-01', 'end_date': '2025-04-01'}])
+    assert asgi.get('/api/events?limit=2', headers=dict(org.user, **{'If-None-Match': etag})).status_code == 200
+
+
+def test_async_users_is_admin_only(org, asgi):
+    assert asgi.get('/api/users', headers=org.user).status_code == 403
+    assert asgi.get('/api/users').status_code == 401
+
+
+def test_async_login_trusts_cache_until_notified(org, asgi):
+    def role():
+        response = asgi.post('/api/login', json={'email': 'admin@example.com', 'password': PASSWORD})
+        if response.status_code != 200:
+            return response.status_code, None
+        return 200, decode_token(response.json()['access_token'])['role']
+
+    def change_in_other_process(**fields):
+        Employee.query.filter_by(employee_id=org.admin_id).update(fields)
+        db.session.commit()
+
+    assert role() == (200, 'admin') and len(credential_cache) == 1
+    # Изменение другого процесса видно после его уведомления, запроса на каждый логин нет
+    change_in_other_process(role=RoleEnum.user)
+    assert role() == (200, 'admin')
+    apply_notification({'type': 'employee_updated', 'employee_id': org.admin_id, 'name_changed': False})
+    assert role() == (200, 'user')
+    change_in_other_process(password_hash=generate_password_hash('new'))
+    apply_notification({'type': 'employee_updated', 'employee_id': org.admin_id, 'name_changed': False})
+    assert role() == (401, None)
@@ -0,0 +1,29 @@
+import pytest
+
+from conftest import post_events
+
+
+def availability(client, org, query):
+    return client.get(f'/api/availability?start_date=2025-03-03&end_date=2025-03-05&{query}', headers=org.user)
+
+
+def test_unknown_team_or_project_is_not_found(client, org):
+    assert availability(client, org, 'team_id=999').status_code == 404
+    assert availability(client, org, 'project_id=999').status_code == 404
+    # Существующий проект без участников - не ошибка
+    response = availability(client, org, f'project_id={org.project_id}')
+    assert response.status_code == 200
+    assert response.json['members'] == 0
+
+
+@pytest.mark.parametrize('best', ['0', '-1', 'x', ''])
+def test_best_must_be_positive(client, org, best):
+    assert availability(client, org, f'team_id={org.team_id}&best={best}').status_code == 400
+
+
+def test_best_days_prefer_more_free_people(client, org):
+    post_events(client, org.admin, [{'employee_id': org.user_id, 'event_type': 'sick_leave',
+                                     'start_date': '2025-03-03', 'end_date': '2025-03-03'}])
+    response = availability(client, org, f'team_id={org.team_id}&best=2')
+    assert response.status_code == 200
+    assert [(day['date'], day['free']) for day in response.json['days']] == [('2025-03-04', 2), ('2025-03-05', 2)]
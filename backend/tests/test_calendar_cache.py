@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from app import db
+from app.cache import calendar_cache
+from app.models import EmployeePresence
+from app.versions import bump_versions
+
+URL = '/api/calendar/events?start_date=2025-03-01&end_date=2025-03-31'
+
+
+def write_in_other_process(employee_id):
+    """Запись так, как ее делает другой воркер: счетчики в базе растут, кэш этого процесса не трогается."""
+    start, end = datetime(2025, 3, 10), datetime(2025, 3, 10, 23, 59, 59)
+    db.session.add(EmployeePresence(employee_id=employee_id, presence_type='meeting', start_datetime=start,
+                                    end_datetime=end, status='approved'))
+    bump_versions([(start, end)])
+    db.session.commit()
+
+
+def test_cached_range_is_not_served_under_newer_versions(client, org):
+    first = client.get(URL, headers=org.admin)
+    assert first.json == [] and len(calendar_cache) == 1
+    generation = calendar_cache.generation
+
+    write_in_other_process(org.user_id)
+    assert calendar_cache.generation == generation
+
+    second = client.get(URL, headers=org.admin)
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert [event['employee_id'] for event in second.json] == [org.user_id]
+
+
+def test_cached_range_is_reused_while_versions_match(client, org, count_queries):
+    client.get(URL, headers=org.admin)
+    with count_queries() as statements:
+        assert client.get(URL, headers=org.user).status_code == 200
+    assert not any('employee_presence' in statement for statement in statements)
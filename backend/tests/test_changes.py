@@ -0,0 +1,84 @@
+import pytest
+from sqlalchemy import text
+
+from conftest import is_postgres, post_events
+from app import db
+
+
+def changes(client, headers, since, limit=None):
+    url = f'/api/calendar/changes?since={since}' + (f'&limit={limit}' if limit else '')
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    return response.json
+
+
+def test_changes_after_cursor_return_upserts_and_tombstones(client, org):
+    start = client.get('/api/calendar/changes', headers=org.admin).json
+    assert start['upserts'] == [] and start['has_more'] is False
+
+    created = client.post('/api/events', json={'employee_id': org.user_id, 'event_type': 'sick_leave',
+                                               'start_date': '2025-03-03', 'end_date': '2025-03-04',
+                                               'comment': 'flu'}, headers=org.admin).json
+    delta = changes(client, org.admin, start['cursor'])
+    assert [e['id'] for e in delta['upserts']] == [created['id']]
+    assert delta['deleted'] == []
+
+    assert client.delete(f"/api/events/{created['id']}", headers=org.admin).status_code == 200
+    after_delete = changes(client, org.admin, delta['cursor'])
+    assert after_delete['upserts'] == []
+    assert after_delete['deleted'] == [created['id']]
+
+    # Клиент, который уже синхронизирован, получает пустой ответ с тем же курсором
+    assert changes(client, org.admin, after_delete['cursor']) == {
+        'upserts': [], 'deleted': [], 'cursor': after_delete['cursor'], 'has_more': False}
+
+
+def test_changes_are_masked_for_other_viewers(client, org):
+    cursor = client.get('/api/calendar/changes', headers=org.admin).json['cursor']
+    client.post('/api/events', json={'employee_id': org.admin_id, 'event_type': 'sick_leave',
+                                     'start_date': '2025-03-03', 'end_date': '2025-03-04', 'comment': 'flu'},
+                headers=org.admin)
+    [event] = changes(client, org.user, cursor)['upserts']
+    assert event['presence_type'] == 'absence'
+    assert event['comment'] != 'flu'
+    [own] = changes(client, org.admin, cursor)['upserts']
+    assert own['presence_type'] == 'sick_leave' and own['comment'] == 'flu'
+
+
+def test_changes_are_paged_by_limit(client, org):
+    cursor = client.get('/api/calendar/changes', headers=org.admin).json['cursor']
+    post_events(client, org.admin, [{'employee_id': org.user_id, 'event_type': 'meeting',
+                                     'start_date': f'2025-03-{day:02d}', 'end_date': f'2025-03-{day:02d}'}
+                                    for day in range(1, 6)])
+    seen = []
+    while True:
+        page = changes(client, org.admin, cursor, limit=2)
+        seen.extend(e['id'] for e in page['upserts'])
+        cursor = page['cursor']
+        if not page['has_more']:
+            break
+    assert len(seen) == len(set(seen)) == 5
+
+
+def test_changes_of_unfinished_transactions_are_held_back(client, org):
+    if not is_postgres():
+        pytest.skip("SQLite commits one transaction at a time")
+    cursor = client.get('/api/calendar/changes', headers=org.admin).json['cursor']
+
+    # Транзакция получает меньший change_id, но фиксируется позже следующей записи
+    with db.engine.connect() as conn:
+        slow = conn.begin()
+        conn.execute(text("INSERT INTO presence_changes (presence_id, employee_id, op, changed_at, xact_id) "
+                          "VALUES (999, :employee_id, 'delete', now(), pg_current_xact_id()::text::bigint)"),
+                     {'employee_id': org.user_id})
+        created = client.post('/api/events', json={'employee_id': org.user_id, 'event_type': 'meeting',
+                                                   'start_date': '2025-03-03', 'end_date': '2025-03-03'},
+                              headers=org.admin).json
+        held = changes(client, org.admin, cursor)
+        assert held == {'upserts': [], 'deleted': [], 'cursor': cursor, 'has_more': False}
+        slow.commit()
+
+    delta = changes(client, org.admin, cursor)
+    assert [e['id'] for e in delta['upserts']] == [created['id']]
+    assert delta['deleted'] == [999]
+    assert changes(client, org.admin, delta['cursor'])['upserts'] == []
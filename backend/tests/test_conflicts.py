@@ -0,0 +1,134 @@
+from datetime import datetime, timezone
+
+from conftest import post_events
+from app import conflicts, db
+from app.models import EmployeePresence
+
+
+def absence(employee_id, start, end, event_type='vacation'):
+    return {'employee_id': employee_id, 'event_type': event_type, 'start_date': start, 'end_date': end}
+
+
+def test_overlapping_absence_is_rejected(client, org):
+    first = client.post('/api/events', json=absence(org.user_id, '2025-03-01', '2025-03-10'), headers=org.admin)
+    assert first.status_code == 201
+
+    response = client.post('/api/events', json=absence(org.user_id, '2025-03-05', '2025-03-12', 'sick_leave'),
+                           headers=org.admin)
+    assert response.status_code == 409
+    assert [c['id'] for c in response.json['conflicts']] == [first.json['id']]
+
+
+def test_adjacent_absences_and_meetings_are_allowed(client, org):
+    assert client.post('/api/events', json=absence(org.user_id, '2025-03-01', '2025-03-10'),
+                       headers=org.admin).status_code == 201
+    assert client.post('/api/events', json=absence(org.user_id, '2025-03-11', '2025-03-12', 'day_off'),
+                       headers=org.admin).status_code == 201
+    assert client.post('/api/events', json=absence(org.user_id, '2025-03-05', '2025-03-05', 'meeting'),
+                       headers=org.admin).status_code == 201
+    # Отсутствия разных сотрудников друг другу не мешают
+    assert client.post('/api/events', json=absence(org.admin_id, '2025-03-01', '2025-03-10'),
+                       headers=org.admin).status_code == 201
+
+
+def test_batch_check_reports_database_and_in_batch_conflicts(client, org):
+    client.post('/api/events', json=absence(org.user_id, '2025-03-10', '2025-03-20'), headers=org.admin)
+    response = client.post('/api/events/check', json=[
+        absence(org.user_id, '2025-04-01', '2025-04-05'),
+        absence(org.user_id, '2025-04-03', '2025-04-04', 'day_off'),
+        absence(org.user_id, '2025-03-15', '2025-03-16', 'day_off'),
+        absence(org.user_id, '2025-05-01', '2025-05-02', 'nope'),
+    ], headers=org.admin)
+    assert response.status_code == 200
+    results = response.json['results']
+    assert results[0] == {'row': 1, 'ok': True, 'conflicts': []}
+    assert results[1]['conflicts'] == [{'row': 1}]
+    assert results[2]['conflicts'][0]['start_date'] == '2025-03-10'
+    assert 'msg' in results[3]
+    assert response.json['conflicts'] == 2
+
+
+def test_bulk_import_rejects_conflicting_rows(client, org):
+    result = post_events(client, org.admin, [
+        absence(org.user_id, '2025-03-01', '2025-03-05'),
+        absence(org.user_id, '2025-03-04', '2025-03-06', 'sick_leave'),
+        absence(org.user_id, '2025-03-06', '2025-03-07', 'day_off'),
+    ])
+    assert result['inserted'] == 2
+    assert [(e['row'], e['msg']) for e in result['errors']] == [(2, "Overlaps existing absence")]
+
+
+def test_reapproving_rejected_absence_checks_conflicts(client, org):
+    rejected = client.post('/api/events', json=absence(org.user_id, '2025-03-01', '2025-03-10'),
+                           headers=org.admin).json['id']
+    assert client.put(f'/api/events/{rejected}/status', json={'status': 'rejected'},
+                      headers=org.admin).status_code == 200
+    client.post('/api/events', json=absence(org.user_id, '2025-03-05', '2025-03-06', 'day_off'), headers=org.admin)
+
+    response = client.put(f'/api/events/{rejected}/status', json={'status': 'approved'}, headers=org.admin)
+    assert response.status_code == 409
+
+
+def stored_absence(employee_id, start, end, **fields):
+    """Отсутствие, записанное в обход проверки пересечений - как старые данные или synth.py."""
+    event = EmployeePresence(employee_id=employee_id, presence_type='vacation', start_datetime=start,
+                             end_datetime=end, status='approved', **fields)
+    db.session.add(event)
+    db.session.commit()
+    return event.presence_id
+
+
+def test_aware_and_naive_values_are_compared_in_one_convention(client, org):
+    utc = timezone.utc
+    existing = stored_absence(org.user_id, datetime(2025, 3, 1, tzinfo=utc),
+                              datetime(2025, 3, 10, 23, 59, 59, tzinfo=utc))
+    # Дата со смещением из запроса против значений базы (с поясом на PostgreSQL, без - на SQLite)
+    response = client.post('/api/events', json=absence(org.user_id, '2025-03-05T00:00:00+03:00',
+                                                       '2025-03-12T00:00:00+03:00', 'day_off'), headers=org.admin)
+    assert response.status_code == 409
+    assert [c['id'] for c in response.json['conflicts']] == [existing]
+
+    fields = {'employee_id': org.user_id, 'presence_type': 'day_off'}
+    assert [c['id'] for c in conflicts.batch_conflicts([
+        (1, dict(fields, start_datetime=datetime(2025, 3, 9, tzinfo=utc),
+                 end_datetime=datetime(2025, 3, 11, tzinfo=utc))),
+        (2, dict(fields, start_datetime=datetime(2025, 3, 10), end_datetime=datetime(2025, 3, 10, 12))),
+    ])[0]] == [existing]
+    assert conflicts.batch_conflicts([(1, dict(fields, start_datetime=datetime(2025, 3, 11, tzinfo=utc),
+                                              end_datetime=datetime(2025, 3, 12)))]) == [[]]
+
+
+def test_stored_overlaps_do_not_hide_long_absences(client, org):
+    # Длинное отсутствие, внутри которого старые данные содержат более короткие: ни "предыдущее
+    # событие", ни сортировка по концу его не находят
+    long = stored_absence(org.user_id, datetime(2025, 3, 1), datetime(2025, 4, 30, 23, 59, 59))
+    stored_absence(org.user_id, datetime(2025, 3, 5), datetime(2025, 3, 6, 23, 59, 59))
+    stored_absence(org.user_id, datetime(2025, 4, 10), datetime(2025, 4, 12, 23, 59, 59))
+
+    response = client.post('/api/events', json=absence(org.user_id, '2025-03-20', '2025-03-21', 'day_off'),
+                           headers=org.admin)
+    assert response.status_code == 409
+    assert [c['id'] for c in response.json['conflicts']] == [long]
+
+    results = client.post('/api/events/check', json=[absence(org.user_id, '2025-03-20', '2025-03-21', 'day_off'),
+                                                     absence(org.user_id, '2025-04-11', '2025-04-11', 'day_off')],
+                          headers=org.admin).json['results']
+    assert [c['id'] for c in results[0]['conflicts']] == [long]
+    assert len(results[1]['conflicts']) == 2
+
+
+def test_absences_longer_than_the_new_event_window_are_found(client, org):
+    # Начало отсутствия далеко до окна проверки, но не раньше его нижней границы MAX_EVENT_DAYS
+    long = stored_absence(org.user_id, datetime(2024, 6, 1), datetime(2025, 3, 31, 23, 59, 59))
+    stored_absence(org.user_id, datetime(2023, 1, 1), datetime(2023, 1, 5, 23, 59, 59))
+
+    response = client.post('/api/events', json=absence(org.user_id, '2025-03-20', '2025-03-21', 'day_off'),
+                           headers=org.admin)
+    assert response.status_code == 409
+    assert [c['id'] for c in response.json['conflicts']] == [long]
+
+    results = client.post('/api/events/check', json=[absence(org.user_id, '2025-03-30', '2025-04-02', 'day_off'),
+                                                     absence(org.user_id, '2025-04-01', '2025-04-01', 'day_off')],
+                          headers=org.admin).json['results']
+    assert [c['id'] for c in results[0]['conflicts']] == [long]
+    assert results[1]['conflicts'] == []
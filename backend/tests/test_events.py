@@ -0,0 +1,41 @@
+import pytest
+
+from conftest import post_events
+
+
+def all_pages(client, headers, limit, query=''):
+    """Идет по X-Next-Cursor до конца; возвращает список страниц (списков событий)."""
+    pages, url = [], f'/api/events?limit={limit}{query}'
+    while url:
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        pages.append(response.json)
+        cursor = response.headers.get('X-Next-Cursor')
+        url = cursor and f'/api/events?limit={limit}{query}&cursor={cursor}'
+    return pages
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 7])
+def test_cursor_pages_through_equal_start_dates(client, org, limit):
+    # Пять событий с одинаковым start_datetime: граница страницы попадает внутрь группы
+    days = ['2025-03-05'] * 5 + ['2025-03-04', '2025-03-06'] * 2
+    post_events(client, org.admin, [
+        {'employee_id': (org.user_id, org.admin_id)[i % 2], 'event_type': 'meeting', 'start_date': day, 'end_date': day}
+        for i, day in enumerate(days)])
+    everything = client.get('/api/events', headers=org.admin).json
+
+    pages = all_pages(client, org.admin, limit)
+    assert [event['id'] for page in pages for event in page] == [event['id'] for event in everything]
+    assert all(len(page) == limit for page in pages[:-1]) and 0 < len(pages[-1]) <= limit
+    # Новые первыми, при равном начале - больший id первым
+    assert [(e['start_date'], e['id']) for e in everything] == \
+        sorted(((e['start_date'], e['id']) for e in everything), reverse=True)
+
+
+def test_cursor_with_filters_keeps_ties(client, org):
+    post_events(client, org.admin, [
+        {'employee_id': org.user_id, 'event_type': event_type, 'start_date': '2025-03-05', 'end_date': '2025-03-05'}
+        for event_type in ('meeting', 'business_trip', 'meeting', 'meeting')])
+    pages = all_pages(client, org.user, 1, '&event_type=meeting')
+    assert [len(page) for page in pages] == [1, 1, 1]
+    assert len({page[0]['id'] for page in pages}) == 3
@@ -0,0 +1,49 @@
+from urllib.parse import urlsplit
+
+import pytest
+
+from app import ics
+
+
+def feed_path(url):
+    parts = urlsplit(url)
+    return f'{parts.path}?{parts.query}'
+
+
+def fetch(client, path):
+    # Тело подписки потоковое: дочитываем его, пока жив контекст запроса
+    response = client.get(path)
+    response.get_data()
+    return response
+
+
+def test_feed_token_opens_own_calendar(client, org):
+    feeds = client.get('/api/calendar/feed-token', headers=org.user).json['feeds']
+    response = fetch(client, feed_path(feeds['user']))
+    assert response.status_code == 200
+    assert response.mimetype == 'text/calendar'
+    assert fetch(client, feed_path(feeds['user']).replace('token=', 'token=x')).status_code == 401
+
+
+def test_rotation_revokes_issued_tokens(client, org):
+    old = client.get('/api/calendar/feed-token', headers=org.user).json
+    rotated = client.post('/api/calendar/feed-token/rotate', headers=org.user).json
+    assert rotated['token'] != old['token']
+    assert fetch(client, feed_path(old['feeds']['team'])).status_code == 401
+    assert fetch(client, feed_path(rotated['feeds']['team'])).status_code == 200
+    assert client.get('/api/calendar/feed-token', headers=org.user).json['token'] == rotated['token']
+
+
+
+@pytest.mark.parametrize('payload', [
+    lambda user_id: user_id,  # токен без версии
+    lambda user_id: [user_id],
+    lambda user_id: [user_id, 0, 0],
+    lambda user_id: [str(user_id), 0],
+    lambda user_id: [user_id, '0'],
+    lambda user_id: [user_id, False],
+    lambda user_id: {'employee_id': user_id, 'version': 0},
+])
+def test_signed_token_with_other_payload_is_rejected(client, org, payload):
+    token = ics._serializer().dumps(payload(org.user_id))
+    assert fetch(client, f'/api/calendar/feeds/user/{org.user_id}.ics?token={token}').status_code == 401
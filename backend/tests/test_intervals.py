@@ -0,0 +1,69 @@
+import random
+from datetime import datetime
+
+import pytest
+
+from conftest import post_events
+from app.intervals import IntervalTree
+
+
+def brute_force(intervals, lo, hi):
+    return sorted(value for start, end, value in intervals if start <= hi and end >= lo)
+
+
+def test_empty_tree():
+    tree = IntervalTree()
+    assert len(tree) == 0
+    assert tree.overlap(0, 100) == []
+
+
+@pytest.mark.parametrize('lo, hi, expected', [
+    (0, 0, []),
+    (0, 1, ['a']),       # касание начала - пересечение: интервалы замкнутые
+    (5, 5, ['a', 'b']),  # конец a совпадает с началом b
+    (9, 12, ['b']),
+    (10, 10, ['b']),
+    (11, 20, []),
+])
+def test_touching_boundaries_overlap(lo, hi, expected):
+    tree = IntervalTree([(1, 5, 'a'), (5, 10, 'b')])
+    assert sorted(tree.overlap(lo, hi)) == expected
+
+
+def test_nested_intervals():
+    tree = IntervalTree([(0, 100, 'outer'), (10, 90, 'middle'), (40, 60, 'inner'), (50, 50, 'point')])
+    assert sorted(tree.overlap(50, 50)) == ['inner', 'middle', 'outer', 'point']
+    assert sorted(tree.overlap(5, 9)) == ['outer']
+    assert sorted(tree.overlap(61, 89)) == ['middle', 'outer']
+    assert sorted(tree.overlap(-10, 200)) == ['inner', 'middle', 'outer', 'point']
+
+
+def test_matches_brute_force():
+    rng = random.Random(1)
+    intervals = []
+    for value in range(300):
+        start = rng.randrange(1000)
+        intervals.append((start, start + rng.randrange(50), value))
+    tree = IntervalTree(intervals)
+    assert len(tree) == 300
+    for _ in range(200):
+        lo = rng.randrange(-20, 1050)
+        hi = lo + rng.randrange(30)
+        assert sorted(tree.overlap(lo, hi)) == brute_force(intervals, lo, hi)
+
+
+def test_datetime_intervals():
+    tree = IntervalTree([(datetime(2025, 3, 1), datetime(2025, 3, 1, 23, 59, 59), 1)])
+    assert tree.overlap(datetime(2025, 3, 1, 23, 59, 59), datetime(2025, 3, 2)) == [1]
+    assert tree.overlap(datetime(2025, 3, 2), datetime(2025, 3, 3)) == []
+
+
+def test_calendar_sees_writes_without_rebuilding(client, org):
+    # Диапазон выбирается запросом к базе на любой СУБД: новая запись видна сразу
+    url = '/api/calendar/events?start_date=2025-03-10&end_date=2025-03-10'
+    assert client.get(url, headers=org.admin).json == []
+    post_events(client, org.admin, [
+        {'employee_id': org.user_id, 'event_type': 'meeting', 'start_date': start, 'end_date': end}
+        for start, end in (('2025-03-08', '2025-03-10'), ('2025-03-10', '2025-03-12'), ('2025-03-11', '2025-03-11'))])
+    assert sorted((e['start_date'], e['end_date']) for e in client.get(url, headers=org.admin).json) == \
+        [('2025-03-08', '2025-03-10'), ('2025-03-10', '2025-03-12')]
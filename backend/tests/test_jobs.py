@@ -0,0 +1,191 @@
+import time
+
+import pytest
+
+from conftest import PASSWORD, is_postgres
+from app import db
+from app.cache import calendar_cache, credential_cache, membership_cache
+from app.jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, JobError, job_queue
+from app.models import Employee, Job
+from app.presence import apply_notification, cache_sync, notify_presence
+from app.pubsub import broker
+from app.versions import bump_employees
+
+
+@pytest.fixture
+def queue():
+    """Очередь без отсрочек повторов; тестовые обработчики убираются после теста."""
+    handlers = dict(job_queue._handlers)
+    job_queue.configure(retry_base=0, stale_after=3600)
+    yield job_queue
+    job_queue._handlers = handlers
+    job_queue.configure(retry_base=5)
+
+
+@pytest.fixture
+def notify():
+    """Рассылка уведомлений между процессами через LISTEN/NOTIFY - только на PostgreSQL."""
+    if not is_postgres():
+        pytest.skip("LISTEN/NOTIFY requires PostgreSQL")
+    broker.configure(backend='postgres')
+    yield broker
+    broker.configure(backend='memory')
+
+
+def get_job(client, headers, job_id):
+    response = client.get(f'/api/jobs/{job_id}', headers=headers)
+    assert response.status_code == 200
+    return response.json
+
+
+def test_async_bulk_users_returns_job_and_worker_runs_it(client, org, queue):
+    response = client.post('/api/users/bulk?async=1', headers=org.admin, json=[
+        {'email': 'new@example.com', 'password': 'secret', 'full_name': 'New'},
+        {'email': 'broken@example.com'},
+    ])
+    assert response.status_code == 202
+    job_id = response.json['job_id']
+    assert response.headers['Location'].endswith(f'/api/jobs/{job_id}')
+    assert get_job(client, org.admin, job_id)['status'] == QUEUED
+
+    queue.work(once=True)
+
+    job = get_job(client, org.admin, job_id)
+    assert job['status'] == SUCCEEDED and job['attempts'] == 1
+    assert [row['row'] for row in job['result']['created']] == [1]
+    assert [row['row'] for row in job['result']['errors']] == [2]
+    assert db.session.query(Employee.employee_id).filter_by(email='new@example.com').scalar()
+
+
+def test_job_is_visible_only_to_author_and_admins(client, org, queue):
+    job_id = client.post('/api/events/bulk?async=1', headers=org.user, json=[
+        {'event_type': 'day_off', 'start_date': '2025-05-05', 'end_date': '2025-05-05'}]).json['job_id']
+    assert get_job(client, org.user, job_id)['status'] == QUEUED
+    admin_job = client.post('/api/users/bulk?async=1', headers=org.admin, json=[]).json['job_id']
+    assert client.get(f'/api/jobs/{admin_job}', headers=org.user).status_code == 403
+    assert client.get('/api/jobs/999', headers=org.admin).status_code == 404
+
+    queue.work(once=True)
+    assert get_job(client, org.user, job_id)['result']['inserted'] == 1
+
+
+def test_async_delete_user(client, org, queue):
+    assert client.delete('/api/users/999?async=1', headers=org.admin).status_code == 404
+    job_id = client.delete(f'/api/users/{org.user_id}?async=1', headers=org.admin).json['job_id']
+    queue.work(once=True)
+    assert get_job(client, org.admin, job_id)['status'] == SUCCEEDED
+    assert client.get(f'/api/users/{org.user_id}', headers=org.admin).status_code == 404
+
+
+def test_failed_job_is_retried_until_max_attempts(queue):
+    calls = []
+
+    @queue.handler('flaky', max_attempts=3)
+    def flaky(payload, created_by):
+        calls.append(payload)
+        if len(calls) < 3:
+            raise RuntimeError('temporary')
+        return {'ok': True}
+
+    job_id = queue.enqueue('flaky', {'n': 1}).job_id
+    queue.work(once=True)
+    job = db.session.get(Job, job_id)
+    assert len(calls) == 3
+    assert (job.status, job.attempts) == (SUCCEEDED, 3)
+
+
+def test_permanent_error_is_not_retried(queue):
+    @queue.handler('gone', max_attempts=5)
+    def gone(payload, created_by):
+        raise JobError('already deleted')
+
+    job_id = queue.enqueue('gone', {}).job_id
+    queue.work(once=True)
+    job = db.session.get(Job, job_id)
+    assert (job.status, job.attempts) == (FAILED, 1)
+    assert 'already deleted' in job.error
+
+
+def test_job_of_lost_worker_is_requeued(queue):
+    @queue.handler('noop')
+    def noop(payload, created_by):
+        return None
+
+    job_id = queue.enqueue('noop', {}).job_id
+    assert queue.claim('dead-worker').job_id == job_id
+    assert db.session.get(Job, job_id).status == RUNNING
+    assert queue.claim('other-worker') is None
+
+    queue.configure(stale_after=0)
+    assert queue.sweep() == 1
+    queue.configure(stale_after=3600)
+    queue.work(once=True)
+    job = db.session.get(Job, job_id)
+    assert (job.status, job.attempts) == (SUCCEEDED, 2)
+
+
+def test_async_bulk_users_never_stores_plaintext_passwords(client, org, queue):
+    job_id = client.post('/api/users/bulk?async=1', headers=org.admin, json=[
+        {'email': 'new@example.com', 'password': 'plain-secret', 'full_name': 'New'},
+        # Хэш от клиента не принимается: без пароля строка не проходит проверку
+        {'email': 'forged@example.com', 'password_hash': 'forged', 'full_name': 'Forged'},
+    ]).json['job_id']
+    payload = db.session.get(Job, job_id).payload
+    assert 'plain-secret' not in payload and 'forged"' not in payload and 'password_sealed' in payload
+
+    queue.work(once=True)
+
+    job = get_job(client, org.admin, job_id)
+    assert [row['row'] for row in job['result']['errors']] == [2]
+    response = client.post('/api/login', json={'email': 'new@example.com', 'password': 'plain-secret'})
+    assert response.status_code == 200
+
+
+def warm_caches(client, org):
+    client.get('/api/calendar/events?start_date=2025-03-01&end_date=2025-03-31', headers=org.admin)
+    client.get(f'/api/calendar/events?start_date=2025-03-01&end_date=2025-03-31&team_id={org.team_id}',
+               headers=org.admin)
+    assert len(calendar_cache) == 2 and len(membership_cache) == 1
+
+
+def test_notification_invalidates_process_caches(client, org):
+    warm_caches(client, org)
+    apply_notification({'type': 'imported', 'count': 1, 'start_date': '2025-03-10', 'end_date': '2025-03-10'})
+    assert len(calendar_cache) == 0 and len(membership_cache) == 1
+
+    warm_caches(client, org)
+    apply_notification({'type': 'employees_created', 'count': 1})
+    assert len(membership_cache) == 0
+
+    warm_caches(client, org)
+    apply_notification({'type': 'employee_deleted', 'employee_id': org.user_id})
+    assert len(calendar_cache) == 0 and len(membership_cache) == 0
+
+
+def test_listener_applies_notifications_from_other_processes(client, org, notify):
+    warm_caches(client, org)  # первый запрос запускает слушателя
+    # Так публикует worker.py: pg_notify из другого процесса, локальные кэши он не трогает.
+    # Слушатель мог еще не выполнить LISTEN - тогда уведомление повторяем
+    deadline = time.monotonic() + 5
+    while len(membership_cache) and time.monotonic() < deadline:
+        notify_presence('employee_deleted', employee_id=org.user_id)
+        time.sleep(0.2)
+    assert len(membership_cache) == 0 and len(calendar_cache) == 0
+
+
+def test_cache_sync_notices_writes_of_other_processes(client, org):
+    # Без LISTEN/NOTIFY: так пишет worker.py на SQLite - счетчик в базе, кэши этого процесса не тронуты
+    cache_sync.configure(interval=0)
+    try:
+        warm_caches(client, org)
+        assert client.post('/api/login', json={'email': 'user@example.com', 'password': PASSWORD}).status_code == 200
+        assert len(credential_cache) == 1
+        client.get('/api/profile', headers=org.user)
+        assert len(membership_cache) == 1 and len(credential_cache) == 1
+
+        bump_employees()
+        db.session.commit()
+        client.get('/api/profile', headers=org.user)
+        assert len(membership_cache) == 0 and len(credential_cache) == 0
+    finally:
+        cache_sync.configure(interval=1)
@@ -0,0 +1,66 @@
+from flask_jwt_extended import decode_token
+from werkzeug.security import generate_password_hash
+
+from conftest import PASSWORD
+
+from app import db
+from app.cache import credential_cache
+from app.models import Employee, RoleEnum
+from app.presence import apply_notification
+from app.pubsub import broker
+
+
+def login(client, password=PASSWORD):
+    return client.post('/api/login', json={'email': 'admin@example.com', 'password': password})
+
+
+def change_in_other_process(org, **fields):
+    """
+    Изменение, сделанное другим воркером: кэш этого процесса сбрасывается только
+    уведомлением, которое тот воркер публикует после commit.
+    """
+    Employee.query.filter_by(employee_id=org.admin_id).update(fields)
+    db.session.commit()
+    apply_notification({'type': 'employee_updated', 'employee_id': org.admin_id, 'name_changed': False})
+
+
+def test_cached_login_does_not_query_the_database(client, org, count_queries):
+    assert login(client).status_code == 200
+    assert len(credential_cache) == 1
+    with count_queries() as statements:
+        assert decode_token(login(client).json['access_token'])['role'] == 'admin'
+    assert statements == []
+
+
+def test_demoted_admin_does_not_get_admin_token_from_cache(client, org):
+    assert decode_token(login(client).json['access_token'])['role'] == 'admin'
+    change_in_other_process(org, role=RoleEnum.user)
+    assert decode_token(login(client).json['access_token'])['role'] == 'user'
+
+
+def test_deleted_employee_cannot_log_in_from_cache(client, org):
+    assert login(client).status_code == 200
+    db.session.delete(db.session.get(Employee, org.admin_id))
+    db.session.commit()
+    apply_notification({'type': 'employee_deleted', 'employee_id': org.admin_id})
+    assert login(client).status_code == 401
+
+
+def test_password_changed_in_other_process(client, org):
+    assert login(client).status_code == 200
+    change_in_other_process(org, password_hash=generate_password_hash('new'))
+    assert login(client, 'new').status_code == 200
+    assert login(client).status_code == 401
+
+
+def test_profile_update_notifies_other_processes(client, org):
+    assert login(client).status_code == 200
+    subscription = broker.subscribe()
+    try:
+        response = client.put(f'/api/users/{org.admin_id}', headers=org.admin, json={'role': 'user'})
+        assert response.status_code == 200
+        assert subscription.get(timeout=0) == {'type': 'employee_updated', 'event': None,
+                                               'employee_id': org.admin_id, 'name_changed': False}
+    finally:
+        broker.unsubscribe(subscription)
+    assert decode_token(login(client).json['access_token'])['role'] == 'user'
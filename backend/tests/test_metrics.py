@@ -0,0 +1,35 @@
+from conftest import PASSWORD, is_postgres
+
+
+def families(text):
+    """{имя метрики: тип} из # TYPE; заодно проверяет, что строки каждой метрики идут подряд."""
+    types, current = {}, None
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split()
+            assert name not in types, name
+            types[name] = kind
+            current = name
+            continue
+        # У гистограмм строки name_bucket, name_sum и name_count
+        name = line.split('{')[0].split(' ')[0]
+        family = next(f for f in (name, name.rsplit('_', 1)[0]) if f in types)
+        assert family == current, name
+    return types
+
+
+def test_cumulative_metrics_are_counters(client, org):
+    client.post('/api/login', json={'email': 'admin@example.com', 'password': PASSWORD})
+    response = client.get('/api/admin/metrics', headers=org.admin)
+    assert response.status_code == 200
+    types = families(response.get_data(as_text=True))
+
+    expected = ['login_verifier_completed_total', 'login_verifier_rejected_total',
+                'login_verifier_wait_seconds_total', 'login_verifier_verify_seconds_total']
+    if is_postgres():
+        expected += ['db_pool_checkouts_total', 'db_pool_timeouts_total', 'db_pool_wait_seconds_total']
+        assert types['calendar_db_pool_checked_out'] == 'gauge'
+    for name in expected:
+        assert types[f'calendar_{name}'] == 'counter', name
+    assert types['calendar_login_verifier_in_flight'] == 'gauge'
+    assert 'calendar_login_verifier_completed' not in types
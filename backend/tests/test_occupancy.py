@@ -0,0 +1,63 @@
+from datetime import date, datetime, timedelta
+
+from conftest import make_employee
+from app import db, occupancy
+from app.models import EmployeePresence
+
+
+def report(client, org, start, end):
+    response = client.get(f'/api/occupancy?start_date={start}&end_date={end}&department_id={org.department_ids[1]}',
+                          headers=org.admin)
+    assert response.status_code == 200
+    return {row['date']: row for row in response.json}
+
+
+def test_available_counts_people_and_daily_headcount(client, org):
+    department_id = org.department_ids[1]
+    make_employee('Hired', 'hired@example.com', main_department_id=department_id).hire_date = date(2025, 3, 3)
+    make_employee('Left', 'left@example.com', main_department_id=department_id, termination_date=date(2025, 3, 1))
+    # Старые данные: два пересекающихся отсутствия одного сотрудника - это один человек
+    db.session.add_all([
+        EmployeePresence(employee_id=org.user_id, presence_type=presence_type, status='completed',
+                         start_datetime=datetime(2025, 3, 2), end_datetime=datetime(2025, 3, 2, 23, 59, 59))
+        for presence_type in ('sick_leave', 'day_off')])
+    db.session.commit()
+    occupancy.rebuild()
+
+    days = report(client, org, '2025-03-01', '2025-03-03')
+    assert [days[d]['headcount']['office'] for d in ('2025-03-01', '2025-03-02', '2025-03-03')] == [2, 1, 2]
+    assert days['2025-03-02']['presence'] == {'sick_leave': 1, 'day_off': 1}
+    assert days['2025-03-02']['available']['office'] == 0
+    assert days['2025-03-03']['available']['office'] == 2
+
+
+def test_rollups_follow_writes_and_serve_the_report_alone(client, org, count_queries):
+    occupancy.rebuild()
+    today = date.today()
+    day = [(today + timedelta(days=i)).isoformat() for i in range(3)]
+    url = f'/api/occupancy?start_date={day[0]}&end_date={day[2]}'
+    hired = client.post('/api/users', headers=org.admin, json={
+        'email': 'hired@example.com', 'password': 'pw', 'full_name': 'Hired',
+        'main_department_id': org.department_ids[1]}).json['id']
+    for employee_id, start, end in ((org.user_id, day[0], day[1]), (hired, day[1], day[2])):
+        assert client.post('/api/events', headers=org.admin, json={
+            'employee_id': employee_id, 'event_type': 'sick_leave', 'start_date': start, 'end_date': end,
+        }).status_code == 201
+    assert client.put(f'/api/users/{hired}', headers=org.admin,
+                      json={'main_department_id': org.department_ids[0], 'work_mode': 'remote'}).status_code == 200
+
+    with count_queries() as statements:
+        incremental = client.get(url, headers=org.admin).json
+    assert not any('employees' in statement or 'employee_presence' in statement for statement in statements)
+    first = {row['department_id']: row for row in incremental if row['date'] == day[1]}
+    assert first[org.department_ids[0]]['headcount'] == {'office': 1, 'remote': 1, 'hybrid': 0}
+    assert first[org.department_ids[0]]['available']['remote'] == 0
+    assert first[org.department_ids[1]]['available']['office'] == 0
+
+    occupancy.rebuild()
+    assert client.get(url, headers=org.admin).json == incremental
+
+    assert client.delete(f'/api/users/{hired}', headers=org.admin).status_code == 200
+    incremental = client.get(url, headers=org.admin).json
+    occupancy.rebuild()
+    assert client.get(url, headers=org.admin).json == incremental
@@ -0,0 +1,93 @@
+from datetime import date, datetime
+
+import pyarrow.parquet as pq
+import pytest
+from sqlalchemy import text
+
+from conftest import is_postgres, post_events
+from app import archive, db, partitions
+from app.intervals import date_window, period_overlaps
+from app.models import EmployeePresence
+
+
+@pytest.fixture
+def postgres_only():
+    if not is_postgres():
+        pytest.skip("partitioning requires PostgreSQL")
+
+
+def meeting(employee_id, day):
+    return {'employee_id': employee_id, 'event_type': 'meeting', 'start_date': day, 'end_date': day}
+
+
+def explain(query):
+    sql = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    return '\n'.join(row[0] for row in db.session.execute(text(f"EXPLAIN {sql}")))
+
+
+def test_events_longer_than_max_span_are_rejected(client, org):
+    # На этом ограничении держится нижняя граница start_datetime в period_overlaps
+    response = client.post('/api/events', json={'employee_id': org.user_id, 'event_type': 'business_trip',
+                                                'start_date': '2025-01-01', 'end_date': '2026-01-02'},
+                           headers=org.admin)
+    assert response.status_code == 400
+    assert client.post('/api/events', json={'employee_id': org.user_id, 'event_type': 'business_trip',
+                                            'start_date': '2025-01-01', 'end_date': '2026-01-01'},
+                       headers=org.admin).status_code == 201
+
+
+def test_convert_prune_extend_and_archive(client, org, app, tmp_path, monkeypatch, postgres_only):
+    post_events(client, org.admin, [meeting(org.user_id, day) for day in
+                                    ('2023-06-01', '2024-12-31', '2025-03-10', '2026-01-05')])
+
+    years = partitions.convert_to_partitioned(ahead=1)
+    assert years == list(range(2023, date.today().year + 2))
+    assert partitions.is_partitioned()
+    assert partitions.convert_to_partitioned() == []
+    names = [name for name, _ in partitions.list_partitions()]
+    assert partitions.DEFAULT_PARTITION in names and 'employee_presence_y2023' in names
+
+    # Запись после переделки: та же sequence, внешний ключ, индексы
+    post_events(client, org.admin, [meeting(org.user_id, '2025-03-11')])
+    march = client.get('/api/calendar/events?start_date=2025-03-01&end_date=2025-03-31', headers=org.admin).json
+    assert [event['start_date'] for event in march] == ['2025-03-10', '2025-03-11']
+
+    # Месяц читает только секции, где может начаться пересекающее его событие
+    plan = explain(EmployeePresence.query.filter(period_overlaps(*date_window(date(2025, 3, 1), date(2025, 3, 31)))))
+    assert 'employee_presence_y2025' in plan and 'employee_presence_y2023' not in plan
+
+    # Строка года без секции лежит в секции по умолчанию и переносится при ее создании
+    far = date.today().year + 5
+    post_events(client, org.admin, [meeting(org.user_id, f'{far}-02-01')])
+    assert partitions.ensure_partition(far)
+    db.session.commit()
+    assert not db.session.execute(text(f"SELECT count(*) FROM {partitions.DEFAULT_PARTITION}")).scalar()
+    assert db.session.execute(text(f"SELECT count(*) FROM {partitions.partition_name(far)}")).scalar() == 1
+    assert not partitions.ensure_partition(far)
+
+    monkeypatch.setitem(app.config, 'PRESENCE_ARCHIVE_DIR', str(tmp_path))
+    assert archive.archive_year(2023) == 1
+    assert 'employee_presence_y2023' not in [name for name, _ in partitions.list_partitions()]
+    assert pq.ParquetFile(archive.archive_path(2023)).metadata.num_rows == 1
+    assert [row[4] for row in archive.read_archive(2023)] == [datetime(2023, 6, 1)]
+
+
+
+def test_archived_events_reach_clients_as_deletions(client, org, app, tmp_path, monkeypatch):
+    events = post_events(client, org.admin, [meeting(org.user_id, '2023-06-01'), meeting(org.user_id, '2025-03-10'),
+                                             {'employee_id': org.user_id, 'event_type': 'day_off',
+                                              'start_date': '2023-12-30', 'end_date': '2024-01-02'}])
+    assert events['inserted'] == 3
+    archived = {e.presence_id for e in EmployeePresence.query
+                if e.start_datetime.replace(tzinfo=None) < datetime(2024, 1, 1)}
+    cursor = client.get('/api/calendar/changes', headers=org.admin).json['cursor']
+    url = '/api/calendar/events?start_date=2024-01-01&end_date=2024-01-31'
+    etag = client.get(url, headers=org.admin).headers['ETag']
+
+    monkeypatch.setitem(app.config, 'PRESENCE_ARCHIVE_DIR', str(tmp_path))
+    assert archive.archive_year(2023) == 2
+    changes = client.get(f'/api/calendar/changes?since={cursor}', headers=org.admin).json
+    assert changes['upserts'] == [] and set(changes['deleted']) == archived
+    # Отгул года заканчивается в январе следующего: выборка января тоже изменилась
+    response = client.get(url, headers=dict(org.admin, **{'If-None-Match': etag}))
+    assert response.status_code == 200 and response.json == []
@@ -0,0 +1,26 @@
+import pytest
+
+
+@pytest.mark.parametrize('fields, msg', [
+    ({'projects': [1]}, "projects must be a list of objects"),
+    ({'projects': {'project_id': 1}}, "projects must be a list of objects"),
+    ({'projects': [{'project_id': [1], 'participation_percentage': 50}]}, "project_id must be an integer"),
+    ({'additional_department_ids': 1}, "additional_department_ids must be a list of integers"),
+    ({'additional_department_ids': [{'id': 1}]}, "additional_department_ids must be a list of integers"),
+    ({'main_team_id': [1]}, "main_team_id must be an integer"),
+    ({'email': ['x@example.com']}, "email, password and full_name must be strings"),
+])
+def test_bulk_users_report_wrong_types_as_row_errors(client, org, fields, msg):
+    response = client.post('/api/users/bulk', headers=org.admin, json=[
+        dict({'email': 'bad@example.com', 'password': 'secret', 'full_name': 'Bad'}, **fields),
+        {'email': 'good@example.com', 'password': 'secret', 'full_name': 'Good'},
+    ])
+    assert response.status_code == 201
+    assert [row['row'] for row in response.json['created']] == [2]
+    assert response.json['errors'] == [{'row': 1, 'msg': msg}]
+
+
+def test_update_user_rejects_wrong_types(client, org):
+    for fields in ({'projects': ['P1']}, {'additional_department_ids': 'D1'}, {'position_id': 'Dev'}):
+        response = client.put(f'/api/users/{org.user_id}', headers=org.admin, json=fields)
+        assert response.status_code == 400, fields
@@ -0,0 +1,107 @@
+from datetime import date, timedelta
+
+import pytest
+
+from conftest import make_employee, post_events
+from app import db
+from app.cache import calendar_cache, membership_cache
+from app.models import Employee, PresenceVersion
+
+# Списочные маршруты не должны делать запрос на каждую строку (N+1):
+# число запросов одинаково для 5 и для 40 событий и не больше этого предела
+MAX_LIST_QUERIES = 6
+
+
+def meetings(employee_id, count, first=date(2025, 3, 3)):
+    return [{'employee_id': employee_id, 'event_type': 'meeting', 'start_date': (first + timedelta(days=i)).isoformat(),
+             'end_date': (first + timedelta(days=i)).isoformat(), 'comment': f'm{i}'} for i in range(count)]
+
+
+def fill(client, org, count):
+    # События разных сотрудников: имя каждого должно приходить тем же запросом
+    offset = Employee.query.count()
+    employees = [make_employee(f'E{i}', f'e{i}@example.com').employee_id for i in range(offset, offset + count)]
+    db.session.commit()
+    post_events(client, org.admin, [event for i, employee_id in enumerate(employees)
+                                    for event in meetings(employee_id, 1, date(2025, 3, 1) + timedelta(days=i % 28))])
+
+
+@pytest.mark.parametrize('url', [
+    '/api/calendar/events?start_date=2025-03-01&end_date=2025-03-31',
+    '/api/calendar/events',
+    '/api/calendar/events?start_date=2025-03-01&end_date=2025-03-31&team_id=1&include_schedule=1',
+    '/api/events',
+    '/api/events?limit=20',
+    '/api/events?format=ndjson',
+    '/api/users',
+    '/api/calendar/changes?since=0',
+])
+def test_list_endpoints_issue_constant_number_of_queries(client, org, count_queries, url):
+    counts = []
+    for count in (5, 40):
+        fill(client, org, count)
+        # Оба замера без кэшей процесса: сравниваем полные выборки
+        calendar_cache.clear()
+        membership_cache.clear()
+        with count_queries() as statements:
+            response = client.get(url, headers=org.admin)
+            assert response.status_code == 200
+            response.get_data()
+        counts.append(len(statements))
+    assert counts[0] == counts[1], counts
+    assert counts[1] <= MAX_LIST_QUERIES, counts
+
+
+def test_calendar_names_come_with_events(client, org, count_queries):
+    post_events(client, org.admin, meetings(org.user_id, 3))
+    with count_queries() as statements:
+        events = client.get('/api/calendar/events?start_date=2025-03-01&end_date=2025-03-31',
+                            headers=org.admin).json
+    assert {event['employee_name'] for event in events} == {'User'}
+    # Ни одного отдельного SELECT по employees после выборки событий
+    assert not any(statement.lstrip().upper().startswith('SELECT') and 'FROM employees' in statement
+                   and 'employee_presence' not in statement for statement in statements)
+
+
+def test_unchanged_poll_answers_304_without_fetching_rows(client, org, count_queries):
+    post_events(client, org.admin, meetings(org.user_id, 3))
+    url = '/api/calendar/events?start_date=2025-03-01&end_date=2025-03-31'
+    etag = client.get(url, headers=org.admin).headers['ETag']
+    with count_queries() as statements:
+        response = client.get(url, headers=dict(org.admin, **{'If-None-Match': etag}))
+    assert response.status_code == 304
+    assert not any('employee_presence' in statement for statement in statements)
+
+
+def test_unranged_etags_follow_every_write_without_a_shared_row(client, org):
+    urls = ['/api/events', '/api/calendar/events']
+    etags = [client.get(url, headers=org.admin).headers['ETag'] for url in urls]
+    # Запись в другой месяц меняет ETag выборок без диапазона, хотя их корзины не трогает
+    for month in ('2025-03-03', '2025-04-07', '2025-03-04'):
+        post_events(client, org.admin, [{'employee_id': org.user_id, 'event_type': 'meeting',
+                                         'start_date': month, 'end_date': month}])
+        for i, url in enumerate(urls):
+            response = client.get(url, headers=dict(org.admin, **{'If-None-Match': etags[i]}))
+            assert response.status_code == 200, (month, url)
+            etags[i] = response.headers['ETag']
+    # Каждая запись обновляет только строки своих месяцев
+    assert {bucket for (bucket,) in db.session.query(PresenceVersion.bucket)} == {'2025-03', '2025-04'}
+
+
+@pytest.mark.parametrize('url', [
+    '/api/calendar/events?start_date=2025-03-01&end_date=2025-03-31&team_id={team_id}',
+    '/api/availability?team_id={team_id}&start_date=2025-03-01&end_date=2025-03-31',
+])
+def test_ranged_presence_queries_bound_start_from_below(client, org, count_queries, url):
+    # Отсутствие началось задолго до окна: нижняя граница по началу не должна его потерять
+    post_events(client, org.admin, [{'employee_id': org.user_id, 'event_type': 'sick_leave',
+                                     'start_date': '2024-06-01', 'end_date': '2025-03-31'}])
+    with count_queries() as statements:
+        response = client.get(url.format(team_id=org.team_id), headers=org.admin)
+    assert response.status_code == 200
+    if 'availability' in url:
+        assert response.json['days'] == [] and response.json['members'] == 2
+    else:
+        assert [event['start_date'] for event in response.json] == ['2024-06-01']
+    ranged = [statement for statement in statements if 'end_datetime >=' in statement]
+    assert ranged and all('employee_presence.start_datetime >=' in statement for statement in ranged)
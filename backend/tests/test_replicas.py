@@ -0,0 +1,63 @@
+import pytest
+from flask import g
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import StaticPool
+
+from conftest import post_events
+from app import db
+from app.models import Employee
+from app.replicas import on_replica, replica_router
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    """Пустая реплика: пока она не догнала основную базу, в ней есть только схема."""
+    engine = create_engine('sqlite://', poolclass=StaticPool)
+    db.metadata.create_all(engine)
+    monkeypatch.setitem(db.engines, 'replica_test', engine)
+    replica_router.configure(binds=['replica_test'])
+    yield engine
+    replica_router.configure(binds=[])
+    db.session.remove()  # сессия может держать соединение реплики
+    engine.dispose()
+
+
+def test_get_bind_reads_from_replica_in_read_only_request(app, replica):
+    with app.test_request_context():
+        assert db.session.get_bind() is db.engine and not on_replica()
+        g.replica_bind = 'replica_test'
+        assert on_replica()
+        assert db.session.get_bind(mapper=Employee) is replica
+        # Явно переданная привязка важнее выбора реплики
+        assert db.session.get_bind(bind=db.engine) is db.engine
+    # Вне HTTP-запроса (воркер, CLI) - всегда основная база
+    assert db.session.get_bind(mapper=Employee) is db.engine
+
+
+def test_get_bind_writes_to_primary_while_flushing(app, replica):
+    binds = []
+
+    def after_flush(session, flush_context):
+        binds.append(session.get_bind(mapper=Employee))
+
+    with app.test_request_context():
+        g.replica_bind = 'replica_test'
+        session = db.session()
+        event.listen(session, 'after_flush', after_flush)
+        try:
+            session.add(Employee(full_name='New', email='new@example.com', password_hash='x'))
+            session.flush()
+        finally:
+            event.remove(session, 'after_flush', after_flush)
+            session.rollback()
+    assert binds == [db.engine]
+
+
+def test_read_only_routes_use_replica_until_own_write(client, org, replica):
+    event = {'employee_id': org.user_id, 'event_type': 'meeting', 'start_date': '2025-03-05', 'end_date': '2025-03-05'}
+    post_events(client, org.admin, [event])
+    # Реплика еще пуста; автор записи sticky_seconds читает с основной базы, остальные - с реплики
+    assert len(client.get('/api/events', headers=org.admin).json) == 1
+    assert client.get('/api/events', headers=org.user).json == []
+    replica_router.configure()  # отметки липкости истекли
+    assert client.get('/api/events', headers=org.admin).json == []
@@ -0,0 +1,101 @@
+from datetime import date
+
+import pytest
+
+from conftest import make_employee
+from app import db, schedule
+from app.cache import schedule_cache
+
+SCHEDULE = {
+    'weekly': {'mon': 'office', 'tue': 'remote', 'wed': 'office', 'thu': 'remote', 'fri': 'office'},
+    'exceptions': {'2025-03-06': 'office'},
+    'meetings': [{'title': 'Sync', 'days': ['mon'], 'every': 2, 'from': '2025-03-03', 'skip': ['2025-03-17']}],
+}
+
+
+def test_expand_follows_week_exceptions_and_meeting_rules():
+    occurrences = list(schedule.expand(schedule.parse_schedule(SCHEDULE), date(2025, 3, 3), date(2025, 3, 31)))
+    remote = [day.isoformat() for day, kind, _ in occurrences if kind == 'remote']
+    meetings = [day.isoformat() for day, kind, _ in occurrences if kind == 'meeting']
+    # 6 марта - исключение (офис)
+    assert remote[:3] == ['2025-03-04', '2025-03-11', '2025-03-13']
+    assert '2025-03-06' not in remote
+    # Раз в две недели с 3 марта, 17 марта пропущено
+    assert meetings == ['2025-03-03', '2025-03-31']
+
+
+@pytest.mark.parametrize('value', [
+    '{"weekly": {"mon": "home"}}',
+    {'meetings': [{'title': 'x', 'days': ['mon'], 'from': 'soon'}]},
+    {'meetings': [{'title': 'x', 'days': ['mon'], 'every': 0, 'from': '2025-01-01'}]},
+    '{not json',
+])
+def test_invalid_schedules_are_rejected(client, org, value):
+    response = client.put(f'/api/users/{org.user_id}', json={'work_schedule': value}, headers=org.admin)
+    assert response.status_code == 400
+    assert 'work_schedule' in response.json['msg']
+
+
+def test_free_text_schedule_is_kept_as_is(client, org):
+    response = client.put(f'/api/users/{org.user_id}', json={'work_schedule': 'пн-пт 9-18'}, headers=org.admin)
+    assert response.status_code == 200
+
+
+def test_calendar_includes_schedule_and_skips_absent_days(client, org):
+    assert client.put(f'/api/users/{org.user_id}', json={'work_schedule': SCHEDULE},
+                      headers=org.admin).status_code == 200
+    client.post('/api/events', json={'employee_id': org.user_id, 'event_type': 'day_off',
+                                     'start_date': '2025-03-11', 'end_date': '2025-03-11'}, headers=org.admin)
+    url = '/api/calendar/events?start_date=2025-03-01&end_date=2025-03-16&include_schedule=1'
+    events = client.get(url, headers=org.admin).json
+    scheduled = [(e['start_date'], e['presence_type']) for e in events if e['status'] == schedule.SCHEDULE_STATUS]
+    assert ('2025-03-04', 'remote') in scheduled
+    assert ('2025-03-03', 'meeting') in scheduled
+    assert ('2025-03-11', 'remote') not in scheduled
+    assert [e['start_date'] for e in events] == sorted(e['start_date'] for e in events)
+    # Без параметра вхождений нет
+    plain = client.get('/api/calendar/events?start_date=2025-03-01&end_date=2025-03-16', headers=org.admin).json
+    assert all(e['status'] != schedule.SCHEDULE_STATUS for e in plain)
+
+
+def test_schedule_change_changes_calendar_etag(client, org):
+    url = '/api/calendar/events?start_date=2025-03-01&end_date=2025-03-16&include_schedule=1'
+    etag = client.get(url, headers=org.admin).headers['ETag']
+    client.put(f'/api/users/{org.user_id}', json={'work_schedule': SCHEDULE}, headers=org.admin)
+    response = client.get(url, headers=dict(org.admin, **{'If-None-Match': etag}))
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_schedule_window_is_limited(client, org):
+    response = client.get('/api/calendar/events?start_date=2025-01-01&end_date=2026-06-01&include_schedule=1',
+                          headers=org.admin)
+    assert response.status_code == 400
+
+
+def test_schedule_is_clipped_to_employment(client, org):
+    text = schedule.dump_schedule(SCHEDULE)
+    make_employee('Hired', 'hired@example.com', work_schedule=text).hire_date = date(2025, 3, 10)
+    make_employee('Left', 'left@example.com', work_schedule=text, termination_date=date(2025, 3, 5))
+    db.session.commit()
+    events = client.get('/api/calendar/events?start_date=2025-03-01&end_date=2025-03-16&include_schedule=1',
+                        headers=org.admin).json
+    days = {name: {e['start_date'] for e in events if e['employee_name'] == name} for name in ('Hired', 'Left')}
+    assert min(days['Hired']) == '2025-03-11'  # 10 марта - офис без встречи
+    assert max(days['Left']) == '2025-03-04'
+
+
+def test_company_wide_window_does_not_evict_itself(client, org, monkeypatch):
+    schedule_cache.configure(maxsize=2)
+    for i in range(5):
+        week = dict(SCHEDULE, exceptions={f'2025-03-{10 + i}': 'off'})
+        make_employee(f'E{i}', f'e{i}@example.com', work_schedule=schedule.dump_schedule(week))
+    db.session.commit()
+    url = '/api/calendar/events?start_date=2025-03-01&end_date=2025-03-16&include_schedule=1'
+    first = client.get(url, headers=org.admin).json
+
+    expanded = []
+    original = schedule.expand
+    monkeypatch.setattr(schedule, 'expand', lambda *args: expanded.append(args) or original(*args))
+    assert client.get(url, headers=org.admin).json == first
+    assert expanded == [] and len(schedule_cache) == 1
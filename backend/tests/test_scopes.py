@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import make_employee, post_events
+from app import db
+from app.models import Department, EmployeeProject, Team
+
+URL = '/api/calendar/events?start_date=2025-03-01&end_date=2025-03-31'
+
+
+@pytest.fixture
+def staff(client, org):
+    """
+    Кроме admin (D1, T1) и user (D2, T1): extra - в T1 и D2 дополнительно, в проекте P1;
+    outsider - в чужой команде T2. У каждого по одной встрече в марте.
+    """
+    d1, d2 = org.department_ids
+    other_team = Team(name='T2')
+    db.session.add(other_team)
+    db.session.flush()
+    extra = make_employee('Extra', 'extra@example.com', main_department_id=d1)
+    extra.teams.append(db.session.get(Team, org.team_id))
+    extra.departments.append(db.session.get(Department, d2))
+    db.session.add(EmployeeProject(employee_id=extra.employee_id, project_id=org.project_id,
+                                   participation_percentage=50))
+    outsider = make_employee('Outsider', 'outsider@example.com', main_department_id=d2,
+                             main_team_id=other_team.team_id)
+    db.session.commit()
+    names = {org.admin_id: 'admin', org.user_id: 'user', extra.employee_id: 'extra', outsider.employee_id: 'outsider'}
+    post_events(client, org.admin, [
+        {'employee_id': employee_id, 'event_type': 'meeting', 'start_date': '2025-03-05', 'end_date': '2025-03-05'}
+        for employee_id in names])
+    return SimpleNamespace(names=names, other_team_id=other_team.team_id)
+
+
+def calendar_names(client, org, staff, query):
+    response = client.get(f'{URL}&{query}', headers=org.admin)
+    assert response.status_code == 200
+    return sorted(staff.names[event['employee_id']] for event in response.json)
+
+
+def test_team_filter_counts_main_and_additional_teams(client, org, staff):
+    assert calendar_names(client, org, staff, f'team_id={org.team_id}') == ['admin', 'extra', 'user']
+    assert calendar_names(client, org, staff, f'team_id={staff.other_team_id}') == ['outsider']
+
+
+def test_department_filter_counts_main_and_additional_departments(client, org, staff):
+    d1, d2 = org.department_ids
+    assert calendar_names(client, org, staff, f'department_id={d1}') == ['admin', 'extra']
+    assert calendar_names(client, org, staff, f'department_id={d2}') == ['extra', 'outsider', 'user']
+
+
+def test_project_filter_uses_participation(client, org, staff):
+    assert calendar_names(client, org, staff, f'project_id={org.project_id}') == ['extra']
+
+
+def test_filters_combine_as_intersection(client, org, staff):
+    d2 = org.department_ids[1]
+    assert calendar_names(client, org, staff, f'team_id={org.team_id}&department_id={d2}') == ['extra', 'user']
+    assert calendar_names(client, org, staff,
+                          f'team_id={org.team_id}&department_id={d2}&project_id={org.project_id}') == ['extra']
+    assert calendar_names(client, org, staff, f'team_id={staff.other_team_id}&project_id={org.project_id}') == []
+
+
+def test_unknown_or_invalid_scope(client, org, staff):
+    assert calendar_names(client, org, staff, 'team_id=999') == []
+    for query in ('team_id=x', 'department_id=1.5', 'project_id=[1]'):
+        assert client.get(f'{URL}&{query}', headers=org.admin).status_code == 400, query
@@ -0,0 +1,65 @@
+from datetime import datetime
+
+import pytest
+from flask import current_app, jsonify
+
+from conftest import make_employee
+from app import db
+from app.models import Employee, EmployeePresence
+from app.serializers import PRESENCE_ROW_COLUMNS, PresenceEncoder, fast_json_enabled
+
+
+@pytest.fixture
+def rows(org):
+    # Кириллица, кавычки, перевод строки и символ вне BMP - все экранируется в \uXXXX
+    other = make_employee('Зоя "Ёж"\n🦔', 'zoya@example.com')
+    start, end = datetime(2025, 3, 3), datetime(2025, 3, 4, 23, 59, 59)
+    db.session.add_all([
+        EmployeePresence(employee_id=employee_id, presence_type=presence_type, status=status, comment=comment,
+                         start_datetime=start, end_datetime=end)
+        for employee_id, presence_type, status, comment in (
+            (org.user_id, 'sick_leave', 'completed', 'Простуда'),  # приватное: маскируется чужим
+            (other.employee_id, 'day_off', 'planned', None),
+            (other.employee_id, 'meeting', 'approved', None),
+            (org.admin_id, 'business_trip', 'approved', 'Москва\t"офис"\\ 😀'),
+        )])
+    db.session.commit()
+    return db.session.query(*PRESENCE_ROW_COLUMNS) \
+        .join(Employee, Employee.employee_id == EmployeePresence.employee_id) \
+        .order_by(EmployeePresence.presence_id).all()
+
+
+@pytest.mark.parametrize('is_admin, viewer', [(True, 'admin'), (False, 'user'), (False, 'nobody')])
+def test_encode_list_matches_jsonify(org, rows, is_admin, viewer):
+    viewer_id = {'admin': str(org.admin_id), 'user': str(org.user_id), 'nobody': None}[viewer]
+    encoder = PresenceEncoder(is_viewer_admin=is_admin, viewer_id=viewer_id)
+    events = EmployeePresence.query.order_by(EmployeePresence.presence_id).all()
+
+    assert fast_json_enabled()
+    expected = jsonify([event.to_dict(is_viewer_admin=is_admin, viewer_id=viewer_id) for event in events])
+    assert encoder.encode_list(rows) == expected.get_data(as_text=True)
+    assert jsonify([encoder.as_dict(row) for row in rows]).get_data(as_text=True) == encoder.encode_list(rows)
+    assert encoder.encode_list([]) == jsonify([]).get_data(as_text=True)
+
+
+def test_masked_and_null_fields(org, rows):
+    body = current_app.json.loads(PresenceEncoder(viewer_id=str(org.user_id)).encode_list(rows))
+    assert [(e['presence_type'], e['comment']) for e in body] == [
+        ('sick_leave', 'Простуда'),  # свое событие видно как есть
+        ('absence', 'Сотрудник отсутствует'),
+        ('meeting', None),
+        ('business_trip', 'Москва\t"офис"\\ 😀'),
+    ]
+    assert body[1]['employee_name'] == 'Зоя "Ёж"\n🦔'
+
+
+def test_events_route_fast_path_matches_jsonify(app, client, org, rows):
+    fast = client.get('/api/events', headers=org.user)
+    app.json.compact = False  # отступы jsonify: быстрый путь отключается
+    try:
+        slow = client.get('/api/events', headers=org.user)
+    finally:
+        app.json.compact = None
+    assert fast.status_code == slow.status_code == 200
+    assert fast.json == slow.json
+    assert fast.get_data(as_text=True) == jsonify(slow.json).get_data(as_text=True)
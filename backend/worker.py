@@ -0,0 +1,46 @@
+import argparse
+import multiprocessing
+import os
+import signal
+
+from app import create_app
+
+
+def run_worker(poll_interval, once, stop):
+    """Один процесс пула: свое приложение и свои соединения с базой."""
+    # Остановку ведет родитель через stop, Ctrl+C не должен обрывать задачу на середине
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from app.jobs import job_queue
+
+    app = create_app()
+    with app.app_context():
+        job_queue.work(poll_interval=poll_interval, once=once, stop=stop)
+
+
+def main(processes, poll_interval, once):
+    stop = multiprocessing.Event()
+    pool = [multiprocessing.Process(target=run_worker, args=(poll_interval, once, stop), name=f"job-worker-{i}")
+            for i in range(processes)]
+    for process in pool:
+        process.start()
+    print(f"✅ Запущено воркеров: {processes}. Остановка - Ctrl+C (текущие задачи будут доделаны).")
+
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        for process in pool:
+            process.join()
+    except KeyboardInterrupt:
+        print("Останавливаем воркеры...")
+        stop.set()
+        for process in pool:
+            process.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пул процессов, выполняющих фоновые задачи из таблицы jobs.")
+    parser.add_argument('--processes', type=int, default=int(os.environ.get('JOB_WORKERS', 0)) or os.cpu_count() or 1,
+                        help="число процессов (по умолчанию JOB_WORKERS или число CPU)")
+    parser.add_argument('--poll-interval', type=float, default=1.0, help="пауза в секундах при пустой очереди")
+    parser.add_argument('--once', action='store_true', help="выполнить накопившиеся задачи и выйти")
+    args = parser.parse_args()
+    main(args.processes, args.poll_interval, args.once)